@@ -8,13 +8,19 @@ from fastapi import APIRouter
 
 from api.v1.auth import router as auth_router
 from api.v1.chatbot import router as chatbot_router
+from api.v1.profiling import router as profiling_router
+from api.v1.sessions import router as sessions_router
+from core.config import settings
 from core.logging import logger
 
 api_router = APIRouter()
 
 # Include routers
 api_router.include_router(auth_router, prefix="/auth", tags=["auth"])
+api_router.include_router(sessions_router, prefix="/auth", tags=["auth"])
 api_router.include_router(chatbot_router, prefix="/chatbot", tags=["chatbot"])
+if settings.PROFILING_ENABLED:
+    api_router.include_router(profiling_router, prefix="/profiling", tags=["profiling"])
 
 
 @api_router.get("/health")
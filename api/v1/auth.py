@@ -1,22 +1,25 @@
 import uuid
 
-from fastapi import APIRouter, Depends, Form, Request
+from fastapi import APIRouter, Depends, Form, Request, Response
 from fastapi.exceptions import HTTPException
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
 from core.config import settings
 from core.limiter import limiter
 from core.logging import logger
+from core.timing import timed
 from models.session import Session
 from models.user import User
-from schemas.auth import SessionResponse, TokenResponse, UserCreate, UserResponse
+from schemas.auth import SessionResponse, TokenKind, TokenResponse, UserCreate, UserResponse
 from services.database import DatabaseService
+from services.token_revocation import TokenRevocationSet
 from utils.auth import create_access_token, verify_token
 from utils.sanitization import sanitize_string
 
 router = APIRouter()
 security = HTTPBearer()
 db_service = DatabaseService()
+token_revocations = TokenRevocationSet(db_service, settings.JWT_REVOCATION_REFRESH_SECONDS)
 
 
 @router.post("/register", response_model=UserResponse)
@@ -27,7 +30,7 @@ async def register_user(request: Request, user_data: UserCreate):
         user = await db_service.create_user(
             email=user_data.email, password=User.hash_password(password)
         )
-        token = create_access_token(str(user.id))
+        token = create_access_token(TokenKind.USER, user.id)
         return UserResponse(id=user.id, email=user.email, token=token)
 
     except ValueError as ve:
@@ -42,18 +45,27 @@ async def get_current_user(
 ):
     try:
         token = sanitize_string(credentials.credentials)
-        user_id = verify_token(token)
-        if user_id is None:
+        with timed("verify_token"):
+            claims = verify_token(token)
+        if claims is None or claims.kind == TokenKind.SESSION:
             logger.error("invalid_token", token_part=token[:10] + "...")
             raise HTTPException(
                 status_code=401,
                 detail="Invalid authentication credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        if token_revocations.is_revoked(claims):
+            logger.warning("token_revoked", user_id=claims.user_id)
+            raise HTTPException(
+                status_code=401,
+                detail="Token has been revoked",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
 
         # Verify user exists in database
-        user_id_int = int(user_id)
-        user = await db_service.get_user(user_id_int)
+        user_id_int = claims.user_id if claims.user_id is not None else int(claims.subject)
+        with timed("db"):
+            user = await db_service.get_user(user_id_int)
         if user is None:
             logger.error("user_not_found", user_id=user_id_int)
             raise HTTPException(
@@ -61,6 +73,13 @@ async def get_current_user(
                 detail="User not found",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        if claims.user_id is None and token_revocations.is_revoked(claims, user_id=user.id):
+            logger.warning("token_revoked", user_id=user.id, legacy=True)
+            raise HTTPException(
+                status_code=401,
+                detail="Token has been revoked",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
         return user
     except ValueError as ve:
         logger.error("token_validation_failed", error=str(ve), exc_info=True)
@@ -76,7 +95,12 @@ async def create_session(user: User = Depends(get_current_user)):
     try:
         session_id = str(uuid.uuid4())
         session = await db_service.create_session(session_id, user.id)
-        token = create_access_token(session_id)
+        token = create_access_token(
+            TokenKind.SESSION,
+            user.id,
+            session_id=session_id,
+            generation=await token_revocations.generation(user.id),
+        )
 
         logger.info(
             "session_created",
@@ -124,7 +148,7 @@ async def login(
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        token = create_access_token(str(user.id))
+        token = create_access_token(TokenKind.USER, user.id, generation=await token_revocations.generation(user.id))
         return TokenResponse(
             access_token=token.access_token,
             token_type="bearer",
@@ -135,27 +159,56 @@ async def login(
         raise HTTPException(status_code=422, detail=str(ve))
 
 
+@router.post("/logout", status_code=204)
+async def logout(user: User = Depends(get_current_user)):
+    """Revoke every token issued to the user, including the tokens of their sessions."""
+    await token_revocations.revoke_user(user.id)
+    return Response(status_code=204)
+
+
 async def get_current_session(
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ) -> Session:
     try:
         token = sanitize_string(credentials.credentials)
-        session_id = verify_token(token)
-        if session_id is None:
+        with timed("verify_token"):
+            claims = verify_token(token)
+        if claims is None or claims.kind == TokenKind.USER:
             logger.error("session_id_not_found", token_part=token[:10] + "...")
             raise HTTPException(
                 status_code=401,
                 detail="Invalid authentication credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        session = await db_service.get_session(session_id)
+        if token_revocations.is_revoked(claims):
+            logger.warning("token_revoked", user_id=claims.user_id, session_id=claims.session_id)
+            raise HTTPException(
+                status_code=401,
+                detail="Token has been revoked",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        if claims.kind == TokenKind.SESSION:
+            # The claims are signed and checked against the revocations, no need to read the session
+            return Session(id=claims.session_id, user_id=claims.user_id)
+
+        # Tokens issued before the typed claims only name the session
+        with timed("db"):
+            session = await db_service.get_session(claims.subject)
         if session is None:
-            logger.error("session_not_found", session_id=session_id)
+            logger.error("session_not_found", session_id=claims.subject)
             raise HTTPException(
                 status_code=404,
                 detail="Session not found",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        # Without a user claim the token could only be checked against the revocations of its session
+        if token_revocations.is_revoked(claims, user_id=session.user_id):
+            logger.warning("token_revoked", user_id=session.user_id, session_id=session.id, legacy=True)
+            raise HTTPException(
+                status_code=401,
+                detail="Token has been revoked",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
 
         return session
     except ValueError as ve:
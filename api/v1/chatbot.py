@@ -1,14 +1,57 @@
-from fastapi import APIRouter, Depends, Request
+from typing import (
+    AsyncIterator,
+    Optional,
+)
+
+from fastapi import APIRouter, Depends, Query, Request
 from fastapi.exceptions import HTTPException
+from fastapi.responses import (
+    Response,
+    StreamingResponse,
+)
 
-from api.v1.auth import get_current_session
-from core.langgraph.graph import LangGraphAgent
+from api.v1.auth import db_service, get_current_session
+from core.concurrency import (
+    OverloadedError,
+    chat_concurrency_limiter,
+    concurrency_slot,
+)
+from core.config import settings
+from core.deadline import (
+    DeadlineExceededError,
+    create_deadline,
+)
+from core.disconnect import (
+    ClientDisconnectedError,
+    cancel_on_disconnect,
+)
+from core.langgraph.graph import (
+    CheckpointConflictError,
+    CheckpointerUnavailableError,
+    LangGraphAgent,
+)
+from core.langgraph.run_lock import RunLockTimeoutError
+from core.limiter import limiter
 from core.logging import logger
+from core.metrics import stream_events_total
+from models.run import Run
 from models.session import Session
-from schemas.chat import ChatRequest, ChatResponse
+from schemas.chat import (
+    ChatRequest,
+    ChatResponse,
+    RunRequest,
+    RunResponse,
+    StreamEvent,
+    ToolOutputResponse,
+)
+from services.run_queue import (
+    RunQueueFullError,
+    create_run_queue,
+)
 
 router = APIRouter()
 agent = LangGraphAgent()
+run_queue = create_run_queue(agent, db_service)
 
 
 @router.post("/chat", response_model=ChatResponse)
@@ -17,22 +60,217 @@ async def chat(
     chat_request: ChatRequest,
     session: Session = Depends(get_current_session),
 ):
+    # The budget of the turn starts with the request, waiting for a slot included
+    deadline = create_deadline(settings.CHAT_DEADLINE_SECONDS)
     try:
         logger.info(
             "chat_request_received",
             session_id=session.id,
             message_count=len(chat_request.messages),
+            mode=chat_request.mode,
         )
 
-        result = await agent.get_response(
-            chat_request.messages, session.id, user_id=session.user_id
-        )
+        async def run_turn() -> tuple[list, Optional[str]]:
+            async with concurrency_slot(chat_concurrency_limiter):
+                if chat_request.mode == "delta":
+                    return await agent.get_delta_response(
+                        chat_request.messages,
+                        session.id,
+                        user_id=session.user_id,
+                        expected_checkpoint_id=chat_request.expected_checkpoint_id,
+                        model_tier=chat_request.model_tier,
+                        deadline=deadline,
+                    )
+                return await agent.get_response(
+                    chat_request.messages,
+                    session.id,
+                    user_id=session.user_id,
+                    model_tier=chat_request.model_tier,
+                    deadline=deadline,
+                )
+
+        # Nobody would read the answer of a client that hung up
+        result, checkpoint_id = await cancel_on_disconnect(request, run_turn(), endpoint="chat")
 
         logger.info("chat_request_processed", session_id=session.id)
 
-        return ChatResponse(messages=result)
+        # Returning the model would validate the messages again, they are
+        # built by the agent and serialized as they are
+        return Response(
+            ChatResponse(messages=result, checkpoint_id=checkpoint_id).model_dump_json(),
+            media_type="application/json",
+        )
+    except ClientDisconnectedError as e:
+        logger.info("chat_request_abandoned", session_id=session.id)
+        raise HTTPException(status_code=499, detail=str(e))
+    except OverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except CheckpointerUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except CheckpointConflictError as e:
+        logger.warning(
+            "chat_request_conflict",
+            session_id=session.id,
+            expected_checkpoint_id=e.expected_checkpoint_id,
+            current_checkpoint_id=e.current_checkpoint_id,
+        )
+        raise HTTPException(
+            status_code=409,
+            detail={"message": str(e), "checkpoint_id": e.current_checkpoint_id},
+        )
+    except RunLockTimeoutError as e:
+        logger.warning("chat_request_session_busy", session_id=session.id, timeout=e.timeout)
+        raise HTTPException(status_code=409, detail="Another request on this session is still running")
+    except DeadlineExceededError as e:
+        logger.warning("chat_request_deadline_exceeded", session_id=session.id, budget=e.budget)
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(
             "chat_request_failed", session_id=session.id, error=str(e), exc_info=True
         )
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _sse(event: StreamEvent) -> str:
+    """Serialize an event of a streamed turn as a server-sent event."""
+    stream_events_total.labels(type=event.type).inc()
+    return f"event: {event.type}\ndata: {event.model_dump_json(exclude_none=True)}\n\n"
+
+
+@router.post("/chat/stream")
+@limiter.limit(settings.RATE_LIMIT_ENDPOINTS["chat_stream"][0])
+async def chat_stream(
+    request: Request,
+    chat_request: ChatRequest,
+    session: Session = Depends(get_current_session),
+):
+    """Stream the answer of a turn as server-sent events.
+
+    The answer arrives in "text" frames, tool calls as "tool_start" and
+    "tool_end" events, and the stream ends with "done", or "error" if the turn
+    failed once streaming.
+
+    Returns:
+        StreamingResponse: The events of the turn.
+    """
+    if chat_request.mode != "full":
+        raise HTTPException(status_code=422, detail="Streamed turns only support the full mode")
+    deadline = create_deadline(settings.CHAT_DEADLINE_SECONDS)
+    logger.info("chat_stream_request_received", session_id=session.id, message_count=len(chat_request.messages))
+    events = agent.get_stream_response(
+        chat_request.messages,
+        session.id,
+        user_id=session.user_id,
+        model_tier=chat_request.model_tier,
+        deadline=deadline,
+    )
+    # Errors up to the first event, like a full concurrency queue, still get their status code
+    try:
+        first_event = await anext(events)
+    except OverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except CheckpointerUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except RunLockTimeoutError as e:
+        logger.warning("chat_request_session_busy", session_id=session.id, timeout=e.timeout)
+        raise HTTPException(status_code=409, detail="Another request on this session is still running")
+    except DeadlineExceededError as e:
+        logger.warning("chat_request_deadline_exceeded", session_id=session.id, budget=e.budget)
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error("chat_stream_request_failed", session_id=session.id, error=str(e), exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream() -> AsyncIterator[str]:
+        yield _sse(first_event)
+        try:
+            async for event in events:
+                yield _sse(event)
+            logger.info("chat_stream_request_processed", session_id=session.id)
+        except Exception as e:
+            logger.error("chat_stream_request_failed", session_id=session.id, error=str(e), exc_info=True)
+            yield _sse(StreamEvent(type="error", content=str(e)))
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/tool-outputs/{tool_call_id}", response_model=ToolOutputResponse)
+async def get_tool_output(
+    tool_call_id: str,
+    session: Session = Depends(get_current_session),
+):
+    """Get the output of a tool call of the session, in full and as sent to the model.
+
+    Returns:
+        ToolOutputResponse: The output of the tool call.
+    """
+    message = await agent.get_tool_output(session.id, tool_call_id)
+    if message is None:
+        raise HTTPException(status_code=404, detail="Tool call not found")
+    return ToolOutputResponse(
+        tool_call_id=message.tool_call_id,
+        tool=message.name,
+        status=message.status,
+        content=message.text(),
+        output=message.artifact,
+    )
+
+
+def _run_response(run: Run) -> RunResponse:
+    """Build the response describing a run."""
+    return RunResponse(
+        run_id=run.id,
+        session_id=run.session_id,
+        status=run.status.value,
+        messages=run.result_messages,
+        checkpoint_id=run.checkpoint_id,
+        error=run.error,
+        created_at=run.created_at,
+        updated_at=run.updated_at,
+    )
+
+
+@router.post("/runs", response_model=RunResponse, status_code=202)
+async def create_run(
+    request: Request,
+    run_request: RunRequest,
+    session: Session = Depends(get_current_session),
+):
+    """Submit a turn to run in the background, appended to the session's conversation.
+
+    Returns:
+        RunResponse: The queued run, to poll with `GET /runs/{run_id}`.
+    """
+    try:
+        run = await run_queue.submit(
+            run_request.messages,
+            session.id,
+            session.user_id,
+            model_tier=run_request.model_tier,
+        )
+    except RunQueueFullError as e:
+        logger.warning("run_queue_full", session_id=session.id)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    logger.info("run_submitted", run_id=run.id, session_id=session.id, message_count=len(run_request.messages))
+    return _run_response(run)
+
+
+@router.get("/runs/{run_id}", response_model=RunResponse)
+async def get_run(
+    run_id: str,
+    wait: float = Query(default=0, ge=0, le=30, description="Seconds to wait for the run to finish"),
+    session: Session = Depends(get_current_session),
+):
+    """Get a run of the session, waiting up to `wait` seconds for it to finish.
+
+    Returns:
+        RunResponse: The run, with the messages it produced once succeeded.
+    """
+    run = await db_service.get_run(run_id)
+    if run is None or run.session_id != session.id:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if not run.finished and wait > 0:
+        run = await run_queue.wait(run_id, wait) or run
+    return _run_response(run)
@@ -0,0 +1,87 @@
+"""Profiling endpoints for the API.
+
+This module captures CPU and allocation profiles of the worker serving the
+request. It is only mounted when profiling is enabled, and every endpoint is
+restricted to the users listed in PROFILING_ADMIN_EMAILS.
+"""
+
+import asyncio
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.exceptions import HTTPException
+from fastapi.responses import PlainTextResponse
+
+from api.v1.auth import get_current_user
+from core.config import settings
+from core.logging import logger
+from core.profiling import CpuProfiler, allocation_diff
+from models.user import User
+from schemas.profiling import AllocationDiffResponse
+
+router = APIRouter()
+
+# Overlapping profiles would sample each other
+_profile_lock = asyncio.Lock()
+
+
+async def get_profiling_admin(user: User = Depends(get_current_user)) -> User:
+    """Only let the users allowed to profile through.
+
+    Args:
+        user: The authenticated user.
+
+    Returns:
+        User: The user, if allowed to profile.
+
+    Raises:
+        HTTPException: If the user is not a profiling admin.
+    """
+    if user.email not in settings.PROFILING_ADMIN_EMAILS:
+        logger.warning("profiling_access_denied", user_id=user.id)
+        raise HTTPException(status_code=403, detail="Not allowed to profile")
+    return user
+
+
+@router.post("/cpu", response_class=PlainTextResponse)
+async def cpu_profile(
+    duration: float = Query(default=10.0, gt=0),
+    interval: float = Query(default=0.005, ge=0.001, le=1.0),
+    user: User = Depends(get_profiling_admin),
+):
+    """Sample the stacks of all threads of this worker for `duration` seconds.
+
+    Returns:
+        PlainTextResponse: Collapsed stacks, one `frame;frame;... count` line per
+            stack, ready for flamegraph.pl or speedscope.
+    """
+    duration = min(duration, settings.PROFILING_MAX_DURATION)
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with _profile_lock:
+        logger.info("cpu_profile_started", user_id=user.id, duration=duration, interval=interval)
+        profiler = CpuProfiler(interval)
+        collapsed = await profiler.run(duration)
+        logger.info("cpu_profile_finished", user_id=user.id, samples=profiler.sample_count)
+    return PlainTextResponse(collapsed)
+
+
+@router.post("/memory", response_model=AllocationDiffResponse)
+async def memory_profile(
+    duration: float = Query(default=10.0, gt=0),
+    limit: int = Query(default=50, ge=1, le=1000),
+    frames: int = Query(default=10, ge=1, le=100),
+    user: User = Depends(get_profiling_admin),
+):
+    """Diff the tracemalloc snapshots taken before and after `duration` seconds.
+
+    Returns:
+        AllocationDiffResponse: The allocation sites that grew the most.
+    """
+    duration = min(duration, settings.PROFILING_MAX_DURATION)
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with _profile_lock:
+        logger.info("memory_profile_started", user_id=user.id, duration=duration)
+        result = await allocation_diff(duration, limit, frames)
+        logger.info("memory_profile_finished", user_id=user.id, size_diff_bytes=result["size_diff_bytes"])
+    return AllocationDiffResponse(**result)
@@ -0,0 +1,98 @@
+"""Session management endpoints for the API.
+
+This module lists the chat sessions of the authenticated user and deletes them
+in bulk with their chat history. It is mounted next to the authentication
+endpoints, under /auth.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+from typing import (
+    Optional,
+    Tuple,
+)
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.exceptions import HTTPException
+
+from api.v1.auth import (
+    db_service,
+    get_current_user,
+    token_revocations,
+)
+from api.v1.chatbot import agent
+from core.logging import logger
+from models.user import User
+from schemas.auth import (
+    SessionDeleteRequest,
+    SessionDeleteResponse,
+    SessionListResponse,
+    SessionSummary,
+)
+
+router = APIRouter()
+
+
+def _encode_cursor(created_at: datetime, session_id: str) -> str:
+    """Encode the position of a session in the list as an opaque cursor."""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{session_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decode a cursor into the creation time and ID of a session.
+
+    Raises:
+        ValueError: If the cursor was not returned by the list endpoint.
+    """
+    try:
+        created_at, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), session_id
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError("Malformed cursor") from e
+
+
+@router.get("/sessions", response_model=SessionListResponse)
+async def list_sessions(
+    cursor: Optional[str] = Query(default=None, description="The next_cursor of the previous page"),
+    limit: int = Query(default=50, ge=1, le=200, description="The maximum number of sessions"),
+    user: User = Depends(get_current_user),
+):
+    """List the sessions of the user, newest first."""
+    try:
+        after = _decode_cursor(cursor) if cursor is not None else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
+    sessions = await db_service.list_sessions(user.id, limit, after=after)
+    next_cursor = None
+    if len(sessions) == limit:
+        last = sessions[-1]
+        next_cursor = _encode_cursor(last.created_at, last.id)
+    return SessionListResponse(
+        sessions=[
+            SessionSummary(session_id=session.id, name=session.name, created_at=session.created_at)
+            for session in sessions
+        ],
+        next_cursor=next_cursor,
+    )
+
+
+@router.delete("/sessions", response_model=SessionDeleteResponse)
+async def delete_sessions(
+    delete_request: SessionDeleteRequest,
+    user: User = Depends(get_current_user),
+):
+    """Delete sessions of the user with their chat history, and revoke their tokens.
+
+    Sessions that do not exist or belong to another user are skipped.
+    """
+    deleted = await agent.delete_sessions(db_service, user.id, delete_request.session_ids)
+    await token_revocations.revoke_sessions(user.id, deleted)
+    logger.info(
+        "sessions_delete_requested",
+        user_id=user.id,
+        requested=len(delete_request.session_ids),
+        deleted=len(deleted),
+    )
+    return SessionDeleteResponse(deleted=deleted)
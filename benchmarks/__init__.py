@@ -0,0 +1,4 @@
+"""Benchmarks for the application.
+
+Each module is runnable on its own, e.g. `python -m benchmarks.checkpointer`.
+"""
@@ -0,0 +1,202 @@
+"""This file contains a minimal in-process ASGI client for load testing.
+
+Unlike a buffering test client, it timestamps the first body chunk of every
+response, so time to first token can be measured on streaming endpoints.
+"""
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+)
+from urllib.parse import urlencode
+
+
+@dataclass
+class Response:
+    """Outcome of a single request.
+
+    Attributes:
+        status: HTTP status code, 0 if the application raised.
+        body: The full response body.
+        ttfb: Seconds until the first non-empty body chunk.
+        elapsed: Seconds until the response completed.
+        headers: Response headers, lower-cased.
+    """
+
+    status: int
+    body: bytes
+    ttfb: float
+    elapsed: float
+    headers: Dict[str, str]
+
+    def json(self) -> Any:
+        """Decode the body as JSON."""
+        return json.loads(self.body)
+
+
+class AsgiClient:
+    """Drive an ASGI application in-process, including its lifespan."""
+
+    def __init__(self, app: Any):
+        """Initialize the client.
+
+        Args:
+            app: The ASGI application to drive.
+        """
+        self.app = app
+        self._lifespan_task: Optional[asyncio.Task] = None
+        self._lifespan_receive: asyncio.Queue = asyncio.Queue()
+        self._lifespan_send: asyncio.Queue = asyncio.Queue()
+
+    async def __aenter__(self) -> "AsgiClient":
+        """Run the application startup."""
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._lifespan_task = asyncio.create_task(
+            self.app(scope, self._lifespan_receive.get, self._lifespan_send.put)
+        )
+        await self._lifespan_receive.put({"type": "lifespan.startup"})
+        message = await self._lifespan_send.get()
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"Application startup failed: {message}")
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        """Run the application shutdown."""
+        await self._lifespan_receive.put({"type": "lifespan.shutdown"})
+        await self._lifespan_send.get()
+        await self._lifespan_task
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        headers: Optional[Dict[str, str]] = None,
+        json_body: Any = None,
+        form: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        """Send one request to the application.
+
+        Args:
+            method: The HTTP method.
+            path: The request path, optionally with a query string.
+            headers: Extra request headers.
+            json_body: Body to send as JSON.
+            form: Body to send as a url-encoded form.
+
+        Returns:
+            Response: The response with its timings.
+        """
+        request_headers = {"host": "testserver", **(headers or {})}
+        body = b""
+        if json_body is not None:
+            body = json.dumps(json_body).encode("utf-8")
+            request_headers["content-type"] = "application/json"
+        elif form is not None:
+            body = urlencode(form).encode("utf-8")
+            request_headers["content-type"] = "application/x-www-form-urlencoded"
+        request_headers["content-length"] = str(len(body))
+
+        path, _, query_string = path.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode("utf-8"),
+            "query_string": query_string.encode("latin-1"),
+            "root_path": "",
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in request_headers.items()],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+            "state": {},
+        }
+
+        request_sent = False
+        response_complete = asyncio.Event()
+        status = 0
+        response_headers: Dict[str, str] = {}
+        chunks: List[bytes] = []
+        first_chunk_at: Optional[float] = None
+
+        async def receive() -> dict:
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await response_complete.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: dict) -> None:
+            nonlocal status, first_chunk_at
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers.update(
+                    (k.decode("latin-1").lower(), v.decode("latin-1")) for k, v in message.get("headers", [])
+                )
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                if chunk and first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                chunks.append(chunk)
+                if not message.get("more_body", False):
+                    response_complete.set()
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            response_complete.set()
+        end = time.perf_counter()
+        return Response(
+            status=status,
+            body=b"".join(chunks),
+            ttfb=(first_chunk_at or end) - start,
+            elapsed=end - start,
+            headers=response_headers,
+        )
+
+
+class LoopLagProbe:
+    """Measure event loop lag as the overshoot of a periodic sleep."""
+
+    def __init__(self, interval: float = 0.01):
+        """Initialize the probe.
+
+        Args:
+            interval: Seconds between samples.
+        """
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self) -> None:
+        """Start sampling, discarding previous samples."""
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> List[float]:
+        """Stop sampling and return the samples."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        return self.samples
@@ -0,0 +1,158 @@
+"""Benchmark put/get latency of the checkpointer backends.
+
+Each iteration simulates one chat turn on a thread: load the latest checkpoint,
+then store a new one with two more messages. Threads are pre-filled with the
+requested history length so the cost of large conversations is visible.
+
+Usage:
+    python -m benchmarks.checkpointer --backends memory sqlite --history 10 100 1000
+    python -m benchmarks.checkpointer --backends postgres --no-cache
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import UTC, datetime
+from typing import Dict, List, Optional
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage  # noqa: E402
+from langgraph.checkpoint.base import (  # noqa: E402
+    BaseCheckpointSaver,
+    Checkpoint,
+    copy_checkpoint,
+    empty_checkpoint,
+)
+from langgraph.checkpoint.base.id import uuid6  # noqa: E402
+from psycopg_pool import AsyncConnectionPool  # noqa: E402
+
+from benchmarks.stats import format_table, summarize  # noqa: E402
+from core.config import CheckpointerBackend, settings  # noqa: E402
+from core.langgraph.checkpoint_cache import CachedCheckpointSaver  # noqa: E402
+from core.langgraph.checkpointer import close_checkpointer, create_checkpointer  # noqa: E402
+
+
+def make_turn(index: int, content_size: int) -> List[BaseMessage]:
+    """Build a user/assistant message pair of roughly the given content size."""
+    filler = ("lorem ipsum dolor sit amet " * (content_size // 27 + 1))[:content_size]
+    return [
+        HumanMessage(content=f"question {index} {filler}", id=str(uuid6())),
+        AIMessage(content=f"answer {index} {filler}", id=str(uuid6())),
+    ]
+
+
+def next_checkpoint(
+    saver: BaseCheckpointSaver, previous: Optional[Checkpoint], messages: List[BaseMessage], step: int
+) -> tuple[Checkpoint, Dict[str, str]]:
+    """Build the checkpoint following `previous` with the given messages channel."""
+    checkpoint = copy_checkpoint(previous) if previous else empty_checkpoint()
+    version = saver.get_next_version(checkpoint["channel_versions"].get("messages"), None)
+    checkpoint["id"] = str(uuid6(clock_seq=step))
+    checkpoint["ts"] = datetime.now(UTC).isoformat()
+    checkpoint["channel_values"]["messages"] = messages
+    checkpoint["channel_versions"]["messages"] = version
+    return checkpoint, {"messages": version}
+
+
+async def run_backend(
+    saver: BaseCheckpointSaver, history: int, iterations: int, content_size: int
+) -> Dict[str, Dict[str, float]]:
+    """Run the turn loop on a fresh thread and return get/put latency summaries."""
+    thread_id = f"bench-{uuid6()}"
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    metadata = {"source": "loop", "step": 0, "writes": None, "parents": {}}
+
+    messages: List[BaseMessage] = []
+    for i in range(history // 2):
+        messages.extend(make_turn(i, content_size))
+    checkpoint, new_versions = next_checkpoint(saver, None, messages, 0)
+    put_config = await saver.aput(config, checkpoint, metadata, new_versions)
+
+    get_samples, put_samples = [], []
+    for step in range(1, iterations + 1):
+        start = time.perf_counter()
+        checkpoint_tuple = await saver.aget_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}})
+        get_samples.append(time.perf_counter() - start)
+
+        messages = list(checkpoint_tuple.checkpoint["channel_values"]["messages"])
+        messages.extend(make_turn(history + step, content_size))
+        checkpoint, new_versions = next_checkpoint(saver, checkpoint_tuple.checkpoint, messages, step)
+
+        start = time.perf_counter()
+        put_config = await saver.aput(put_config, checkpoint, {**metadata, "step": step}, new_versions)
+        put_samples.append(time.perf_counter() - start)
+
+    await saver.adelete_thread(thread_id)
+    return {"get": summarize(get_samples), "put": summarize(put_samples)}
+
+
+async def open_saver(
+    backend: CheckpointerBackend, workdir: str
+) -> tuple[BaseCheckpointSaver, Optional[AsyncConnectionPool]]:
+    """Create a checkpointer for the backend, returning it with its Postgres pool if any."""
+    if backend == CheckpointerBackend.POSTGRES:
+        pool = AsyncConnectionPool(
+            settings.POSTGRES_URL,
+            open=False,
+            max_size=settings.POSTGRES_POOL_SIZE,
+            kwargs={"autocommit": True, "connect_timeout": 5, "prepare_threshold": None},
+        )
+        await pool.open()
+        return await create_checkpointer(backend, pool), pool
+    if backend == CheckpointerBackend.SQLITE:
+        settings.SQLITE_CHECKPOINT_PATH = os.path.join(workdir, "checkpoints.sqlite")
+    return await create_checkpointer(backend), None
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Run the benchmark for every requested backend and history length."""
+    settings.CHECKPOINT_CACHE_ENABLED = not args.no_cache
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for backend_name in args.backends:
+            backend = CheckpointerBackend(backend_name)
+            saver, pool = await open_saver(backend, workdir)
+            try:
+                for history in args.history:
+                    result = await run_backend(saver, history, args.iterations, args.content_size)
+                    for operation, summary in result.items():
+                        rows.append(
+                            {
+                                "backend": backend.value,
+                                "cached": isinstance(saver.saver, CachedCheckpointSaver),
+                                "history": history,
+                                "op": operation,
+                                **summary,
+                            }
+                        )
+            finally:
+                await close_checkpointer(saver)
+                if pool is not None:
+                    await pool.close()
+
+    print(json.dumps(rows, indent=2) if args.json else format_table(rows))
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=[CheckpointerBackend.MEMORY.value, CheckpointerBackend.SQLITE.value],
+        choices=[b.value for b in CheckpointerBackend],
+    )
+    parser.add_argument("--history", nargs="+", type=int, default=[10, 100, 1000])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--content-size", type=int, default=400, help="Characters per message")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the hot-thread checkpoint cache")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,208 @@
+"""This file contains deterministic stand-ins for the LLM and the search tool.
+
+The fakes reproduce the timing shape of the real dependencies (time to first
+token, token rate, tool latency) without any network access, so load tests
+measure the application rather than the provider.
+"""
+
+import asyncio
+import time
+import zlib
+from typing import (
+    Any,
+    AsyncIterator,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Type,
+)
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+    CallbackManagerForToolRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+)
+from langchain_core.outputs import (
+    ChatGeneration,
+    ChatGenerationChunk,
+    ChatResult,
+)
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+WORDS = "the quick brown fox jumps over the lazy dog while the agent answers".split()
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model answering with canned text at a configurable speed.
+
+    A deterministic fraction of user turns (`tool_call_rate`) is answered with a
+    call to the search tool first, so the chat <-> tool_call loop is exercised.
+    """
+
+    model_name: str = "fake-chat-model"
+    first_token_latency: float = 0.2
+    tokens_per_second: float = 50.0
+    reply_tokens: int = 40
+    tool_call_rate: float = 0.0
+    tool_name: str = "duckduckgo_results_json"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "FakeChatModel":
+        """Tools are not sent anywhere, the fake decides on tool calls by itself."""
+        return self
+
+    def get_num_tokens_from_messages(self, messages: List[BaseMessage], tools: Optional[Sequence] = None) -> int:
+        """Approximate token count (4 characters per token), cheap and deterministic."""
+        return sum(len(str(message.content)) // 4 + 4 for message in messages)
+
+    def _should_call_tool(self, messages: List[BaseMessage]) -> Optional[str]:
+        """Return the search query if this turn should call the tool."""
+        last = messages[-1] if messages else None
+        if not isinstance(last, HumanMessage) or self.tool_call_rate <= 0:
+            return None
+        content = str(last.content)
+        if zlib.crc32(content.encode("utf-8")) % 1000 < self.tool_call_rate * 1000:
+            return content[:80]
+        return None
+
+    def _reply_tokens(self, messages: List[BaseMessage]) -> List[str]:
+        seed = len(messages)
+        return [WORDS[(seed + i) % len(WORDS)] + " " for i in range(self.reply_tokens)]
+
+    def _tool_call_message(self, query: str, messages: List[BaseMessage]) -> AIMessage:
+        return AIMessage(
+            content="",
+            tool_calls=[{"name": self.tool_name, "args": {"query": query}, "id": f"call_{len(messages)}"}],
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        query = self._should_call_tool(messages)
+        time.sleep(self.first_token_latency)
+        if query is not None:
+            return ChatResult(generations=[ChatGeneration(message=self._tool_call_message(query, messages))])
+        tokens = self._reply_tokens(messages)
+        time.sleep(len(tokens) / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens).strip()))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        query = self._should_call_tool(messages)
+        await asyncio.sleep(self.first_token_latency)
+        if query is not None:
+            return ChatResult(generations=[ChatGeneration(message=self._tool_call_message(query, messages))])
+        tokens = self._reply_tokens(messages)
+        await asyncio.sleep(len(tokens) / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens).strip()))])
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        query = self._should_call_tool(messages)
+        await asyncio.sleep(self.first_token_latency)
+        if query is not None:
+            tool_call = self._tool_call_message(query, messages).tool_calls[0]
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(
+                    content="",
+                    tool_call_chunks=[
+                        {
+                            "name": tool_call["name"],
+                            "args": f'{{"query": "{query}"}}',
+                            "id": tool_call["id"],
+                            "index": 0,
+                        }
+                    ],
+                )
+            )
+            return
+        for token in self._reply_tokens(messages):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+            await asyncio.sleep(1 / self.tokens_per_second)
+
+
+class FakeSearchInput(BaseModel):
+    """Input for the fake search tool."""
+
+    query: str = Field(description="search query to look up")
+
+
+class FakeSearchTool(BaseTool):
+    """Search tool returning canned results in the DuckDuckGoSearchResults string format."""
+
+    name: str = "duckduckgo_results_json"
+    description: str = (
+        "A wrapper around Duck Duck Go Search. "
+        "Useful for when you need to answer questions about current events. "
+        "Input should be a search query."
+    )
+    args_schema: Type[BaseModel] = FakeSearchInput
+    response_format: Literal["content_and_artifact"] = "content_and_artifact"
+    latency: float = 0.5
+    num_results: int = 10
+    snippet_chars: int = 300
+
+    def _results(self, query: str) -> List[dict]:
+        return [
+            {
+                "snippet": (f"Result {i} about {query}. " * 20)[: self.snippet_chars],
+                "title": f"{query} - result {i}",
+                "link": f"https://example.com/{zlib.crc32(query.encode('utf-8'))}/{i}",
+            }
+            for i in range(self.num_results)
+        ]
+
+    def _format(self, results: List[dict]) -> str:
+        return ", ".join(", ".join(f"{k}: {v}" for k, v in result.items()) for result in results)
+
+    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> tuple[str, List[dict]]:
+        time.sleep(self.latency)
+        results = self._results(query)
+        return self._format(results), results
+
+    async def _arun(self, query: str, run_manager: Optional[Any] = None) -> tuple[str, List[dict]]:
+        await asyncio.sleep(self.latency)
+        results = self._results(query)
+        return self._format(results), results
+
+
+def install_fakes(agent: Any, llm: FakeChatModel, tools: List[BaseTool]) -> None:
+    """Swap the LLM client and tools of a LangGraphAgent for fakes.
+
+    Args:
+        agent: The LangGraphAgent instance serving the API.
+        llm: The fake chat model.
+        tools: The fake tools.
+    """
+    # Every model tier is served by the same fake
+    agent.llms = {tier: llm.bind_tools(tools) for tier in agent.llms}
+    agent.tools_by_name = {tool.name: tool for tool in tools}
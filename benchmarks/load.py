@@ -0,0 +1,280 @@
+"""Load test the API in-process against a fake LLM and a fake search tool.
+
+The real FastAPI `app` from `main.py` is driven through an ASGI client, with
+the LLM client and search tool of the chatbot agent replaced by deterministic
+fakes. Unless `POSTGRES_URL` is set, the application data lives in a temporary
+SQLite database and checkpoints in a temporary SQLite checkpointer.
+
+For each endpoint and concurrency level the report contains throughput,
+p50/p95/p99 latency, time to first byte and event loop lag.
+
+Usage:
+    python -m benchmarks.load --concurrency 1 10 50 --requests 200
+    python -m benchmarks.load --endpoints chat --llm-latency 0.5 --tool-call-rate 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from dataclasses import (
+    dataclass,
+    field,
+)
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+)
+
+WORKDIR = tempfile.mkdtemp(prefix="fastapi-langgraph-bench-")
+
+
+def configure_environment() -> None:
+    """Point the application at local stand-ins before it is imported."""
+    os.environ.setdefault("APP_ENV", "test")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("LOG_DIR", os.path.join(WORKDIR, "logs"))
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+    os.environ.setdefault("LLM_API_KEY", "benchmark-key")
+    os.environ.setdefault("POSTGRES_URL", f"sqlite:///{os.path.join(WORKDIR, 'app.db')}")
+    if os.environ["POSTGRES_URL"].startswith("sqlite"):
+        os.environ.setdefault("CHECKPOINTER_BACKEND", "sqlite")
+        os.environ.setdefault("SQLITE_CHECKPOINT_PATH", os.path.join(WORKDIR, "checkpoints.sqlite"))
+    # Rate limits would otherwise dominate the measurements
+    unlimited = "1000000 per minute"
+    os.environ.setdefault("RATE_LIMIT_DEFAULT", unlimited)
+    for endpoint in ("chat", "chat_stream", "messages", "register", "login", "root", "health"):
+        os.environ.setdefault(f"RATE_LIMIT_{endpoint.upper()}", unlimited)
+    # So is load shedding, unless enabled to measure it
+    os.environ.setdefault("CONCURRENCY_LIMIT_ENABLED", "false")
+
+
+configure_environment()
+
+from benchmarks.asgi import (  # noqa: E402
+    AsgiClient,
+    LoopLagProbe,
+    Response,
+)
+from benchmarks.fakes import (  # noqa: E402
+    FakeChatModel,
+    FakeSearchTool,
+    install_fakes,
+)
+from benchmarks.stats import (  # noqa: E402
+    format_table,
+    percentile,
+    summarize,
+)
+
+PASSWORD = "Bench$Pass1234"
+
+
+@dataclass
+class Account:
+    """A registered user with a user token and a session token."""
+
+    email: str
+    user_token: str
+    session_token: str = ""
+
+
+@dataclass
+class PhaseResult:
+    """Measurements of one endpoint at one concurrency level."""
+
+    endpoint: str
+    concurrency: int
+    elapsed: float
+    responses: List[Response] = field(default_factory=list)
+    loop_lag: List[float] = field(default_factory=list)
+
+    def row(self) -> Dict[str, Any]:
+        """Flatten the result into a report row."""
+        ok = [r for r in self.responses if 200 <= r.status < 300]
+        latency = summarize([r.elapsed for r in ok])
+        return {
+            "endpoint": self.endpoint,
+            "concurrency": self.concurrency,
+            "requests": len(self.responses),
+            "errors": len(self.responses) - len(ok),
+            "rps": len(ok) / self.elapsed if self.elapsed else 0.0,
+            "p50_ms": latency["p50_ms"],
+            "p95_ms": latency["p95_ms"],
+            "p99_ms": latency["p99_ms"],
+            "ttfb_p50_ms": percentile([r.ttfb for r in ok], 50) * 1000,
+            "ttfb_p95_ms": percentile([r.ttfb for r in ok], 95) * 1000,
+            "lag_p99_ms": percentile(self.loop_lag, 99) * 1000,
+            "lag_max_ms": max(self.loop_lag, default=0.0) * 1000,
+        }
+
+
+def build_app(args: argparse.Namespace) -> Any:
+    """Import the application and swap its LLM and search tool for fakes.
+
+    Args:
+        args: Parsed command line arguments with the fake settings.
+
+    Returns:
+        Any: The FastAPI application.
+    """
+    from api.v1 import chatbot
+    from main import app
+
+    llm = FakeChatModel(
+        first_token_latency=args.llm_latency,
+        tokens_per_second=args.llm_tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        tool_call_rate=args.tool_call_rate,
+    )
+    install_fakes(chatbot.agent, llm, [FakeSearchTool(latency=args.tool_latency)])
+    return app
+
+
+async def create_accounts(client: AsgiClient, prefix: str, count: int) -> List[Account]:
+    """Register users and open one chat session for each.
+
+    Args:
+        client: The client driving the application.
+        prefix: Prefix making the emails unique to this run.
+        count: Number of accounts to create.
+
+    Returns:
+        List[Account]: The created accounts.
+    """
+    from core.config import settings
+
+    api = settings.API_V1_STR
+    accounts = []
+    for i in range(count):
+        email = f"{prefix}-{i}@example.com"
+        response = await client.request(
+            "POST", f"{api}/auth/register", json_body={"email": email, "password": PASSWORD}
+        )
+        if response.status != 200:
+            raise RuntimeError(f"Registration failed ({response.status}): {response.body[:200]!r}")
+        account = Account(email=email, user_token=response.json()["token"]["access_token"])
+        response = await client.request(
+            "POST", f"{api}/auth/session", headers={"authorization": f"Bearer {account.user_token}"}
+        )
+        account.session_token = response.json()["token"]["access_token"]
+        accounts.append(account)
+    return accounts
+
+
+def endpoint_requests(
+    client: AsgiClient, accounts: List[Account], history: int, chat_mode: str = "full"
+) -> Dict[str, Callable[[int, int], Awaitable[Response]]]:
+    """Build the request function of every benchmarked endpoint.
+
+    Each function takes (worker index, request index) and sends one request.
+    In delta chat mode only the new user message is sent.
+    """
+    from core.config import settings
+
+    api = settings.API_V1_STR
+
+    async def login(worker: int, index: int) -> Response:
+        account = accounts[worker % len(accounts)]
+        return await client.request(
+            "POST",
+            f"{api}/auth/login",
+            form={"username": account.email, "password": PASSWORD, "grant_type": "password"},
+        )
+
+    async def session(worker: int, index: int) -> Response:
+        account = accounts[worker % len(accounts)]
+        return await client.request(
+            "POST", f"{api}/auth/session", headers={"authorization": f"Bearer {account.user_token}"}
+        )
+
+    async def chat(worker: int, index: int) -> Response:
+        account = accounts[worker % len(accounts)]
+        messages = []
+        if chat_mode == "full":
+            for turn in range(history):
+                messages.append({"role": "user", "content": f"earlier question {turn}"})
+                messages.append({"role": "assistant", "content": f"earlier answer {turn}"})
+        messages.append({"role": "user", "content": f"question {index} from worker {worker}"})
+        return await client.request(
+            "POST",
+            f"{api}/chatbot/chat",
+            headers={"authorization": f"Bearer {account.session_token}"},
+            json_body={"messages": messages, "mode": chat_mode},
+        )
+
+    return {"login": login, "session": session, "chat": chat}
+
+
+async def run_phase(
+    endpoint: str, send: Callable[[int, int], Awaitable[Response]], concurrency: int, total: int
+) -> PhaseResult:
+    """Send `total` requests from `concurrency` concurrent workers.
+
+    Args:
+        endpoint: Name of the endpoint, for the report.
+        send: The request function.
+        concurrency: Number of concurrent workers.
+        total: Total number of requests.
+
+    Returns:
+        PhaseResult: The measurements of the phase.
+    """
+    probe = LoopLagProbe()
+    responses: List[Response] = []
+    counter = iter(range(total))
+
+    async def worker(worker_index: int) -> None:
+        for index in counter:
+            responses.append(await send(worker_index, index))
+
+    probe.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return PhaseResult(endpoint, concurrency, elapsed, responses, await probe.stop())
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Run every requested endpoint at every concurrency level."""
+    app = build_app(args)
+    rows = []
+    async with AsgiClient(app) as client:
+        accounts = await create_accounts(client, f"bench-{int(time.time())}", max(args.concurrency))
+        requests = endpoint_requests(client, accounts, args.history, args.chat_mode)
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                # Warm up connections, caches and lazily built objects such as the graph
+                await run_phase(endpoint, requests[endpoint], concurrency, concurrency)
+                result = await run_phase(endpoint, requests[endpoint], concurrency, args.requests)
+                rows.append(result.row())
+
+    print(json.dumps(rows, indent=2) if args.json else format_table(rows))
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", default=["login", "session", "chat"], choices=["login", "session", "chat"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--history", type=int, default=0, help="Previous turns replayed in every chat request")
+    parser.add_argument(
+        "--chat-mode", default="full", choices=["full", "delta"], help="Send the whole history or only the new turn"
+    )
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake LLM time to first token (s)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--tool-call-rate", type=float, default=0.0, help="Fraction of turns calling the search tool")
+    parser.add_argument("--tool-latency", type=float, default=0.5, help="Fake search latency (s)")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,151 @@
+"""Benchmark the message pipeline of a chat turn against the previous one.
+
+A turn prepares the state messages for the LLM, converts them to the LLM
+input, then converts the resulting state to the API response. The previous
+pipeline dumped every message to a dictionary twice, rebuilt messages from
+them, and validated a `Message` for every message of the conversation; the
+current one trims the state messages as they are and only converts the
+messages produced by the turn.
+
+The token counter is the fake LLM's (4 characters per token), so trimming
+costs less than with tiktoken in both versions.
+
+Usage:
+    python -m benchmarks.messages
+    python -m benchmarks.messages --sizes 10 100 1000 --json
+"""
+
+import argparse
+import json
+import os
+import timeit
+import uuid
+from typing import (
+    Callable,
+    Dict,
+    List,
+)
+
+os.environ.setdefault("LLM_API_KEY", "benchmark-key")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from langchain_core.messages import (  # noqa: E402
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    convert_to_messages,
+    convert_to_openai_messages,
+)
+from langchain_core.messages import trim_messages as _trim_messages  # noqa: E402
+
+from benchmarks.fakes import FakeChatModel  # noqa: E402
+from benchmarks.stats import format_table  # noqa: E402
+from core.config import settings  # noqa: E402
+from core.langgraph.graph import LangGraphAgent  # noqa: E402
+from core.prompts import SYSTEM_PROMPT  # noqa: E402
+from schemas.chat import (  # noqa: E402
+    ChatResponse,
+    Message,
+)
+from utils.graph import prepare_messages  # noqa: E402
+
+# Only used to convert the produced messages, the graph is never built
+AGENT = LangGraphAgent()
+
+
+def legacy_dump_messages(messages: list) -> list[dict]:
+    """The previous `dump_messages`."""
+    return [message.model_dump() for message in messages]
+
+
+def legacy_prepare_messages(messages: list, llm: FakeChatModel, system_prompt: str) -> list:
+    """The previous `prepare_messages`."""
+    trimmed_messages = _trim_messages(
+        legacy_dump_messages(messages),
+        strategy="last",
+        token_counter=llm,
+        max_tokens=settings.MAX_TOKENS,
+        start_on="human",
+        include_system=False,
+        allow_partial=False,
+    )
+    return [Message(role="system", content=system_prompt)] + trimmed_messages
+
+
+def legacy_process_messages(messages: List[BaseMessage]) -> List[Message]:
+    """The previous `LangGraphAgent.__process_messages`."""
+    openai_style_messages = convert_to_openai_messages(messages)
+    return [
+        Message(**message)
+        for message in openai_style_messages
+        if message["role"] in ["assistant", "user"] and message["content"]
+    ]
+
+
+def make_thread(size: int, content_chars: int) -> List[BaseMessage]:
+    """Build a state of `size` alternating user and assistant messages, ending with the reply."""
+    text = ("The quick brown fox jumps over the lazy dog. " * (content_chars // 45 + 1))[:content_chars]
+    return [
+        (HumanMessage if i % 2 == 0 else AIMessage)(content=f"{i} {text}", id=str(uuid.uuid4()))
+        for i in range(size)
+    ]
+
+
+def legacy_turn(state: List[BaseMessage], llm: FakeChatModel) -> bytes:
+    """Run the previous pipeline of a turn over `state`."""
+    # The last message is the reply, the LLM sees the state before it
+    messages = legacy_prepare_messages(state[:-1], llm, SYSTEM_PROMPT)
+    convert_to_messages(legacy_dump_messages(messages))
+    result = legacy_process_messages(state)
+    # FastAPI validated the returned model again before serializing it
+    return ChatResponse.model_validate(ChatResponse(messages=result).model_dump()).model_dump_json().encode()
+
+
+def current_turn(state: List[BaseMessage], llm: FakeChatModel) -> bytes:
+    """Run the current pipeline of a turn over `state`."""
+    messages = prepare_messages(state[:-1], llm, SYSTEM_PROMPT)
+    convert_to_messages(messages)
+    result = AGENT._get_produced_messages(state, [{"id": state[-2].id}])
+    return ChatResponse(messages=result).model_dump_json().encode()
+
+
+def measure(function: Callable[[], object], budget: float) -> float:
+    """Return the mean seconds per call, spending roughly `budget` seconds."""
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    repeats = max(1, min(5, int(budget / max(elapsed, 1e-9))))
+    return min([elapsed / number] + [t / number for t in timer.repeat(repeats, number)])
+
+
+def main(args: argparse.Namespace) -> None:
+    """Time both pipelines on threads of every size."""
+    llm = FakeChatModel()
+    rows: List[Dict[str, object]] = []
+    for size in args.sizes:
+        state = make_thread(size, args.content_chars)
+        legacy_time = measure(lambda: legacy_turn(state, llm), args.budget)
+        current_time = measure(lambda: current_turn(state, llm), args.budget)
+        rows.append(
+            {
+                "messages": size,
+                "legacy_us": legacy_time * 1e6,
+                "current_us": current_time * 1e6,
+                "speedup": legacy_time / current_time,
+            }
+        )
+
+    print(json.dumps(rows, indent=2) if args.json else format_table(rows))
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000], help="Messages in the thread")
+    parser.add_argument("--content-chars", type=int, default=400, help="Characters per message")
+    parser.add_argument("--budget", type=float, default=1.0, help="Approximate seconds per measurement")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
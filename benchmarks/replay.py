@@ -0,0 +1,526 @@
+"""Replay the traffic recorded in the JSONL logs as a load test.
+
+The `{env}-{date}.jsonl` files written under `LOG_DIR` are parsed back into the
+requests that produced them: `session_created` events become session
+creations, `chat_request_received` events become chat requests with the logged
+`message_count`, and the matching `llm_response_generated` and
+`chat_request_processed` events give the number of LLM calls and the latency
+observed in production. The trace keeps the recorded arrival times, session
+reuse and conversation lengths, and is replayed open-loop at `--speed` times
+the original rate.
+
+Without `--target`, the requests are sent to the in-process application with
+the fake LLM and search tool of `benchmarks.load`, the fake calling the tool
+as often as the trace did. With `--target`, they are sent to a running
+deployment, which then must accept registrations.
+
+Usage:
+    python -m benchmarks.replay logs/production-2025-05-26.jsonl --speed 10
+    python -m benchmarks.replay --target https://staging.example.com --speed 2
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import re
+import time
+from collections import (
+    defaultdict,
+    deque,
+)
+from dataclasses import dataclass
+from datetime import (
+    UTC,
+    datetime,
+)
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+)
+
+# Read before benchmarks.load points LOG_DIR at its own temporary directory
+DEFAULT_LOG_DIR = os.getenv("LOG_DIR", "logs")
+
+from benchmarks.asgi import (  # noqa: E402
+    AsgiClient,
+    LoopLagProbe,
+    Response,
+)
+from benchmarks.load import (  # noqa: E402
+    build_app,
+    create_accounts,
+)
+from benchmarks.stats import (  # noqa: E402
+    format_table,
+    percentile,
+    summarize,
+)
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+CONSOLE_LINE = re.compile(
+    r"^(?P<timestamp>\S+)\s+\[(?P<level>\w+)\s*\]\s+(?P<event>\S+)\s*(?:\[[^\]]*\]\s*)?(?P<fields>.*)$"
+)
+CONSOLE_FIELD = re.compile(r"(\w+)=(.*?)(?=\s+\w+=|$)")
+REPLAYED_EVENTS = frozenset(
+    {"session_created", "chat_request_received", "chat_request_processed", "llm_response_generated"}
+)
+
+
+@dataclass
+class LogEvent:
+    """A structured log event relevant to the replay."""
+
+    timestamp: datetime
+    event: str
+    fields: Dict[str, str]
+
+
+@dataclass
+class ReplayRequest:
+    """A request reconstructed from the logs.
+
+    Attributes:
+        at: When the request arrived in production.
+        kind: "session" or "chat".
+        user_id: The logged user id, or a placeholder if the session predates the logs.
+        session_id: The logged session id.
+        message_count: Number of messages sent with a chat request.
+        llm_calls: Number of LLM calls made for a chat request.
+        observed_latency: Seconds the chat request took in production, if it completed.
+        offset: Seconds since the first request of the trace.
+    """
+
+    at: datetime
+    kind: str
+    user_id: str
+    session_id: str
+    message_count: int = 0
+    llm_calls: int = 0
+    observed_latency: Optional[float] = None
+    offset: float = 0.0
+
+
+@dataclass
+class ReplayResult:
+    """Outcome of one replayed request."""
+
+    request: ReplayRequest
+    response: Response
+    slip: float
+
+
+def _parse_timestamp(value: str) -> datetime:
+    """Parse an ISO timestamp, treating naive timestamps as UTC."""
+    timestamp = datetime.fromisoformat(value)
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=UTC)
+
+
+def parse_line(line: str) -> Optional[LogEvent]:
+    """Parse one line of a JSONL log file.
+
+    Both renderers of `core.logging` are supported: the JSON renderer, whose
+    message is itself a JSON object, and the console renderer, whose message
+    is the coloured `timestamp [level] event [logger] key=value` line.
+
+    Args:
+        line: The raw line.
+
+    Returns:
+        Optional[LogEvent]: The event, or None if it is not relevant to the replay.
+    """
+    try:
+        record = json.loads(line)
+        message = record.get("message", "")
+    except (json.JSONDecodeError, AttributeError):
+        return None
+
+    try:
+        payload = json.loads(message)
+    except (json.JSONDecodeError, TypeError):
+        payload = None
+
+    if isinstance(payload, dict):
+        event = payload.get("event")
+        timestamp = payload.get("timestamp") or record.get("timestamp")
+        fields = {key: str(value) for key, value in payload.items() if key not in ("event", "timestamp")}
+    else:
+        match = CONSOLE_LINE.match(ANSI_ESCAPE.sub("", str(message)))
+        if match is None:
+            return None
+        event = match.group("event")
+        timestamp = match.group("timestamp")
+        fields = dict(CONSOLE_FIELD.findall(match.group("fields")))
+
+    if event not in REPLAYED_EVENTS or not timestamp:
+        return None
+    try:
+        return LogEvent(_parse_timestamp(timestamp), event, fields)
+    except ValueError:
+        return None
+
+
+def read_events(paths: Iterable[str]) -> List[LogEvent]:
+    """Read the relevant events of the given log files, in chronological order."""
+    events = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                event = parse_line(line)
+                if event is not None:
+                    events.append(event)
+    events.sort(key=lambda event: event.timestamp)
+    return events
+
+
+def build_trace(events: List[LogEvent]) -> List[ReplayRequest]:
+    """Reconstruct the requests behind a chronological list of events.
+
+    Args:
+        events: The events, oldest first.
+
+    Returns:
+        List[ReplayRequest]: The requests, oldest first, with offsets set.
+    """
+    requests: List[ReplayRequest] = []
+    session_users: Dict[str, str] = {}
+    open_chats: Dict[str, Deque[ReplayRequest]] = defaultdict(deque)
+
+    for event in events:
+        session_id = event.fields.get("session_id")
+        if not session_id:
+            continue
+        match event.event:
+            case "session_created":
+                # Logged by both the database service and the auth endpoint
+                if session_id in session_users:
+                    continue
+                user_id = event.fields.get("user_id", "")
+                session_users[session_id] = user_id
+                requests.append(ReplayRequest(event.timestamp, "session", user_id, session_id))
+            case "chat_request_received":
+                try:
+                    message_count = int(event.fields.get("message_count", "1"))
+                except ValueError:
+                    message_count = 1
+                request = ReplayRequest(
+                    event.timestamp,
+                    "chat",
+                    session_users.get(session_id, ""),
+                    session_id,
+                    message_count=max(message_count, 1),
+                )
+                requests.append(request)
+                open_chats[session_id].append(request)
+            case "llm_response_generated":
+                if open_chats[session_id]:
+                    open_chats[session_id][0].llm_calls += 1
+            case "chat_request_processed":
+                if open_chats[session_id]:
+                    request = open_chats[session_id].popleft()
+                    request.observed_latency = (event.timestamp - request.at).total_seconds()
+
+    if requests:
+        start = requests[0].at
+        for request in requests:
+            request.offset = (request.at - start).total_seconds()
+    return requests
+
+
+def trace_shape(requests: List[ReplayRequest]) -> Dict[str, Any]:
+    """Summarize the traffic shape of a trace."""
+    chats = [r for r in requests if r.kind == "chat"]
+    turns_per_session: Dict[str, int] = defaultdict(int)
+    for chat in chats:
+        turns_per_session[chat.session_id] += 1
+    arrivals_per_second: Dict[int, int] = defaultdict(int)
+    for request in requests:
+        arrivals_per_second[int(request.offset)] += 1
+    duration = requests[-1].offset if requests else 0.0
+    message_counts = [float(chat.message_count) for chat in chats]
+    observed = [chat.observed_latency for chat in chats if chat.observed_latency is not None]
+    with_llm_calls = [chat for chat in chats if chat.llm_calls]
+
+    return {
+        "duration_s": duration,
+        "sessions_created": sum(1 for r in requests if r.kind == "session"),
+        "sessions_used": len(turns_per_session),
+        "chats": len(chats),
+        "mean_rps": len(requests) / duration if duration else 0.0,
+        "peak_rps": max(arrivals_per_second.values(), default=0),
+        "turns_p50": percentile([float(t) for t in turns_per_session.values()], 50),
+        "turns_max": max(turns_per_session.values(), default=0),
+        "msgs_p50": percentile(message_counts, 50),
+        "msgs_p95": percentile(message_counts, 95),
+        "msgs_max": max(message_counts, default=0.0),
+        "tool_call_rate": (
+            sum(1 for chat in with_llm_calls if chat.llm_calls > 1) / len(with_llm_calls) if with_llm_calls else 0.0
+        ),
+        "observed_p50_ms": percentile(observed, 50) * 1000,
+        "observed_p95_ms": percentile(observed, 95) * 1000,
+    }
+
+
+class HttpClient:
+    """Send requests to a running deployment, with the interface of `AsgiClient`."""
+
+    def __init__(self, base_url: str, timeout: float):
+        """Initialize the client.
+
+        Args:
+            base_url: URL of the deployment.
+            timeout: Timeout of every request in seconds.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._client: Any = None
+
+    async def __aenter__(self) -> "HttpClient":
+        """Open the connection pool."""
+        import httpx
+
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url, timeout=self.timeout, limits=httpx.Limits(max_connections=None)
+        )
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        """Close the connection pool."""
+        await self._client.aclose()
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        headers: Optional[Dict[str, str]] = None,
+        json_body: Any = None,
+        form: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        """Send one request to the deployment.
+
+        Args:
+            method: The HTTP method.
+            path: The request path.
+            headers: Extra request headers.
+            json_body: Body to send as JSON.
+            form: Body to send as a url-encoded form.
+
+        Returns:
+            Response: The response with its timings.
+        """
+        start = time.perf_counter()
+        first_chunk_at: Optional[float] = None
+        chunks: List[bytes] = []
+        async with self._client.stream(method, path, headers=headers, json=json_body, data=form) as response:
+            async for chunk in response.aiter_bytes():
+                if chunk and first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                chunks.append(chunk)
+        end = time.perf_counter()
+        return Response(
+            status=response.status_code,
+            body=b"".join(chunks),
+            ttfb=(first_chunk_at or end) - start,
+            elapsed=end - start,
+            headers={k.lower(): v for k, v in response.headers.items()},
+        )
+
+
+def chat_messages(request: ReplayRequest, content_chars: int) -> List[Dict[str, str]]:
+    """Build a conversation of the logged length ending with a user message."""
+    filler = ("replayed conversation text " * (content_chars // 27 + 1))[:content_chars]
+    messages = []
+    for i in range(request.message_count):
+        role = "user" if (request.message_count - 1 - i) % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"{request.session_id} {request.offset:.3f} {i} {filler}"})
+    return messages
+
+
+async def replay(client: Any, requests: List[ReplayRequest], speed: float, content_chars: int) -> List[ReplayResult]:
+    """Replay a trace open-loop, keeping the recorded arrival times.
+
+    Accounts and the sessions that predate the trace are created up front and
+    are not measured.
+
+    Args:
+        client: An `AsgiClient` or `HttpClient`.
+        requests: The trace.
+        speed: Replay rate relative to the recorded rate.
+        content_chars: Characters per replayed message.
+
+    Returns:
+        List[ReplayResult]: The outcome of every request, in completion order.
+    """
+    from core.config import settings
+
+    api = settings.API_V1_STR
+    user_keys = sorted({r.user_id or f"session:{r.session_id}" for r in requests})
+    accounts = dict(zip(user_keys, await create_accounts(client, f"replay-{int(time.time())}", len(user_keys))))
+    created_in_trace = {r.session_id for r in requests if r.kind == "session"}
+
+    loop = asyncio.get_running_loop()
+    session_tokens: Dict[str, asyncio.Future] = {}
+    for request in requests:
+        if request.session_id in session_tokens:
+            continue
+        session_tokens[request.session_id] = loop.create_future()
+        if request.session_id not in created_in_trace:
+            account = accounts[request.user_id or f"session:{request.session_id}"]
+            response = await client.request(
+                "POST", f"{api}/auth/session", headers={"authorization": f"Bearer {account.user_token}"}
+            )
+            session_tokens[request.session_id].set_result(response.json()["token"]["access_token"])
+
+    results: List[ReplayResult] = []
+
+    async def send(request: ReplayRequest, scheduled: float) -> None:
+        account = accounts[request.user_id or f"session:{request.session_id}"]
+        token_future = session_tokens[request.session_id]
+        try:
+            if request.kind == "session":
+                slip = time.perf_counter() - scheduled
+                response = await client.request(
+                    "POST", f"{api}/auth/session", headers={"authorization": f"Bearer {account.user_token}"}
+                )
+                if response.status == 200:
+                    token_future.set_result(response.json()["token"]["access_token"])
+                else:
+                    token_future.set_result(None)
+            else:
+                session_token = await token_future
+                slip = time.perf_counter() - scheduled
+                if session_token is None:
+                    response = Response(status=0, body=b"session creation failed", ttfb=0.0, elapsed=0.0, headers={})
+                else:
+                    response = await client.request(
+                        "POST",
+                        f"{api}/chatbot/chat",
+                        headers={"authorization": f"Bearer {session_token}"},
+                        json_body={"messages": chat_messages(request, content_chars)},
+                    )
+        except Exception as e:
+            if not token_future.done():
+                token_future.set_result(None)
+            slip = time.perf_counter() - scheduled
+            response = Response(status=0, body=str(e).encode("utf-8"), ttfb=0.0, elapsed=0.0, headers={})
+        results.append(ReplayResult(request, response, slip))
+
+    start = time.perf_counter()
+    tasks = []
+    for request in requests:
+        scheduled = start + request.offset / speed
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(request, scheduled)))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def report_rows(
+    requests: List[ReplayRequest], results: List[ReplayResult], elapsed: float, loop_lag: List[float]
+) -> List[Dict[str, Any]]:
+    """Build the latency and throughput report, with the production latency for comparison."""
+    rows = []
+    for kind in ("session", "chat"):
+        kind_results = [r for r in results if r.request.kind == kind]
+        if not kind_results:
+            continue
+        ok = [r.response for r in kind_results if 200 <= r.response.status < 300]
+        latency = summarize([r.elapsed for r in ok])
+        rows.append(
+            {
+                "endpoint": kind,
+                "source": "replay",
+                "requests": len(kind_results),
+                "errors": len(kind_results) - len(ok),
+                "rps": len(ok) / elapsed if elapsed else 0.0,
+                "p50_ms": latency["p50_ms"],
+                "p95_ms": latency["p95_ms"],
+                "p99_ms": latency["p99_ms"],
+                "ttfb_p95_ms": percentile([r.ttfb for r in ok], 95) * 1000,
+                "slip_p99_ms": percentile([r.slip for r in kind_results], 99) * 1000,
+                "lag_p99_ms": percentile(loop_lag, 99) * 1000,
+            }
+        )
+
+    observed = [r.observed_latency for r in requests if r.kind == "chat" and r.observed_latency is not None]
+    if observed:
+        latency = summarize(observed)
+        columns = rows[0].keys() if rows else ["endpoint", "source", "requests", "p50_ms", "p95_ms", "p99_ms"]
+        row: Dict[str, Any] = dict.fromkeys(columns, "-")
+        row.update(
+            endpoint="chat",
+            source="logs",
+            requests=len(observed),
+            p50_ms=latency["p50_ms"],
+            p95_ms=latency["p95_ms"],
+            p99_ms=latency["p99_ms"],
+        )
+        rows.append(row)
+    return rows
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Parse the logs, replay them and print the report."""
+    paths = args.paths or sorted(glob.glob(os.path.join(DEFAULT_LOG_DIR, "*.jsonl")))
+    requests = build_trace(read_events(paths))
+    if args.max_requests:
+        requests = requests[: args.max_requests]
+    if not requests:
+        raise SystemExit(f"No replayable events found in {len(paths)} log file(s)")
+
+    shape = trace_shape(requests)
+    if args.tool_call_rate is None:
+        args.tool_call_rate = shape["tool_call_rate"]
+
+    if args.target:
+        client = HttpClient(args.target, args.timeout)
+    else:
+        client = AsgiClient(build_app(args))
+
+    probe = LoopLagProbe()
+    async with client:
+        probe.start()
+        start = time.perf_counter()
+        results = await replay(client, requests, args.speed, args.content_chars)
+        elapsed = time.perf_counter() - start
+        loop_lag = await probe.stop()
+
+    rows = report_rows(requests, results, elapsed, loop_lag)
+    if args.json:
+        print(json.dumps({"trace": shape, "speed": args.speed, "results": rows}, indent=2))
+    else:
+        print(format_table([shape]))
+        print()
+        print(format_table(rows))
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help=f"JSONL log files (default: {DEFAULT_LOG_DIR}/*.jsonl)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay rate relative to the recorded rate")
+    parser.add_argument("--target", help="Base URL of a deployment to replay against instead of the in-process app")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Request timeout against --target (s)")
+    parser.add_argument("--max-requests", type=int, default=0, help="Replay only the first N requests")
+    parser.add_argument("--content-chars", type=int, default=200, help="Characters per replayed message")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake LLM time to first token (s)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument(
+        "--tool-call-rate", type=float, default=None, help="Fraction of turns calling the search tool (default: from logs)"
+    )
+    parser.add_argument("--tool-latency", type=float, default=0.5, help="Fake search latency (s)")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,148 @@
+"""Benchmark the sanitizer and the message validator against the regex versions.
+
+The previous implementations are kept here as the baseline. Before timing,
+both versions are run on a set of generated inputs and must agree.
+
+Usage:
+    python -m benchmarks.sanitization
+    python -m benchmarks.sanitization --sizes 1000 3000 --json
+"""
+
+import argparse
+import html
+import json
+import random
+import re
+import timeit
+from typing import (
+    Callable,
+    Dict,
+    List,
+)
+
+from benchmarks.stats import format_table
+from schemas.chat import contains_script_block
+from utils.sanitization import (
+    sanitize_dict,
+    sanitize_string,
+)
+
+
+def legacy_sanitize_string(value: str) -> str:
+    """The previous `sanitize_string`."""
+    if not isinstance(value, str):
+        value = str(value)
+    value = html.escape(value)
+    value = re.sub(r"&lt;script.*?&gt;.*?&lt;/script&gt;", "", value, flags=re.DOTALL)
+    value = value.replace("\0", "")
+    return value
+
+
+def legacy_sanitize_dict(data: dict) -> dict:
+    """The previous `sanitize_dict`, together with `legacy_sanitize_list`."""
+    sanitized = {}
+    for key, value in data.items():
+        if isinstance(value, str):
+            sanitized[key] = legacy_sanitize_string(value)
+        elif isinstance(value, dict):
+            sanitized[key] = legacy_sanitize_dict(value)
+        elif isinstance(value, list):
+            sanitized[key] = legacy_sanitize_list(value)
+        else:
+            sanitized[key] = value
+    return sanitized
+
+
+def legacy_sanitize_list(data: list) -> list:
+    """The previous `sanitize_list`."""
+    sanitized = []
+    for item in data:
+        if isinstance(item, str):
+            sanitized.append(legacy_sanitize_string(item))
+        elif isinstance(item, dict):
+            sanitized.append(legacy_sanitize_dict(item))
+        elif isinstance(item, list):
+            sanitized.append(legacy_sanitize_list(item))
+        else:
+            sanitized.append(item)
+    return sanitized
+
+
+def legacy_contains_script_block(value: str) -> bool:
+    """The check previously done by `Message.validate_content`."""
+    return re.search(r"<script.*?>.*?</script>", value, re.IGNORECASE | re.DOTALL) is not None
+
+
+def make_inputs(size: int) -> Dict[str, str]:
+    """Build the benchmarked inputs of roughly `size` characters."""
+    prose = ("The quick brown fox jumps over the lazy dog. " * (size // 45 + 1))[:size]
+    markup = ('Tom & Jerry say "hi" <b>bold</b> ' * (size // 33 + 1))[:size]
+    return {
+        "plain": prose,
+        "jwt": "eyJhbGciOiJIUzI1NiJ9." + "a" * max(size - 64, 1) + ".c2lnbmF0dXJl",
+        "markup": markup,
+        "script": prose[: size // 2] + "<script>alert(1)</script>" + prose[: size // 2],
+        # Many opening tags and no closing tag, the worst case of the lazy regexes
+        "unclosed": ("<script>" * (size // 8 + 1))[:size],
+    }
+
+
+def check_equivalence(samples: int, seed: int = 0) -> None:
+    """Compare both versions on random strings built from tag fragments."""
+    rng = random.Random(seed)
+    fragments = ["<script", "<SCRIPT", "<ſcript", ">", "</script>", "</SCRİPT>", "&", "\0", '"', "'", "x", " ", "\n"]
+    for _ in range(samples):
+        value = "".join(rng.choice(fragments) for _ in range(rng.randint(0, 30)))
+        assert sanitize_string(value) == legacy_sanitize_string(value), repr(value)
+        assert contains_script_block(value) == legacy_contains_script_block(value), repr(value)
+    data = {"a": "<script>x</script>", "b": ["&", {"c": "plain", "d": 1}], "e": None}
+    assert sanitize_dict(data) == legacy_sanitize_dict(data)
+
+
+def measure(function: Callable[[str], object], value: str, budget: float) -> float:
+    """Return the mean seconds per call, spending roughly `budget` seconds."""
+    timer = timeit.Timer(lambda: function(value))
+    number, elapsed = timer.autorange()
+    repeats = max(1, min(5, int(budget / max(elapsed, 1e-9))))
+    return min([elapsed / number] + [t / number for t in timer.repeat(repeats, number)])
+
+
+def main(args: argparse.Namespace) -> None:
+    """Run the equivalence check, then time both versions on every input."""
+    check_equivalence(args.samples)
+    pairs = {
+        "sanitize_string": (legacy_sanitize_string, sanitize_string),
+        "validate_content": (legacy_contains_script_block, contains_script_block),
+    }
+    rows: List[Dict[str, object]] = []
+    for size in args.sizes:
+        for input_name, value in make_inputs(size).items():
+            for function_name, (legacy, current) in pairs.items():
+                legacy_time = measure(legacy, value, args.budget)
+                current_time = measure(current, value, args.budget)
+                rows.append(
+                    {
+                        "function": function_name,
+                        "input": input_name,
+                        "size": size,
+                        "legacy_us": legacy_time * 1e6,
+                        "current_us": current_time * 1e6,
+                        "speedup": legacy_time / current_time,
+                    }
+                )
+
+    print(json.dumps(rows, indent=2) if args.json else format_table(rows))
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 1000, 3000], help="Input sizes, 3000 is the message length limit")
+    parser.add_argument("--samples", type=int, default=20000, help="Random inputs compared before timing")
+    parser.add_argument("--budget", type=float, default=0.5, help="Approximate seconds per measurement")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
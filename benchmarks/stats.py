@@ -0,0 +1,60 @@
+"""This file contains the statistics helpers shared by the benchmarks."""
+
+from typing import Dict, List, Sequence
+
+
+def percentile(samples: Sequence[float], q: float) -> float:
+    """Compute a percentile with linear interpolation between closest ranks.
+
+    Args:
+        samples: The samples to summarize.
+        q: The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, or 0.0 when there are no samples.
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(samples: Sequence[float]) -> Dict[str, float]:
+    """Summarize latency samples in seconds as milliseconds.
+
+    Args:
+        samples: The latency samples in seconds.
+
+    Returns:
+        Dict[str, float]: Count, mean, p50, p95, p99 and max in milliseconds.
+    """
+    return {
+        "count": len(samples),
+        "mean_ms": (sum(samples) / len(samples) * 1000) if samples else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "max_ms": (max(samples) * 1000) if samples else 0.0,
+    }
+
+
+def format_table(rows: List[Dict[str, object]]) -> str:
+    """Render a list of flat dictionaries as an aligned text table.
+
+    Args:
+        rows: The rows to render, all sharing the keys of the first row.
+
+    Returns:
+        str: The rendered table.
+    """
+    if not rows:
+        return ""
+    columns = list(rows[0].keys())
+    cells = [[f"{row[c]:.2f}" if isinstance(row[c], float) else str(row[c]) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+    lines = ["  ".join(c.rjust(w) for c, w in zip(columns, widths))]
+    lines.extend("  ".join(v.rjust(w) for v, w in zip(row, widths)) for row in cells)
+    return "\n".join(lines)
@@ -0,0 +1,230 @@
+"""Adaptive concurrency limiting for the application.
+
+This module bounds how many agent runs a worker executes at once. The limit
+adapts with AIMD on the observed latency of completed runs: it grows by about
+one per limit's worth of completions while the worker is saturated and latency
+stays near its baseline, and it is cut by a constant factor, at most once per
+baseline latency, when latency exceeds the baseline by the tolerance factor.
+
+Requests over the limit wait in a short FIFO queue. When the queue is full or
+the wait times out, the request is shed with `OverloadedError`, which the API
+turns into a 503 with Retry-After, instead of piling up on the database pool
+and the LLM provider.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import (
+    asynccontextmanager,
+    nullcontext,
+)
+from typing import (
+    AsyncContextManager,
+    AsyncIterator,
+    Deque,
+    Optional,
+)
+
+from core.config import settings
+from core.logging import logger
+from core.metrics import (
+    concurrency_in_flight,
+    concurrency_limit,
+    concurrency_queued,
+    concurrency_shed_total,
+)
+
+# Weight of a sample above the baseline; samples below it replace it at once
+_BASELINE_RISE = 0.01
+
+
+class OverloadedError(Exception):
+    """Raised when a request is shed because the worker is over capacity."""
+
+    def __init__(self, reason: str, retry_after: int):
+        """Initialize the error.
+
+        Args:
+            reason: Why the request was shed: queue_full or queue_timeout.
+            retry_after: Seconds the client should wait before retrying.
+        """
+        super().__init__(f"Server over capacity ({reason}), retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limiter with a bounded FIFO queue."""
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        max_queue: int,
+        queue_timeout: float,
+        latency_tolerance: float = 2.0,
+        backoff: float = 0.9,
+    ):
+        """Initialize the limiter.
+
+        Args:
+            name: The name of the limiter, used as metric label.
+            initial_limit: The concurrency limit before any latency is observed.
+            min_limit: The lowest the limit can be cut to.
+            max_limit: The highest the limit can grow to.
+            max_queue: The maximum number of requests waiting for a slot.
+            queue_timeout: The maximum seconds a request waits for a slot.
+            latency_tolerance: How many times the baseline latency counts as congestion.
+            backoff: The factor the limit is multiplied by on congestion.
+        """
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a slot for the duration of the block.
+
+        Raises:
+            OverloadedError: If no slot frees up in time.
+        """
+        await self._acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException:
+            # Failures say little about the latency of the dependencies
+            self._release(None)
+            raise
+        self._release(time.monotonic() - start)
+
+    def retry_after(self) -> int:
+        """Return the seconds a shed client should wait, about one run."""
+        return max(1, math.ceil(self.baseline or 1))
+
+    async def _acquire(self) -> None:
+        """Take a slot, waiting in line if the limit is reached."""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self._update_gauges()
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._shed("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        try:
+            # The releasing request hands its slot over by resolving the future
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._shed("queue_timeout")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Cancelled right after being handed a slot
+                self._release(None)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._update_gauges()
+
+    def _release(self, latency: Optional[float]) -> None:
+        """Free a slot, adapt the limit to the latency if any, and wake up waiters."""
+        saturated = self.in_flight >= int(self.limit) or bool(self._waiters)
+        self.in_flight -= 1
+        if latency is not None:
+            self._adapt(latency, saturated)
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self.in_flight += 1
+        self._update_gauges()
+
+    def _adapt(self, latency: float, saturated: bool) -> None:
+        """Apply AIMD to the limit for a completed request."""
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline += (latency - self.baseline) * _BASELINE_RISE
+
+        now = time.monotonic()
+        if latency > self.baseline * self.latency_tolerance:
+            # One cut per baseline latency: the slow requests of a burst share a cause
+            if now - self._last_decrease >= self.baseline:
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_decrease = now
+        elif saturated:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+    def _shed(self, reason: str) -> None:
+        """Count a shed request and raise the error."""
+        concurrency_shed_total.labels(limiter=self.name, reason=reason).inc()
+        logger.warning(
+            "request_shed",
+            limiter=self.name,
+            reason=reason,
+            limit=int(self.limit),
+            in_flight=self.in_flight,
+            queued=len(self._waiters),
+        )
+        raise OverloadedError(reason, self.retry_after())
+
+    def _update_gauges(self) -> None:
+        """Export the current limit, in-flight and queued counts."""
+        concurrency_limit.labels(limiter=self.name).set(int(self.limit))
+        concurrency_in_flight.labels(limiter=self.name).set(self.in_flight)
+        concurrency_queued.labels(limiter=self.name).set(len(self._waiters))
+
+
+def create_concurrency_limiter(name: str) -> Optional[AdaptiveConcurrencyLimiter]:
+    """Create a limiter from the settings.
+
+    Args:
+        name: The name of the limiter.
+
+    Returns:
+        Optional[AdaptiveConcurrencyLimiter]: The limiter, or None if concurrency limiting is disabled.
+    """
+    if not settings.CONCURRENCY_LIMIT_ENABLED:
+        return None
+    return AdaptiveConcurrencyLimiter(
+        name,
+        initial_limit=settings.CONCURRENCY_LIMIT_INITIAL,
+        min_limit=settings.CONCURRENCY_LIMIT_MIN,
+        max_limit=settings.CONCURRENCY_LIMIT_MAX,
+        max_queue=settings.CONCURRENCY_QUEUE_SIZE,
+        queue_timeout=settings.CONCURRENCY_QUEUE_TIMEOUT,
+        latency_tolerance=settings.CONCURRENCY_LATENCY_TOLERANCE,
+    )
+
+
+def concurrency_slot(limiter: Optional[AdaptiveConcurrencyLimiter]) -> AsyncContextManager[None]:
+    """Hold a slot of a limiter, or nothing if concurrency limiting is disabled.
+
+    Args:
+        limiter: The limiter, if any.
+
+    Returns:
+        AsyncContextManager[None]: The slot to enter.
+    """
+    return limiter.slot() if limiter is not None else nullcontext()
+
+
+# Agent runs started by chat requests, blocking or streamed
+chat_concurrency_limiter = create_concurrency_limiter("chat")
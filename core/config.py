@@ -16,6 +16,12 @@ class Environment(str, Enum):
     TEST = "test"
 
 
+class CheckpointerBackend(str, Enum):
+    POSTGRES = "postgres"
+    SQLITE = "sqlite"
+    MEMORY = "memory"
+
+
 def get_environment():
     match os.getenv("APP_ENV", "development").lower():
         case "production" | "prod":
@@ -112,6 +118,15 @@ class Settings:
         self.API_V1_STR = os.getenv("API_V1_STR", "/api/v1")
         self.DEBUG = os.getenv("DEBUG", "false").lower() in ("true", "1", "t", "yes")
 
+        # Server Configuration, used by server.py
+        self.SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+        self.SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+        self.SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+        self.SERVER_LOOP = os.getenv("SERVER_LOOP", "uvloop")  # "uvloop", "asyncio" or "auto"
+        self.SERVER_HTTP = os.getenv("SERVER_HTTP", "httptools")  # "httptools", "h11" or "auto"
+        self.SERVER_KEEPALIVE_TIMEOUT = int(os.getenv("SERVER_KEEPALIVE_TIMEOUT", "5"))
+        self.SERVER_FORWARDED_ALLOW_IPS = os.getenv("SERVER_FORWARDED_ALLOW_IPS", "127.0.0.1")
+
         # CORS Settings
         self.ALLOWED_ORIGINS = parse_list_from_env("ALLOWED_ORIGINS", ["*"])
 
@@ -129,12 +144,42 @@ class Settings:
         self.MAX_TOKENS = int(os.getenv("MAX_TOKENS", "2000"))
         self.MAX_LLM_CALL_RETRIES = int(os.getenv("MAX_LLM_CALL_RETRIES", "3"))
 
+        # Model Routing Configuration
+        # Extra tiers as "tier:model" pairs, the "default" tier is LLM_MODEL unless overridden
+        self.LLM_MODEL_TIERS = {
+            "default": self.LLM_MODEL,
+            **{
+                tier.strip(): model.strip()
+                for tier, model in (item.split(":", 1) for item in parse_list_from_env("LLM_MODEL_TIERS"))
+            },
+        }
+        self.LLM_DEFAULT_TIER = os.getenv("LLM_DEFAULT_TIER", "default")
+        # Tier of short turns without search intent, empty to not route on complexity
+        self.LLM_FAST_TIER = os.getenv("LLM_FAST_TIER", "")
+        self.LLM_FAST_MAX_TOKENS = int(os.getenv("LLM_FAST_MAX_TOKENS", "32"))
+        # Tier of the users listed by id, empty to not route on the user
+        self.LLM_PREMIUM_TIER = os.getenv("LLM_PREMIUM_TIER", "")
+        self.LLM_PREMIUM_USER_IDS = parse_list_from_env("LLM_PREMIUM_USER_IDS")
+
+        # HTTP Client Configuration, shared by the model clients and the tools
+        self.HTTP_CLIENT_MAX_CONNECTIONS = int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "100"))
+        self.HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS", "20"))
+        # Seconds an idle connection is kept open, longer than httpx's 5 to skip TLS handshakes between bursts
+        self.HTTP_CLIENT_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_CLIENT_KEEPALIVE_EXPIRY", "90"))
+        # HTTP/2 needs the h2 package, HTTP/1.1 is used without it
+        self.HTTP_CLIENT_HTTP2 = os.getenv("HTTP_CLIENT_HTTP2", "true").lower() in ("true", "1", "t", "yes")
+        self.HTTP_CLIENT_CONNECT_TIMEOUT = float(os.getenv("HTTP_CLIENT_CONNECT_TIMEOUT", "5"))
+        # Seconds without receiving any data, streamed completions reset it on every chunk
+        self.HTTP_CLIENT_READ_TIMEOUT = float(os.getenv("HTTP_CLIENT_READ_TIMEOUT", "120"))
+
         # JWT Configuration
         self.JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "")
         self.JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
         self.JWT_ACCESS_TOKEN_EXPIRE_DAYS = int(
             os.getenv("JWT_ACCESS_TOKEN_EXPIRE_DAYS", "30")
         )
+        # Seconds before a token revoked by another worker is rejected
+        self.JWT_REVOCATION_REFRESH_SECONDS = float(os.getenv("JWT_REVOCATION_REFRESH_SECONDS", "30"))
 
         # Logging Configuration
         self.LOG_DIR = Path(os.getenv("LOG_DIR", "logs"))
@@ -143,14 +188,142 @@ class Settings:
 
         # Postgres Configuration
         self.POSTGRES_URL = os.getenv("POSTGRES_URL", "")
+        # Connections kept open and extra ones opened under load, shared by all consumers
         self.POSTGRES_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", "20"))
         self.POSTGRES_MAX_OVERFLOW = int(os.getenv("POSTGRES_MAX_OVERFLOW", "10"))
+        self.POSTGRES_POOL_TIMEOUT = float(os.getenv("POSTGRES_POOL_TIMEOUT", "30"))
+        # POSTGRES_URL points to PgBouncer in transaction pooling mode
+        self.POSTGRES_PGBOUNCER = os.getenv("POSTGRES_PGBOUNCER", "false").lower() in ("true", "1", "t", "yes")
+        # Read replicas of POSTGRES_URL, for read-only queries
+        self.POSTGRES_REPLICA_URLS = parse_list_from_env("POSTGRES_REPLICA_URLS")
+        self.POSTGRES_REPLICA_POOL_SIZE = int(os.getenv("POSTGRES_REPLICA_POOL_SIZE", "10"))
+        # Replicas lagging more get no reads, and a session reads from the primary this long after a write
+        self.POSTGRES_REPLICA_MAX_LAG = float(os.getenv("POSTGRES_REPLICA_MAX_LAG", "2"))
+        self.POSTGRES_REPLICA_CHECK_INTERVAL = float(os.getenv("POSTGRES_REPLICA_CHECK_INTERVAL", "1"))
         self.CHECKPOINT_TABLES = [
             "checkpoint_blobs",
             "checkpoint_writes",
             "checkpoints",
         ]
 
+        # Checkpointer Configuration
+        self.CHECKPOINTER_BACKEND = CheckpointerBackend(
+            os.getenv("CHECKPOINTER_BACKEND", "postgres").lower()
+        )
+        self.SQLITE_CHECKPOINT_PATH = os.getenv(
+            "SQLITE_CHECKPOINT_PATH", "checkpoints.sqlite"
+        )
+
+        # Concurrency Limit Configuration
+        self.CONCURRENCY_LIMIT_ENABLED = os.getenv(
+            "CONCURRENCY_LIMIT_ENABLED", "true"
+        ).lower() in ("true", "1", "t", "yes")
+        # Concurrent chat runs per worker, adapted between the min and the max
+        self.CONCURRENCY_LIMIT_INITIAL = int(os.getenv("CONCURRENCY_LIMIT_INITIAL", "20"))
+        self.CONCURRENCY_LIMIT_MIN = int(os.getenv("CONCURRENCY_LIMIT_MIN", "2"))
+        self.CONCURRENCY_LIMIT_MAX = int(os.getenv("CONCURRENCY_LIMIT_MAX", "200"))
+        self.CONCURRENCY_QUEUE_SIZE = int(os.getenv("CONCURRENCY_QUEUE_SIZE", "50"))
+        self.CONCURRENCY_QUEUE_TIMEOUT = float(os.getenv("CONCURRENCY_QUEUE_TIMEOUT", "2"))
+        # Latency above this multiple of the baseline cuts the limit
+        self.CONCURRENCY_LATENCY_TOLERANCE = float(os.getenv("CONCURRENCY_LATENCY_TOLERANCE", "2"))
+
+        # Deadline Configuration
+        # Seconds a blocking or streamed chat turn may take, waiting for a slot and the session included
+        self.CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "60"))
+        # Seconds each attempt of a background run may take
+        self.RUN_DEADLINE_SECONDS = float(os.getenv("RUN_DEADLINE_SECONDS", "300"))
+        # Seconds at the end of a deadline kept for a final answer without tools
+        self.DEADLINE_ANSWER_RESERVE_SECONDS = float(os.getenv("DEADLINE_ANSWER_RESERVE_SECONDS", "10"))
+
+        # Tool Execution Configuration
+        # Stream the model's messages to start each tool call as soon as its arguments are complete
+        self.EARLY_TOOL_EXECUTION_ENABLED = os.getenv(
+            "EARLY_TOOL_EXECUTION_ENABLED", "true"
+        ).lower() in ("true", "1", "t", "yes")
+
+        # Tool Output Configuration
+        # Approximate tokens of each tool output sent to the model, search results are cut to fit
+        self.TOOL_OUTPUT_MAX_TOKENS = int(os.getenv("TOOL_OUTPUT_MAX_TOKENS", "400"))
+        self.TOOL_OUTPUT_SNIPPET_CHARS = int(os.getenv("TOOL_OUTPUT_SNIPPET_CHARS", "240"))
+        # Keep the full output out of the prompt in the checkpoint, retrievable by tool call ID
+        self.TOOL_OUTPUT_KEEP_FULL = os.getenv("TOOL_OUTPUT_KEEP_FULL", "true").lower() in ("true", "1", "t", "yes")
+
+        # Stream Configuration
+        # Answer tokens are sent in frames of up to this many characters,
+        # or of whatever arrived within the window
+        self.STREAM_FRAME_MAX_CHARS = int(os.getenv("STREAM_FRAME_MAX_CHARS", "256"))
+        self.STREAM_FRAME_WINDOW_MS = float(os.getenv("STREAM_FRAME_WINDOW_MS", "20"))
+
+        # Run Lock Configuration
+        # Seconds a run waits for another run on the same session to finish
+        self.RUN_LOCK_TIMEOUT = float(os.getenv("RUN_LOCK_TIMEOUT", "30"))
+        # Dedicated connections holding the advisory locks of all the runs of a worker
+        self.RUN_LOCK_CONNECTIONS = int(os.getenv("RUN_LOCK_CONNECTIONS", "2"))
+
+        # Run Queue Configuration
+        # Background runs executed concurrently by each worker process
+        self.RUN_QUEUE_WORKERS = int(os.getenv("RUN_QUEUE_WORKERS", "4"))
+        self.RUN_QUEUE_MAX_SIZE = int(os.getenv("RUN_QUEUE_MAX_SIZE", "100"))
+        # Seconds an unfinished run stays owned by a worker that stopped renewing it
+        self.RUN_LEASE_SECONDS = float(os.getenv("RUN_LEASE_SECONDS", "30"))
+        self.RUN_MAX_ATTEMPTS = int(os.getenv("RUN_MAX_ATTEMPTS", "3"))
+        # Seconds between two reads of a waited run executed by another worker
+        self.RUN_WAIT_POLL_INTERVAL = float(os.getenv("RUN_WAIT_POLL_INTERVAL", "0.5"))
+        # With POSTGRES_PGBOUNCER, each running thread holds a connection of a dedicated pool,
+        # which must fit the most concurrent runs of a worker
+        self.RUN_LOCK_POOL_SIZE = int(
+            os.getenv("RUN_LOCK_POOL_SIZE", str(self.CONCURRENCY_LIMIT_MAX + self.RUN_QUEUE_WORKERS))
+        )
+
+        # Checkpoint Cache Configuration
+        self.CHECKPOINT_CACHE_ENABLED = os.getenv(
+            "CHECKPOINT_CACHE_ENABLED", "true"
+        ).lower() in ("true", "1", "t", "yes")
+        self.CHECKPOINT_CACHE_MAX_ENTRIES = int(
+            os.getenv("CHECKPOINT_CACHE_MAX_ENTRIES", "1000")
+        )
+        self.CHECKPOINT_CACHE_MAX_BYTES = int(
+            os.getenv("CHECKPOINT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+        )
+        # Check the latest checkpoint id in the store before serving a cached
+        # checkpoint, so a cache can never hide a newer write from another worker
+        self.CHECKPOINT_CACHE_VALIDATE = os.getenv(
+            "CHECKPOINT_CACHE_VALIDATE", "true"
+        ).lower() in ("true", "1", "t", "yes")
+        # Seconds a cached checkpoint is served without checking the store after it was
+        # written by this worker or last checked, which bounds how long a write from
+        # another worker can go unseen
+        self.CHECKPOINT_CACHE_VALIDATE_TTL = float(
+            os.getenv("CHECKPOINT_CACHE_VALIDATE_TTL", "5.0")
+        )
+
+        # Diagnostics Configuration
+        self.DIAGNOSTICS_ENABLED = os.getenv(
+            "DIAGNOSTICS_ENABLED", "false"
+        ).lower() in ("true", "1", "t", "yes")
+        self.LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+        # Seconds the event loop must be blocked before the stack is logged, 0 disables it
+        self.SLOW_CALLBACK_THRESHOLD = float(
+            os.getenv("SLOW_CALLBACK_THRESHOLD", "0.1")
+        )
+        self.SLOW_CALLBACK_LOG_INTERVAL = float(
+            os.getenv("SLOW_CALLBACK_LOG_INTERVAL", "10")
+        )
+        # Seconds from which the timing breakdown of a request is logged at info rather than debug
+        self.REQUEST_TIMING_LOG_THRESHOLD = float(
+            os.getenv("REQUEST_TIMING_LOG_THRESHOLD", "1.0")
+        )
+
+        # Profiling Configuration
+        self.PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() in (
+            "true",
+            "1",
+            "t",
+            "yes",
+        )
+        self.PROFILING_ADMIN_EMAILS = parse_list_from_env("PROFILING_ADMIN_EMAILS")
+        self.PROFILING_MAX_DURATION = float(os.getenv("PROFILING_MAX_DURATION", "60"))
+
         # Rate Limiting Configuration
         self.RATE_LIMIT_DEFAULT = parse_list_from_env(
             "RATE_LIMIT_DEFAULT", ["200 per day", "50 per hour"]
@@ -204,6 +377,8 @@ class Settings:
                 "DEBUG": False,
                 "LOG_LEVEL": "WARNING",
                 "RATE_LIMIT_DEFAULT": ["200 per day", "50 per hour"],
+                "PROFILING_ENABLED": False,
+                "SERVER_WORKERS": os.cpu_count() or 1,
             },
             Environment.TEST: {
                 "DEBUG": True,
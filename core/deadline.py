@@ -0,0 +1,104 @@
+"""This file contains the deadlines of agent runs.
+
+A run gets a deadline when its request arrives, carried in the graph config.
+Every step of the run takes its timeout from the time left: LLM calls, with
+the retries and backoff sleeps of the SDK inside them, tool invocations and
+checkpoint reads. The last seconds of the budget are reserved for a final
+answer without tools, so a run close to its deadline stops calling tools and
+answers with what it has, instead of being cut off with nothing.
+"""
+
+import asyncio
+import time
+from typing import (
+    Awaitable,
+    Optional,
+    TypeVar,
+)
+
+from langchain_core.runnables import RunnableConfig
+
+from core.config import settings
+
+T = TypeVar("T")
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a run is out of time before it could answer."""
+
+    def __init__(self, budget: float):
+        """Initialize the error.
+
+        Args:
+            budget: The total seconds the run was given.
+        """
+        super().__init__(f"The run did not finish within its {budget:g}s deadline")
+        self.budget = budget
+
+
+class Deadline:
+    """The point in time a run must be done by."""
+
+    def __init__(self, budget: float, answer_reserve: float = 0.0):
+        """Start the clock.
+
+        Args:
+            budget: Seconds the run is given, from now.
+            answer_reserve: Seconds at the end of the budget kept for the final answer.
+        """
+        self.budget = budget
+        self.answer_reserve = min(answer_reserve, budget)
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        """Return the seconds left, 0 once expired."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def working_time(self) -> float:
+        """Return the seconds left for steps other than the final answer, 0 once in the reserve."""
+        return max(0.0, self.remaining() - self.answer_reserve)
+
+    def must_answer(self) -> bool:
+        """Return whether the run is in its reserve and must answer without tools."""
+        return self.working_time() <= 0
+
+    async def run(self, awaitable: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """Await a step, cancelling it when the deadline or the given timeout is reached.
+
+        Args:
+            awaitable: The step.
+            timeout: Seconds the step may take, the time left by default.
+
+        Returns:
+            T: The result of the step.
+
+        Raises:
+            asyncio.TimeoutError: If the step was cancelled for lack of time.
+        """
+        return await asyncio.wait_for(awaitable, self.remaining() if timeout is None else timeout)
+
+
+def create_deadline(budget: float) -> Deadline:
+    """Create a deadline keeping the configured reserve for the final answer.
+
+    Args:
+        budget: Seconds the run is given, from now.
+
+    Returns:
+        Deadline: The deadline.
+    """
+    return Deadline(budget, settings.DEADLINE_ANSWER_RESERVE_SECONDS)
+
+
+def get_deadline(config: Optional[RunnableConfig]) -> Optional[Deadline]:
+    """Get the deadline carried in a graph config.
+
+    Args:
+        config: The config of the run, or of one of its steps.
+
+    Returns:
+        Optional[Deadline]: The deadline, None if the run has none.
+    """
+    if not config:
+        return None
+    return config.get("configurable", {}).get("deadline")
@@ -0,0 +1,139 @@
+"""This file contains the opt-in event loop diagnostics for the application.
+
+A monitor task measures event loop lag as the overshoot of a periodic sleep
+and exports it as a Prometheus histogram. A watchdog thread notices when that
+task stops ticking because a callback is blocking the loop, and logs the stack
+of the loop thread while it is still blocked, so the blocking call can be found
+in production.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from core.config import settings
+from core.logging import logger
+from core.metrics import (
+    event_loop_blocked_total,
+    event_loop_lag_seconds,
+)
+
+
+class EventLoopMonitor:
+    """Measure event loop lag and capture the stack of blocking callbacks."""
+
+    def __init__(
+        self,
+        interval: float,
+        slow_callback_threshold: float,
+        log_interval: float,
+        max_stack_depth: int = 30,
+    ):
+        """Initialize the monitor.
+
+        Args:
+            interval: Seconds between lag samples.
+            slow_callback_threshold: Seconds the loop must be blocked before its stack
+                is captured, 0 to only measure lag.
+            log_interval: Minimum seconds between two logged stacks; captures in
+                between are counted and reported with the next log.
+            max_stack_depth: Number of innermost frames kept in a logged stack.
+        """
+        self.interval = interval
+        self.slow_callback_threshold = slow_callback_threshold
+        self.log_interval = log_interval
+        self.max_stack_depth = max_stack_depth
+
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_tick = time.monotonic()
+        self._last_log = 0.0
+        self._suppressed = 0
+
+    def start(self) -> None:
+        """Start monitoring the running event loop."""
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._measure_lag())
+        if self.slow_callback_threshold > 0:
+            self._watchdog = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+            self._watchdog.start()
+        logger.info(
+            "event_loop_monitor_started",
+            interval=self.interval,
+            slow_callback_threshold=self.slow_callback_threshold,
+            environment=settings.ENVIRONMENT.value,
+        )
+
+    async def stop(self) -> None:
+        """Stop the lag task and the watchdog thread."""
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1.0)
+            self._watchdog = None
+
+    async def _measure_lag(self) -> None:
+        """Sleep for the interval and record how late the loop woke up."""
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._last_tick = time.monotonic()
+            event_loop_lag_seconds.observe(max(0.0, self._last_tick - start - self.interval))
+
+    def _watch(self) -> None:
+        """Capture the loop thread stack once per stall longer than the threshold."""
+        reported_tick = None
+        poll_interval = min(self.interval, self.slow_callback_threshold) / 2
+        while not self._stopped.wait(poll_interval):
+            last_tick = self._last_tick
+            blocked_for = time.monotonic() - last_tick - self.interval
+            if blocked_for < self.slow_callback_threshold or last_tick == reported_tick:
+                continue
+            reported_tick = last_tick
+            event_loop_blocked_total.inc()
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            now = time.monotonic()
+            if now - self._last_log < self.log_interval:
+                self._suppressed += 1
+                continue
+            self._last_log = now
+            stack = traceback.format_stack(frame)[-self.max_stack_depth :]
+            logger.warning(
+                "slow_callback_detected",
+                blocked_for_ms=round(blocked_for * 1000, 1),
+                stack="".join(stack),
+                suppressed=self._suppressed,
+                environment=settings.ENVIRONMENT.value,
+            )
+            self._suppressed = 0
+
+
+def create_event_loop_monitor() -> Optional[EventLoopMonitor]:
+    """Create the event loop monitor from the settings, if diagnostics are enabled.
+
+    Returns:
+        Optional[EventLoopMonitor]: The monitor, not started yet, or None if disabled.
+    """
+    if not settings.DIAGNOSTICS_ENABLED:
+        return None
+    return EventLoopMonitor(
+        interval=settings.LOOP_LAG_INTERVAL,
+        slow_callback_threshold=settings.SLOW_CALLBACK_THRESHOLD,
+        log_interval=settings.SLOW_CALLBACK_LOG_INTERVAL,
+    )
@@ -0,0 +1,80 @@
+"""This file contains the cancellation of the work of abandoned requests.
+
+A blocking request whose client hung up would otherwise keep its agent run
+going to the end, burning tokens, a concurrency slot, the session lock and
+database connections for an answer nobody reads. The run is raced against the
+disconnection of the client and cancelled if the client leaves first.
+"""
+
+import asyncio
+from typing import (
+    Awaitable,
+    TypeVar,
+)
+
+from fastapi import Request
+
+from core.logging import logger
+from core.metrics import runs_cancelled_total
+
+T = TypeVar("T")
+
+
+class ClientDisconnectedError(Exception):
+    """Raised when the client of a request disconnected before its response was ready."""
+
+    def __init__(self):
+        """Initialize the error."""
+        super().__init__("The client closed the request")
+
+
+async def wait_for_disconnect(request: Request) -> None:
+    """Return once the client of a request has disconnected.
+
+    The body must have been read already: the only message left to receive is
+    then the disconnection.
+
+    Args:
+        request: The request.
+    """
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T], endpoint: str) -> T:
+    """Await some work, cancelling it if the client of the request disconnects first.
+
+    Args:
+        request: The request the work answers.
+        awaitable: The work.
+        endpoint: The endpoint serving the request, used as metric label.
+
+    Returns:
+        T: The result of the work.
+
+    Raises:
+        ClientDisconnectedError: If the client disconnected and the work was cancelled.
+    """
+    work = asyncio.ensure_future(awaitable)
+    watcher = asyncio.create_task(wait_for_disconnect(request))
+    try:
+        await asyncio.wait((work, watcher), return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        work.cancel()
+        raise
+    finally:
+        watcher.cancel()
+
+    if work.done():
+        return work.result()
+    if watcher.exception() is not None:
+        # Disconnections cannot be detected, the work runs to the end
+        logger.warning("disconnect_detection_failed", endpoint=endpoint, error=str(watcher.exception()))
+        return await work
+
+    work.cancel()
+    # Let the work unwind, releasing its slot, lock and connections, before answering
+    await asyncio.gather(work, return_exceptions=True)
+    runs_cancelled_total.labels(endpoint=endpoint).inc()
+    logger.info("run_cancelled_on_disconnect", endpoint=endpoint)
+    raise ClientDisconnectedError()
@@ -0,0 +1,145 @@
+"""This file contains the shared HTTP client of the application.
+
+Every model client created by the agent sends its requests through one
+process-wide async HTTP client, so they share one pool of keep-alive
+connections to the LLM provider instead of each opening its own. Idle
+connections are kept long enough to survive the gaps between bursts of
+traffic, and HTTP/2 multiplexes concurrent completions over few connections,
+so the TCP and TLS handshakes stay off the request path.
+
+The pool is exported as metrics: active and idle connections, requests in
+flight, and the time spent in TCP connects and TLS handshakes, which only
+grows when a connection had to be opened.
+"""
+
+import importlib.util
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Optional,
+)
+
+import httpx
+
+from core.config import settings
+from core.logging import logger
+from core.metrics import (
+    http_client_connect_seconds,
+    http_client_connections,
+    http_client_requests_in_flight,
+)
+
+# httpcore trace events timing the opening of a connection, by phase
+_CONNECT_PHASES = {"connection.connect_tcp": "tcp", "connection.start_tls": "tls"}
+
+TraceCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """Connection pooling transport exporting the state of its pool as metrics."""
+
+    def __init__(self, name: str, **kwargs: Any):
+        """Initialize the transport.
+
+        Args:
+            name: The name of the client, used as metric label.
+            **kwargs: The arguments of `httpx.AsyncHTTPTransport`.
+        """
+        super().__init__(**kwargs)
+        self.name = name
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send a request, timing the connection it opens if any."""
+        request.extensions["trace"] = self._tracer(request.extensions.get("trace"))
+        http_client_requests_in_flight.labels(client=self.name).inc()
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            http_client_requests_in_flight.labels(client=self.name).dec()
+            self._update_gauges()
+
+    def _tracer(self, trace: Optional[TraceCallback]) -> TraceCallback:
+        """Create the trace callback of a request, chained to the one already set if any."""
+        started: Dict[str, float] = {}
+
+        async def on_event(event: str, info: Dict[str, Any]) -> None:
+            step, _, stage = event.rpartition(".")
+            phase = _CONNECT_PHASES.get(step)
+            if phase is not None:
+                if stage == "started":
+                    started[step] = time.perf_counter()
+                elif stage == "complete" and step in started:
+                    duration = time.perf_counter() - started.pop(step)
+                    http_client_connect_seconds.labels(client=self.name, phase=phase).observe(duration)
+            elif step.endswith("response_closed") and stage == "complete":
+                # The connection went back to the pool
+                self._update_gauges()
+            if trace is not None:
+                await trace(event, info)
+
+        return on_event
+
+    def _update_gauges(self) -> None:
+        """Export the active and idle connections of the pool."""
+        connections = [connection for connection in self._pool.connections if not connection.is_closed()]
+        idle = sum(1 for connection in connections if connection.is_idle())
+        http_client_connections.labels(client=self.name, state="idle").set(idle)
+        http_client_connections.labels(client=self.name, state="active").set(len(connections) - idle)
+
+
+def create_http_client(name: str) -> httpx.AsyncClient:
+    """Create a pooled async HTTP client from the settings.
+
+    Args:
+        name: The name of the client, used as metric label.
+
+    Returns:
+        httpx.AsyncClient: The client.
+    """
+    http2 = settings.HTTP_CLIENT_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("http2_unavailable", client=name, reason="the h2 package is not installed")
+        http2 = False
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY,
+    )
+    transport = InstrumentedTransport(name, http2=http2, limits=limits)
+    logger.info(
+        "http_client_created",
+        client=name,
+        http2=http2,
+        max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(settings.HTTP_CLIENT_READ_TIMEOUT, connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT),
+    )
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the process-wide HTTP client, creating it on first use.
+
+    Returns:
+        httpx.AsyncClient: The client shared by the model clients and the tools.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client("shared")
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the connections of the process-wide HTTP client."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
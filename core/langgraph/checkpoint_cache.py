@@ -0,0 +1,428 @@
+"""This file contains an in-memory cache of hot thread checkpoints.
+
+The cache sits in front of any checkpoint saver and keeps the latest checkpoint
+of recently active threads, so consecutive turns of a session don't reload the
+whole conversation from the database. Writes always go to the wrapped saver
+first (write-through) and the cache is only ever moved forward to a newer
+checkpoint id, never backwards. Entries keep the checkpoint objects the wrapped
+saver was given or returned, so the cache never serializes a checkpoint itself.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    copy_checkpoint,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from psycopg_pool import AsyncConnectionPool
+
+from core.logging import logger
+from core.metrics import (
+    checkpoint_cache_bytes,
+    checkpoint_cache_entries,
+    checkpoint_cache_evictions_total,
+    checkpoint_cache_requests_total,
+)
+
+VersionProbe = Callable[[str, str], Awaitable[Optional[str]]]
+
+# Nesting depth past which a value is no longer walked when estimating its size
+_MAX_SIZE_DEPTH = 32
+
+
+@dataclass
+class _CacheEntry:
+    """A checkpoint held in the cache."""
+
+    checkpoint_id: str
+    parent_checkpoint_id: Optional[str]
+    checkpoint: Checkpoint
+    metadata: CheckpointMetadata
+    size: int
+    # Monotonic time the entry was last written through the saver or checked against the store
+    validated_at: float
+
+
+def _estimate_size(value: Any, depth: int = 0) -> int:
+    """Approximate the size of a checkpoint value without serializing it.
+
+    Args:
+        value: The value to measure.
+        depth: The nesting depth of the value.
+
+    Returns:
+        int: The total length of the strings and bytes held by the value.
+    """
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if depth >= _MAX_SIZE_DEPTH:
+        return 8
+    if isinstance(value, dict):
+        return sum(_estimate_size(k, depth + 1) + _estimate_size(v, depth + 1) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sum(_estimate_size(v, depth + 1) for v in value)
+    if hasattr(value, "__dict__"):
+        return _estimate_size(vars(value), depth + 1)
+    return 8
+
+
+def postgres_version_probe(pool: AsyncConnectionPool) -> VersionProbe:
+    """Build a probe returning the latest checkpoint id of a thread in Postgres.
+
+    The probe only touches the primary key index of the checkpoints table, which
+    is much cheaper than loading the checkpoint with its blobs and writes.
+
+    Args:
+        pool: The connection pool used by the checkpointer.
+
+    Returns:
+        VersionProbe: Coroutine function taking (thread_id, checkpoint_ns).
+    """
+
+    async def probe(thread_id: str, checkpoint_ns: str) -> Optional[str]:
+        async with pool.connection() as conn:
+            cursor = await conn.execute(
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = %s AND checkpoint_ns = %s "
+                "ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id, checkpoint_ns),
+            )
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+    return probe
+
+
+def sqlite_version_probe(saver: AsyncSqliteSaver) -> VersionProbe:
+    """Build a probe returning the latest checkpoint id of a thread in SQLite.
+
+    The probe shares the connection of the checkpointer, so it holds the saver
+    lock like every query of the saver does.
+
+    Args:
+        saver: The SQLite checkpointer.
+
+    Returns:
+        VersionProbe: Coroutine function taking (thread_id, checkpoint_ns).
+    """
+
+    async def probe(thread_id: str, checkpoint_ns: str) -> Optional[str]:
+        async with saver.lock, saver.conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT 1",
+            (thread_id, checkpoint_ns),
+        ) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+    return probe
+
+
+class CachedCheckpointSaver(BaseCheckpointSaver):
+    """Checkpoint saver keeping the latest checkpoint of hot threads in memory.
+
+    The cache is a bounded LRU keyed by (thread_id, checkpoint_ns). It is bounded
+    both by the number of threads and by the serialized size of the checkpoints.
+    Only the async API is cached; the sync API is delegated unchanged.
+    """
+
+    def __init__(
+        self,
+        saver: BaseCheckpointSaver,
+        *,
+        max_entries: int,
+        max_bytes: int,
+        version_probe: Optional[VersionProbe] = None,
+        validate_after: float = 0.0,
+    ):
+        """Initialize the cache around an existing checkpoint saver.
+
+        Args:
+            saver: The checkpoint saver holding the authoritative state.
+            max_entries: Maximum number of threads kept in the cache.
+            max_bytes: Maximum serialized size of all cached checkpoints.
+            version_probe: Optional probe used to validate a cached checkpoint is
+                still the latest one before serving it.
+            validate_after: Seconds a cached checkpoint is served without probing
+                after it was last written through this saver or validated.
+        """
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version_probe = version_probe
+        self.validate_after = validate_after
+        self._entries: "OrderedDict[Tuple[str, str], _CacheEntry]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def config_specs(self) -> list:
+        """Expose the configuration fields of the wrapped saver."""
+        return self.saver.config_specs
+
+    def get_next_version(self, current: Optional[Any], channel: Any) -> Any:
+        """Delegate channel versioning to the wrapped saver."""
+        return self.saver.get_next_version(current, channel)
+
+    @staticmethod
+    def _key(config: RunnableConfig) -> Tuple[str, str]:
+        configurable = config["configurable"]
+        return configurable["thread_id"], configurable.get("checkpoint_ns", "")
+
+    def _get(self, key: Tuple[str, str]) -> Optional[_CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key: Tuple[str, str], entry: _CacheEntry) -> None:
+        with self._lock:
+            current = self._entries.get(key)
+            # Never move a thread back to an older checkpoint
+            if current is not None and current.checkpoint_id > entry.checkpoint_id:
+                return
+            if current is not None:
+                self._size -= current.size
+                del self._entries[key]
+            if entry.size <= self.max_bytes:
+                self._entries[key] = entry
+                self._size += entry.size
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+                checkpoint_cache_evictions_total.inc()
+            self._update_gauges()
+
+    def invalidate(self, thread_id: str, checkpoint_ns: Optional[str] = None) -> None:
+        """Drop the cached checkpoints of a thread.
+
+        Args:
+            thread_id: The thread to drop.
+            checkpoint_ns: Only drop this namespace, or every namespace if None.
+        """
+        with self._lock:
+            if checkpoint_ns is not None:
+                keys = [(thread_id, checkpoint_ns)] if (thread_id, checkpoint_ns) in self._entries else []
+            else:
+                keys = [k for k in self._entries if k[0] == thread_id]
+            for key in keys:
+                self._size -= self._entries.pop(key).size
+            self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        checkpoint_cache_entries.set(len(self._entries))
+        checkpoint_cache_bytes.set(self._size)
+
+    def _to_tuple(self, key: Tuple[str, str], entry: _CacheEntry) -> CheckpointTuple:
+        thread_id, checkpoint_ns = key
+        return CheckpointTuple(
+            {
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": entry.checkpoint_id,
+                }
+            },
+            copy_checkpoint(entry.checkpoint),
+            dict(entry.metadata),
+            (
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": entry.parent_checkpoint_id,
+                    }
+                }
+                if entry.parent_checkpoint_id
+                else None
+            ),
+            [],
+        )
+
+    def _entry_from_tuple(self, checkpoint_tuple: CheckpointTuple) -> Optional[_CacheEntry]:
+        # Tuples with pending writes are mid-run state, only cache settled checkpoints
+        if checkpoint_tuple.pending_writes:
+            return None
+        parent_id = get_checkpoint_id(checkpoint_tuple.parent_config) if checkpoint_tuple.parent_config else None
+        return self._make_entry(checkpoint_tuple.checkpoint, checkpoint_tuple.metadata, parent_id)
+
+    @staticmethod
+    def _make_entry(
+        checkpoint: Checkpoint, metadata: CheckpointMetadata, parent_checkpoint_id: Optional[str]
+    ) -> _CacheEntry:
+        # The wrapped saver already serialized the checkpoint, keep the object instead of a second copy in bytes
+        checkpoint = copy_checkpoint(checkpoint)
+        return _CacheEntry(
+            checkpoint_id=checkpoint["id"],
+            parent_checkpoint_id=parent_checkpoint_id,
+            checkpoint=checkpoint,
+            metadata=dict(metadata),
+            size=_estimate_size(checkpoint["channel_values"]) + _estimate_size(metadata),
+            validated_at=time.monotonic(),
+        )
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Fetch a checkpoint tuple, serving the latest checkpoint from the cache when valid.
+
+        Args:
+            config: Configuration specifying which checkpoint to retrieve.
+
+        Returns:
+            Optional[CheckpointTuple]: The requested checkpoint tuple, or None if not found.
+        """
+        key = self._key(config)
+        checkpoint_id = get_checkpoint_id(config)
+        entry = self._get(key)
+
+        if entry is not None and (checkpoint_id is None or checkpoint_id == entry.checkpoint_id):
+            latest_id = entry.checkpoint_id
+            # Entries written or validated recently are trusted, aput and aput_writes keep them current
+            if (
+                checkpoint_id is None
+                and self.version_probe is not None
+                and time.monotonic() - entry.validated_at >= self.validate_after
+            ):
+                latest_id = await self.version_probe(*key)
+                if latest_id == entry.checkpoint_id:
+                    entry.validated_at = time.monotonic()
+            if latest_id == entry.checkpoint_id:
+                checkpoint_cache_requests_total.labels(result="hit").inc()
+                return self._to_tuple(key, entry)
+            checkpoint_cache_requests_total.labels(result="stale").inc()
+            logger.debug(
+                "checkpoint_cache_stale",
+                thread_id=key[0],
+                cached_checkpoint_id=entry.checkpoint_id,
+                latest_checkpoint_id=latest_id,
+            )
+            self.invalidate(*key)
+        else:
+            checkpoint_cache_requests_total.labels(result="miss").inc()
+
+        checkpoint_tuple = await self.saver.aget_tuple(config)
+        if checkpoint_tuple is not None and checkpoint_id is None:
+            new_entry = self._entry_from_tuple(checkpoint_tuple)
+            if new_entry is not None:
+                self._store(key, new_entry)
+        return checkpoint_tuple
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """List checkpoints from the wrapped saver."""
+        async for checkpoint_tuple in self.saver.alist(config, filter=filter, before=before, limit=limit):
+            yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Store a checkpoint in the wrapped saver, then in the cache.
+
+        Args:
+            config: Configuration for the checkpoint.
+            checkpoint: The checkpoint to store.
+            metadata: Additional metadata for the checkpoint.
+            new_versions: New channel versions as of this write.
+
+        Returns:
+            RunnableConfig: Updated configuration after storing the checkpoint.
+        """
+        next_config = await self.saver.aput(config, checkpoint, metadata, new_versions)
+        self._store(
+            self._key(config),
+            self._make_entry(checkpoint, get_checkpoint_metadata(config, metadata), get_checkpoint_id(config)),
+        )
+        return next_config
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Store intermediate writes in the wrapped saver and drop the cached checkpoint they belong to."""
+        await self.saver.aput_writes(config, writes, task_id, task_path)
+        key = self._key(config)
+        entry = self._get(key)
+        if entry is not None and entry.checkpoint_id == get_checkpoint_id(config):
+            self.invalidate(*key)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """Delete a thread from the wrapped saver and from the cache."""
+        self.invalidate(thread_id)
+        await self.saver.adelete_thread(thread_id)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Fetch a checkpoint tuple from the wrapped saver."""
+        return self.saver.get_tuple(config)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """List checkpoints from the wrapped saver."""
+        return self.saver.list(config, filter=filter, before=before, limit=limit)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Store a checkpoint in the wrapped saver, invalidating the cached thread."""
+        self.invalidate(*self._key(config))
+        return self.saver.put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Store intermediate writes in the wrapped saver, invalidating the cached thread."""
+        self.invalidate(*self._key(config))
+        self.saver.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete a thread from the wrapped saver and from the cache."""
+        self.invalidate(thread_id)
+        self.saver.delete_thread(thread_id)
@@ -0,0 +1,310 @@
+"""This file contains the checkpointer backends for the LangGraph agent.
+
+Every backend exposes the same `BaseCheckpointSaver` interface, so the graph
+behaves identically whether its state lives in Postgres, in a local SQLite file
+or in process memory.
+"""
+
+import asyncio
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import aiosqlite
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from psycopg_pool import AsyncConnectionPool
+
+from core.config import (
+    CheckpointerBackend,
+    settings,
+)
+from core.deadline import (
+    DeadlineExceededError,
+    get_deadline,
+)
+from core.langgraph.checkpoint_cache import (
+    CachedCheckpointSaver,
+    VersionProbe,
+    postgres_version_probe,
+    sqlite_version_probe,
+)
+from core.logging import logger
+from core.timing import timed
+
+
+class TimedCheckpointSaver(BaseCheckpointSaver):
+    """Checkpoint saver recording its async reads and writes as request timing spans."""
+
+    def __init__(self, saver: BaseCheckpointSaver):
+        """Initialize the wrapper.
+
+        Args:
+            saver: The checkpoint saver to time.
+        """
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+
+    @property
+    def config_specs(self) -> list:
+        """Expose the configuration fields of the wrapped saver."""
+        return self.saver.config_specs
+
+    def get_next_version(self, current: Optional[Any], channel: Any) -> Any:
+        """Delegate channel versioning to the wrapped saver."""
+        return self.saver.get_next_version(current, channel)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Fetch a checkpoint tuple from the wrapped saver, within the deadline of the run if any.
+
+        Writes are not cut off by the deadline: they save steps already paid for.
+        """
+        deadline = get_deadline(config)
+        with timed("checkpoint_read"):
+            if deadline is None:
+                return await self.saver.aget_tuple(config)
+            try:
+                return await deadline.run(self.saver.aget_tuple(config))
+            except asyncio.TimeoutError:
+                raise DeadlineExceededError(deadline.budget)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """List checkpoints from the wrapped saver."""
+        async for checkpoint_tuple in self.saver.alist(config, filter=filter, before=before, limit=limit):
+            yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Store a checkpoint in the wrapped saver."""
+        with timed("checkpoint_write"):
+            return await self.saver.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Store intermediate writes in the wrapped saver."""
+        with timed("checkpoint_write"):
+            await self.saver.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """Delete a thread from the wrapped saver."""
+        with timed("checkpoint_write"):
+            await self.saver.adelete_thread(thread_id)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Fetch a checkpoint tuple from the wrapped saver."""
+        return self.saver.get_tuple(config)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """List checkpoints from the wrapped saver."""
+        return self.saver.list(config, filter=filter, before=before, limit=limit)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Store a checkpoint in the wrapped saver."""
+        return self.saver.put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Store intermediate writes in the wrapped saver."""
+        self.saver.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete a thread from the wrapped saver."""
+        self.saver.delete_thread(thread_id)
+
+
+async def create_postgres_checkpointer(connection_pool: AsyncConnectionPool) -> AsyncPostgresSaver:
+    """Create a Postgres checkpointer on top of an open connection pool.
+
+    Args:
+        connection_pool: The connection pool to use.
+
+    Returns:
+        AsyncPostgresSaver: The checkpointer with its tables set up.
+    """
+    checkpointer = AsyncPostgresSaver(connection_pool)
+    await checkpointer.setup()
+    return checkpointer
+
+
+def create_replica_checkpointer(connection_pool: AsyncConnectionPool) -> BaseCheckpointSaver:
+    """Create a read-only Postgres checkpointer on the pool of a replica.
+
+    The tables are set up through the primary, and the hot-thread cache is
+    left to the checkpointer of the primary, which sees every write.
+
+    Args:
+        connection_pool: The connection pool of the replica.
+
+    Returns:
+        BaseCheckpointSaver: The checkpointer, for reads only.
+    """
+    return TimedCheckpointSaver(AsyncPostgresSaver(connection_pool))
+
+
+async def create_sqlite_checkpointer(path: str) -> AsyncSqliteSaver:
+    """Create a SQLite checkpointer in WAL mode.
+
+    Args:
+        path: Path of the database file, or ":memory:".
+
+    Returns:
+        AsyncSqliteSaver: The checkpointer with its tables set up.
+    """
+    conn = await aiosqlite.connect(path)
+    checkpointer = AsyncSqliteSaver(conn)
+    # setup() switches the database to WAL; NORMAL sync is durable enough under WAL
+    await checkpointer.setup()
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    return checkpointer
+
+
+def _with_cache(checkpointer: BaseCheckpointSaver, version_probe: Optional[VersionProbe]) -> BaseCheckpointSaver:
+    """Wrap a checkpointer in the hot-thread cache if it is enabled."""
+    if not settings.CHECKPOINT_CACHE_ENABLED:
+        return checkpointer
+    return CachedCheckpointSaver(
+        checkpointer,
+        max_entries=settings.CHECKPOINT_CACHE_MAX_ENTRIES,
+        max_bytes=settings.CHECKPOINT_CACHE_MAX_BYTES,
+        version_probe=version_probe if settings.CHECKPOINT_CACHE_VALIDATE else None,
+        validate_after=settings.CHECKPOINT_CACHE_VALIDATE_TTL,
+    )
+
+
+async def create_checkpointer(
+    backend: CheckpointerBackend,
+    connection_pool: Optional[AsyncConnectionPool] = None,
+) -> BaseCheckpointSaver:
+    """Create the checkpointer for the configured backend.
+
+    Args:
+        backend: The backend to create.
+        connection_pool: The Postgres connection pool, required for the postgres backend.
+
+    Returns:
+        BaseCheckpointSaver: The ready to use checkpointer.
+
+    Raises:
+        ValueError: If the postgres backend is requested without a connection pool.
+    """
+    match backend:
+        case CheckpointerBackend.POSTGRES:
+            if connection_pool is None:
+                raise ValueError("The postgres checkpointer backend requires a connection pool")
+            checkpointer = _with_cache(
+                await create_postgres_checkpointer(connection_pool),
+                postgres_version_probe(connection_pool),
+            )
+        case CheckpointerBackend.SQLITE:
+            sqlite_checkpointer = await create_sqlite_checkpointer(settings.SQLITE_CHECKPOINT_PATH)
+            checkpointer = _with_cache(sqlite_checkpointer, sqlite_version_probe(sqlite_checkpointer))
+        case CheckpointerBackend.MEMORY:
+            # Already in memory, a cache in front of it would only copy the state
+            checkpointer = InMemorySaver()
+
+    logger.info(
+        "checkpointer_created",
+        backend=backend.value,
+        cached=isinstance(checkpointer, CachedCheckpointSaver),
+        environment=settings.ENVIRONMENT.value,
+    )
+    return TimedCheckpointSaver(checkpointer)
+
+
+async def close_checkpointer(checkpointer: BaseCheckpointSaver) -> None:
+    """Close the connection owned by a checkpointer created by `create_checkpointer`.
+
+    The Postgres pool is owned by the caller and is left open.
+
+    Args:
+        checkpointer: The checkpointer to close.
+    """
+    checkpointer = _unwrap(checkpointer)
+    if isinstance(checkpointer, AsyncSqliteSaver):
+        # The aiosqlite worker thread would otherwise keep the process alive
+        await checkpointer.conn.close()
+
+
+def checkpoint_tables(checkpointer: BaseCheckpointSaver) -> Tuple[str, ...]:
+    """Return the Postgres tables of a checkpointer created by `create_checkpointer`.
+
+    Args:
+        checkpointer: The checkpointer.
+
+    Returns:
+        Tuple[str, ...]: The tables, empty if the checkpointer is not backed by Postgres.
+    """
+    if isinstance(_unwrap(checkpointer), AsyncPostgresSaver):
+        return tuple(settings.CHECKPOINT_TABLES)
+    return ()
+
+
+def forget_threads(checkpointer: BaseCheckpointSaver, thread_ids: Sequence[str]) -> None:
+    """Drop threads deleted directly in the database from the cache of a checkpointer.
+
+    Args:
+        checkpointer: The checkpointer.
+        thread_ids: The deleted threads.
+    """
+    while isinstance(checkpointer, (TimedCheckpointSaver, CachedCheckpointSaver)):
+        if isinstance(checkpointer, CachedCheckpointSaver):
+            for thread_id in thread_ids:
+                checkpointer.invalidate(thread_id)
+        checkpointer = checkpointer.saver
+
+
+def _unwrap(checkpointer: BaseCheckpointSaver) -> BaseCheckpointSaver:
+    """Return the backend saver under the wrappers added by `create_checkpointer`."""
+    while isinstance(checkpointer, (TimedCheckpointSaver, CachedCheckpointSaver)):
+        checkpointer = checkpointer.saver
+    return checkpointer
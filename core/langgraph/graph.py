@@ -1,22 +1,39 @@
 """This file contains the LangGraph Agent/workflow and interactions with the LLM."""
 
+import asyncio
+import json
+import uuid
+from contextlib import (
+    aclosing,
+    asynccontextmanager,
+)
 from typing import (
     Any,
     AsyncGenerator,
+    AsyncIterator,
     Dict,
+    List,
     Literal,
     Optional,
+    Sequence,
 )
 
-from asgiref.sync import sync_to_async
 from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
     BaseMessage,
+    ToolCall,
     ToolMessage,
     convert_to_openai_messages,
+    message_chunk_to_message,
+)
+from langchain_core.runnables import (
+    Runnable,
+    RunnableConfig,
 )
 from langchain_openai import ChatOpenAI
 from langfuse.callback import CallbackHandler
-from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import (
     END,
     StateGraph,
@@ -24,25 +41,96 @@ from langgraph.graph import (
 from langgraph.graph.state import CompiledStateGraph
 from langgraph.types import StateSnapshot
 from openai import OpenAIError
-from psycopg_pool import AsyncConnectionPool
-from core.metrics import llm_inference_duration_seconds
+from core.concurrency import (
+    chat_concurrency_limiter,
+    concurrency_slot,
+)
+from core.metrics import (
+    early_tool_calls_total,
+    llm_inference_duration_seconds,
+    llm_tokens_total,
+)
 from core.config import (
+    CheckpointerBackend,
     Environment,
     settings,
 )
+from core.langgraph.checkpointer import (
+    checkpoint_tables,
+    close_checkpointer,
+    create_checkpointer,
+    create_replica_checkpointer,
+    forget_threads,
+)
+from core.deadline import (
+    Deadline,
+    DeadlineExceededError,
+    create_deadline,
+    get_deadline,
+)
+from core.http_client import get_http_client
+from core.langgraph.router import create_model_router
+from core.langgraph.stream import StreamShaper
+from core.langgraph.run_lock import (
+    LocalRunLock,
+    create_run_lock,
+)
 from core.langgraph.tools import tools
+from core.langgraph.tools.compaction import compact_tool_output
 from core.logging import logger
-from core.prompts import SYSTEM_PROMPT
+from core.postgres import (
+    Replica,
+    SharedConnectionPool,
+    pool_manager,
+    replica_router,
+)
+from core.prompts import (
+    SYSTEM_PROMPT,
+    get_context_prompt,
+)
+from core.timing import timed
 from schemas.graph import (
     GraphState,
 )
-from schemas.chat import Message
+from schemas.chat import (
+    Message,
+    StreamEvent,
+)
+from services.database import DatabaseService
 from utils import (
     dump_messages,
     prepare_messages,
 )
 
 
+# Roles of the state messages returned by the API
+_API_ROLES = {"human": "user", "ai": "assistant"}
+
+# Answer of a run out of time whose model still asked for a tool
+_NO_TIME_ANSWER = "I ran out of time before I could finish looking into this, please ask again."
+
+
+class CheckpointConflictError(Exception):
+    """Raised when a delta request expects a checkpoint that is no longer the latest one."""
+
+    def __init__(self, expected_checkpoint_id: str, current_checkpoint_id: Optional[str]):
+        """Initialize the error.
+
+        Args:
+            expected_checkpoint_id: The checkpoint id sent by the client.
+            current_checkpoint_id: The latest checkpoint id of the session.
+        """
+        super().__init__(
+            f"Expected checkpoint {expected_checkpoint_id}, the latest checkpoint is {current_checkpoint_id}"
+        )
+        self.expected_checkpoint_id = expected_checkpoint_id
+        self.current_checkpoint_id = current_checkpoint_id
+
+
+class CheckpointerUnavailableError(Exception):
+    """Raised when the shared checkpointer is down and the in-memory one would split sessions across workers."""
+
+
 class LangGraphAgent:
     """Manages the LangGraph Agent/workflow and interactions with the LLM.
 
@@ -52,20 +140,49 @@ class LangGraphAgent:
 
     def __init__(self):
         """Initialize the LangGraph Agent with necessary components."""
+        # One client per model tier, each turn is routed to one of them
+        self.router = create_model_router()
+        self.llms = {tier: self._create_llm(model) for tier, model in self.router.tiers.items()}
+        self.tools_by_name = {tool.name: tool for tool in tools}
+        self._connection_pool: Optional[SharedConnectionPool] = None
+        self._checkpointer: Optional[BaseCheckpointSaver] = None
+        self._graph: Optional[CompiledStateGraph] = None
+        # Concurrent first requests would otherwise each build a graph and a checkpointer
+        self._graph_lock = asyncio.Lock()
+        # Serializes the runs of each session, replaced to match the checkpointer backend
+        self._run_lock = LocalRunLock(settings.RUN_LOCK_TIMEOUT)
+        # Graphs reading the checkpoints of a replica, by replica name
+        self._replica_graphs: Dict[str, CompiledStateGraph] = {}
+        # Tool calls started while the model was streaming, by session and tool call ID,
+        # joined by the tool_call node and dropped when the run of the session ends
+        self._early_tool_calls: Dict[str, Dict[str, asyncio.Task]] = {}
+
+        logger.info("llm_initialized", model=settings.LLM_MODEL, tiers=self.router.tiers,
+                    environment=settings.ENVIRONMENT.value)
+
+    def _create_llm(self, model: str) -> Runnable:
+        """Create the client of a model, with the tools bound.
+
+        Args:
+            model (str): The model name.
+
+        Returns:
+            Runnable: The LLM client.
+        """
+        http_client = get_http_client()
         # Use environment-specific LLM model
-        self.llm = ChatOpenAI(
-            model=settings.LLM_MODEL,
+        return ChatOpenAI(
+            model=model,
             temperature=settings.DEFAULT_LLM_TEMPERATURE,
             api_key=settings.LLM_API_KEY,
             max_tokens=settings.MAX_TOKENS,
+            # Every tier shares the connections of the process-wide client
+            http_async_client=http_client,
+            timeout=http_client.timeout,
+            # Report the token usage, including cached tokens, when streaming too
+            stream_usage=True,
             **self._get_model_kwargs(),
         ).bind_tools(tools)
-        self.tools_by_name = {tool.name: tool for tool in tools}
-        self._connection_pool: Optional[AsyncConnectionPool] = None
-        self._graph: Optional[CompiledStateGraph] = None
-
-        logger.info("llm_initialized", model=settings.LLM_MODEL,
-                    environment=settings.ENVIRONMENT.value)
 
     def _get_model_kwargs(self) -> Dict[str, Any]:
         """Get environment-specific model kwargs.
@@ -87,30 +204,15 @@ class LangGraphAgent:
 
         return model_kwargs
 
-    async def _get_connection_pool(self) -> AsyncConnectionPool:
-        """Get a PostgreSQL connection pool using environment-specific settings.
+    async def _get_connection_pool(self) -> Optional[SharedConnectionPool]:
+        """Get the Postgres connection pool shared with the model layer.
 
         Returns:
-            AsyncConnectionPool: A connection pool for PostgreSQL database.
+            Optional[SharedConnectionPool]: The pool, None in production if it could not be opened.
         """
         if self._connection_pool is None:
             try:
-                # Configure pool size based on environment
-                max_size = settings.POSTGRES_POOL_SIZE
-
-                self._connection_pool = AsyncConnectionPool(
-                    settings.POSTGRES_URL,
-                    open=False,
-                    max_size=max_size,
-                    kwargs={
-                        "autocommit": True,
-                        "connect_timeout": 5,
-                        "prepare_threshold": None,
-                    },
-                )
-                await self._connection_pool.open()
-                logger.info("connection_pool_created", max_size=max_size,
-                            environment=settings.ENVIRONMENT.value)
+                self._connection_pool = await pool_manager.get_pool()
             except Exception as e:
                 logger.error("connection_pool_creation_failed", error=str(
                     e), environment=settings.ENVIRONMENT.value)
@@ -122,34 +224,116 @@ class LangGraphAgent:
                 raise e
         return self._connection_pool
 
-    async def _chat(self, state: GraphState) -> dict:
+    async def _create_checkpointer(self) -> BaseCheckpointSaver:
+        """Create the checkpointer for the configured backend.
+
+        In production a failing Postgres pool falls back to the in-memory backend
+        rather than running without a checkpointer, so conversations keep their
+        memory for the lifetime of the worker. With several workers the
+        fallback would give each of them its own history of a session and an
+        unshared run lock, so the graph is not created until the pool is back.
+
+        Returns:
+            BaseCheckpointSaver: The checkpointer used by the graph.
+
+        Raises:
+            CheckpointerUnavailableError: If the pool is down and the server has several workers.
+        """
+        backend = settings.CHECKPOINTER_BACKEND
+        connection_pool = None
+        if backend == CheckpointerBackend.POSTGRES:
+            # May be None in production if the DB is unavailable
+            connection_pool = await self._get_connection_pool()
+            if connection_pool is None and settings.SERVER_WORKERS > 1:
+                logger.error(
+                    "checkpointer_unavailable",
+                    requested_backend=settings.CHECKPOINTER_BACKEND.value,
+                    workers=settings.SERVER_WORKERS,
+                    environment=settings.ENVIRONMENT.value,
+                )
+                raise CheckpointerUnavailableError("The conversation store is unavailable, retry later")
+            if connection_pool is None:
+                backend = CheckpointerBackend.MEMORY
+                logger.error(
+                    "checkpointer_fallback",
+                    requested_backend=settings.CHECKPOINTER_BACKEND.value,
+                    backend=backend.value,
+                    environment=settings.ENVIRONMENT.value,
+                )
+
+        self._checkpointer = await create_checkpointer(backend, connection_pool)
+        # Runs must be serialized wherever the checkpoints are shared
+        self._run_lock = await create_run_lock(
+            pool_manager if connection_pool is not None else None, settings.RUN_LOCK_TIMEOUT
+        )
+        return self._checkpointer
+
+    async def _chat(self, state: GraphState, config: RunnableConfig) -> dict:
         """Process the chat state and generate a response.
 
         Args:
             state (GraphState): The current state of the conversation.
+            config (RunnableConfig): The run config, holding the model tier of the turn.
 
         Returns:
             dict: Updated state with new messages.
         """
-        messages = prepare_messages(state.messages, self.llm, SYSTEM_PROMPT)
+        tier = config["configurable"].get("model_tier") or self.router.default_tier
+        llm = self.llms[tier]
+        # The clients of the tiers are shared, a fallback model is only bound to the calls of this turn
+        base_model: Runnable = llm
+        model_name = llm.model_name
+        deadline = get_deadline(config)
+        with timed("prepare_messages"):
+            messages = prepare_messages(state.messages, llm, SYSTEM_PROMPT, get_context_prompt())
 
         llm_calls_num = 0
 
         # Configure retry attempts based on environment
         max_retries = settings.MAX_LLM_CALL_RETRIES
 
-        for attempt in range(max_retries):
+        attempt = 0
+        while attempt < max_retries:
+            # In the reserve of its deadline, the run answers with what it has instead of calling more tools
+            final_answer = deadline is not None and deadline.must_answer()
+            model = base_model.bind(tool_choice="none") if final_answer else base_model
             try:
-                with llm_inference_duration_seconds.labels(model=self.llm.model_name).time():
-                    generated_state = {"messages": [await self.llm.ainvoke(dump_messages(messages))]}
+                if final_answer or not settings.EARLY_TOOL_EXECUTION_ENABLED:
+                    generation = model.ainvoke(messages)
+                else:
+                    generation = self._stream_with_early_tools(model, messages, state.session_id, deadline)
+                with timed("llm"), llm_inference_duration_seconds.labels(model=model_name).time():
+                    if deadline is None:
+                        response = await generation
+                    else:
+                        # The retries of the SDK and their backoff sleeps happen within this budget
+                        budget = deadline.remaining() if final_answer else deadline.working_time()
+                        response = await deadline.run(generation, budget)
+                token_usage = self._record_token_usage(model_name, response)
                 logger.info(
                     "llm_response_generated",
                     session_id=state.session_id,
                     llm_calls_num=llm_calls_num + 1,
-                    model=settings.LLM_MODEL,
+                    model=model_name,
+                    model_tier=tier,
+                    final_answer=final_answer,
                     environment=settings.ENVIRONMENT.value,
+                    **token_usage,
                 )
-                return generated_state
+                if final_answer:
+                    response = self._without_tool_calls(response)
+                return {"messages": [response]}
+            except asyncio.TimeoutError:
+                if final_answer:
+                    logger.error("llm_deadline_exceeded", session_id=state.session_id, budget=deadline.budget)
+                    raise DeadlineExceededError(deadline.budget)
+                logger.warning("llm_call_timed_out", session_id=state.session_id, model=model_name)
+                llm_calls_num += 1
+                # Past the working time of a deadline the next call is the final answer, so only
+                # a timeout without a deadline counts as an attempt
+                if deadline is None:
+                    attempt += 1
+                continue
             except OpenAIError as e:
                 logger.error(
                     "llm_call_failed",
@@ -167,33 +351,159 @@ class LangGraphAgent:
                     logger.warning(
                         "using_fallback_model", model=fallback_model, environment=settings.ENVIRONMENT.value
                     )
-                    self.llm.model_name = fallback_model
+                    base_model = llm.bind(model=fallback_model)
+                    model_name = fallback_model
 
+                attempt += 1
                 continue
 
         raise Exception(
             f"Failed to get a response from the LLM after {max_retries} attempts")
 
+    async def _stream_with_early_tools(
+        self, model: Runnable, messages: list, session_id: str, deadline: Optional[Deadline]
+    ) -> AIMessage:
+        """Stream the response of the model, starting each tool call as soon as its arguments are complete.
+
+        The arguments of a tool call are complete once they parse as a JSON
+        object, since no strict prefix of an object does. The tools then run
+        while the model is still generating the rest of its message, and the
+        tool_call node joins them instead of starting them.
+
+        Args:
+            model (Runnable): The model client.
+            messages (list): The prompt.
+            session_id (str): The session of the run.
+            deadline (Optional[Deadline]): The deadline of the run, if any.
+
+        Returns:
+            AIMessage: The full response of the model.
+        """
+        response: Optional[AIMessageChunk] = None
+        started: Dict[str, asyncio.Task] = {}
+        try:
+            async for chunk in model.astream(messages):
+                response = chunk if response is None else response + chunk
+                for tool_call_chunk in response.tool_call_chunks:
+                    tool_call_id, name = tool_call_chunk.get("id"), tool_call_chunk.get("name")
+                    if not tool_call_id or tool_call_id in started or name not in self.tools_by_name:
+                        continue
+                    try:
+                        args = json.loads(tool_call_chunk.get("args") or "")
+                    except ValueError:
+                        continue
+                    if isinstance(args, dict):
+                        tool_call = ToolCall(name=name, args=args, id=tool_call_id)
+                        started[tool_call_id] = asyncio.create_task(self._invoke_tool(tool_call, session_id, deadline))
+                        early_tool_calls_total.labels(tool=name).inc()
+        except BaseException:
+            # The message will not be answered, neither will its tool calls
+            for task in started.values():
+                task.cancel()
+            raise
+        if response is None:
+            raise ValueError("The model returned an empty stream")
+        self._early_tool_calls.setdefault(session_id, {}).update(started)
+        if started:
+            logger.debug("tool_calls_started_early", session_id=session_id, count=len(started))
+        return message_chunk_to_message(response)
+
+    @staticmethod
+    def _without_tool_calls(response: AIMessage) -> AIMessage:
+        """Drop the tool calls of a final answer, which has no time left to run them."""
+        if not response.tool_calls and "tool_calls" not in response.additional_kwargs:
+            return response
+        additional_kwargs = {key: value for key, value in response.additional_kwargs.items() if key != "tool_calls"}
+        return response.model_copy(
+            update={
+                "content": response.content or _NO_TIME_ANSWER,
+                "tool_calls": [],
+                "invalid_tool_calls": [],
+                "additional_kwargs": additional_kwargs,
+            }
+        )
+
+    def _record_token_usage(self, model: str, response: BaseMessage) -> Dict[str, int]:
+        """Export the token counts reported with an LLM response.
+
+        Args:
+            model (str): The model that generated the response.
+            response (BaseMessage): The LLM response.
+
+        Returns:
+            Dict[str, int]: The token counts, empty if the provider reported none.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        if not usage:
+            return {}
+        token_usage = {
+            "input_tokens": usage.get("input_tokens") or 0,
+            # Input tokens served from the provider's prompt cache
+            "cached_input_tokens": (usage.get("input_token_details") or {}).get("cache_read") or 0,
+            "output_tokens": usage.get("output_tokens") or 0,
+        }
+        llm_tokens_total.labels(model=model, type="input").inc(token_usage["input_tokens"])
+        llm_tokens_total.labels(model=model, type="cached_input").inc(token_usage["cached_input_tokens"])
+        llm_tokens_total.labels(model=model, type="output").inc(token_usage["output_tokens"])
+        return token_usage
+
+    async def _invoke_tool(self, tool_call: ToolCall, session_id: str, deadline: Optional[Deadline]) -> ToolMessage:
+        """Invoke the tool of a tool call, answering with an error if it is cut off by the deadline.
+
+        The output is compacted before it enters the prompt, the full output
+        is kept as artifact of the answer.
+
+        Args:
+            tool_call: The tool call.
+            session_id: The session of the run.
+            deadline: The deadline of the run, if any.
+
+        Returns:
+            ToolMessage: The answer to the tool call.
+        """
+        tool = self.tools_by_name[tool_call["name"]]
+        # Invoked with the tool call, the tool answers with its full output as artifact
+        invocation = tool.ainvoke({**tool_call, "type": "tool_call"})
+        try:
+            with timed("tool"):
+                if deadline is None:
+                    tool_message = await invocation
+                else:
+                    tool_message = await deadline.run(invocation, deadline.working_time())
+        except asyncio.TimeoutError:
+            logger.warning("tool_call_timed_out", session_id=session_id, tool=tool_call["name"])
+            return ToolMessage(
+                content="The tool did not answer in time.",
+                name=tool_call["name"],
+                tool_call_id=tool_call["id"],
+                status="error",
+            )
+        with timed("tool_output"):
+            return compact_tool_output(tool_message, tool_call["args"])
+
     # Define our tool node
-    async def _tool_call(self, state: GraphState) -> GraphState:
+    async def _tool_call(self, state: GraphState, config: RunnableConfig) -> GraphState:
         """Process tool calls from the last message.
 
+        Tool calls started while the model was streaming are joined, the
+        others are started now. A tool call cut off by the deadline is answered
+        with an error, so the model can still give its final answer.
+
         Args:
             state: The current agent state containing messages and tool calls.
+            config: The run config, holding the deadline of the run.
 
         Returns:
             Dict with updated messages containing tool responses.
         """
+        deadline = get_deadline(config)
         outputs = []
         for tool_call in state.messages[-1].tool_calls:
-            tool_result = await self.tools_by_name[tool_call["name"]].ainvoke(tool_call["args"])
-            outputs.append(
-                ToolMessage(
-                    content=tool_result,
-                    name=tool_call["name"],
-                    tool_call_id=tool_call["id"],
-                )
-            )
+            early_tool_call = self._early_tool_calls.get(state.session_id, {}).pop(tool_call["id"], None)
+            if early_tool_call is not None:
+                outputs.append(await early_tool_call)
+            else:
+                outputs.append(await self._invoke_tool(tool_call, state.session_id, deadline))
         return {"messages": outputs}
 
     def _should_continue(self, state: GraphState) -> Literal["end", "continue"]:
@@ -220,50 +530,44 @@ class LangGraphAgent:
         Returns:
             Optional[CompiledStateGraph]: The configured LangGraph instance or None if init fails
         """
-        if self._graph is None:
-            try:
-                graph_builder = StateGraph(GraphState)
-                graph_builder.add_node("chat", self._chat)
-                graph_builder.add_node("tool_call", self._tool_call)
-                graph_builder.add_conditional_edges(
-                    "chat",
-                    self._should_continue,
-                    {"continue": "tool_call", "end": END},
-                )
-                graph_builder.add_edge("tool_call", "chat")
-                graph_builder.set_entry_point("chat")
-                graph_builder.set_finish_point("chat")
-
-                # Get connection pool (may be None in production if DB unavailable)
-                connection_pool = await self._get_connection_pool()
-                if connection_pool:
-                    checkpointer = AsyncPostgresSaver(connection_pool)
-                    await checkpointer.setup()
-                else:
-                    # In production, proceed without checkpointer if needed
-                    checkpointer = None
-                    if settings.ENVIRONMENT != Environment.PRODUCTION:
-                        raise Exception(
-                            "Connection pool initialization failed")
-
-                self._graph = graph_builder.compile(
-                    checkpointer=checkpointer, name=f"{settings.PROJECT_NAME} Agent ({settings.ENVIRONMENT.value})"
-                )
+        async with self._graph_lock:
+            if self._graph is None:
+                try:
+                    graph_builder = StateGraph(GraphState)
+                    graph_builder.add_node("chat", self._chat)
+                    graph_builder.add_node("tool_call", self._tool_call)
+                    graph_builder.add_conditional_edges(
+                        "chat",
+                        self._should_continue,
+                        {"continue": "tool_call", "end": END},
+                    )
+                    graph_builder.add_edge("tool_call", "chat")
+                    graph_builder.set_entry_point("chat")
+                    graph_builder.set_finish_point("chat")
 
-                logger.info(
-                    "graph_created",
-                    graph_name=f"{settings.PROJECT_NAME} Agent",
-                    environment=settings.ENVIRONMENT.value,
-                    has_checkpointer=checkpointer is not None,
-                )
-            except Exception as e:
-                logger.error("graph_creation_failed", error=str(
-                    e), environment=settings.ENVIRONMENT.value)
-                # In production, we don't want to crash the app
-                if settings.ENVIRONMENT == Environment.PRODUCTION:
-                    logger.warning("continuing_without_graph")
-                    return None
-                raise e
+                    checkpointer = await self._create_checkpointer()
+
+                    self._graph = graph_builder.compile(
+                        checkpointer=checkpointer, name=f"{settings.PROJECT_NAME} Agent ({settings.ENVIRONMENT.value})"
+                    )
+
+                    logger.info(
+                        "graph_created",
+                        graph_name=f"{settings.PROJECT_NAME} Agent",
+                        environment=settings.ENVIRONMENT.value,
+                        has_checkpointer=checkpointer is not None,
+                        checkpointer=type(checkpointer).__name__,
+                    )
+                except Exception as e:
+                    logger.error("graph_creation_failed", error=str(
+                        e), environment=settings.ENVIRONMENT.value)
+                    # In production, we don't want to crash the app
+                    if settings.ENVIRONMENT == Environment.PRODUCTION and not isinstance(
+                        e, CheckpointerUnavailableError
+                    ):
+                        logger.warning("continuing_without_graph")
+                        return None
+                    raise e
 
         return self._graph
 
@@ -272,21 +576,275 @@ class LangGraphAgent:
         messages: list[Message],
         session_id: str,
         user_id: Optional[str] = None,
-    ) -> list[dict]:
+        model_tier: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> tuple[list[Message], Optional[str]]:
         """Get a response from the LLM.
 
         Args:
             messages (list[Message]): The messages to send to the LLM.
             session_id (str): The session ID for Langfuse tracking.
             user_id (Optional[str]): The user ID for Langfuse tracking.
+            model_tier (Optional[str]): The model tier requested by the client, if any.
+            deadline (Optional[Deadline]): The deadline of the turn, CHAT_DEADLINE_SECONDS from now by default.
+
+        Returns:
+            tuple[list[Message], Optional[str]]: The messages produced by this turn and
+                the id of the resulting checkpoint.
+
+        Raises:
+            DeadlineExceededError: If the turn could not answer before its deadline.
+        """
+        if self._graph is None:
+            self._graph = await self.create_graph()
+        config = self._get_run_config(
+            messages, session_id, user_id, model_tier, deadline or create_deadline(settings.CHAT_DEADLINE_SECONDS)
+        )
+        input_messages = self._with_ids(messages)
+        try:
+            async with self._hold_session(session_id):
+                response = await self._invoke_turn({"messages": input_messages, "session_id": session_id}, config)
+                # Read under the lock, a run queued behind this one would otherwise commit first
+                checkpoint_id = await self.get_checkpoint_id(session_id)
+            return self._get_produced_messages(response["messages"], input_messages), checkpoint_id
+        except Exception as e:
+            logger.error(f"Error getting response: {str(e)}")
+            raise e
+
+    async def get_delta_response(
+        self,
+        messages: list[Message],
+        session_id: str,
+        user_id: Optional[str] = None,
+        expected_checkpoint_id: Optional[str] = None,
+        model_tier: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> tuple[list[Message], Optional[str]]:
+        """Append new user messages to the stored conversation and get the reply.
+
+        Unlike `get_response`, the messages are only the new turns: the rest of
+        the conversation comes from the checkpoint, so it is neither sent again
+        nor duplicated in the state.
+
+        Args:
+            messages (list[Message]): The new user messages.
+            session_id (str): The session ID for the conversation.
+            user_id (Optional[str]): The user ID for Langfuse tracking.
+            expected_checkpoint_id (Optional[str]): The checkpoint the client last saw, if any.
+            model_tier (Optional[str]): The model tier requested by the client, if any.
+            deadline (Optional[Deadline]): The deadline of the turn, CHAT_DEADLINE_SECONDS from now by default.
 
         Returns:
-            list[dict]: The response from the LLM.
+            tuple[list[Message], Optional[str]]: The messages produced by this turn and
+                the id of the resulting checkpoint.
+
+        Raises:
+            CheckpointConflictError: If the session moved past `expected_checkpoint_id`.
+            RunLockTimeoutError: If another run on the session did not finish in time.
+            DeadlineExceededError: If the turn could not answer before its deadline.
         """
         if self._graph is None:
             self._graph = await self.create_graph()
-        config = {
-            "configurable": {"thread_id": session_id},
+
+        deadline = deadline or create_deadline(settings.CHAT_DEADLINE_SECONDS)
+        input_messages = self._with_ids(messages)
+        # Holding the run lock, no other run can land between the check and the run
+        async with self._hold_session(session_id):
+            if expected_checkpoint_id is not None:
+                current_checkpoint_id = await self.get_checkpoint_id(session_id)
+                if current_checkpoint_id != expected_checkpoint_id:
+                    raise CheckpointConflictError(expected_checkpoint_id, current_checkpoint_id)
+
+            try:
+                response = await self._invoke_turn(
+                    {"messages": input_messages, "session_id": session_id},
+                    self._get_run_config(messages, session_id, user_id, model_tier, deadline),
+                )
+            except Exception as e:
+                logger.error("delta_response_failed", session_id=session_id, error=str(e))
+                raise
+            checkpoint_id = await self.get_checkpoint_id(session_id)
+
+        return self._get_produced_messages(response["messages"], input_messages), checkpoint_id
+
+    async def get_run_response(
+        self,
+        input_messages: list[dict],
+        session_id: str,
+        user_id: Optional[str] = None,
+        model_tier: Optional[str] = None,
+    ) -> tuple[list[Message], Optional[str]]:
+        """Run a background turn, or finish it if an earlier attempt was interrupted.
+
+        The input messages carry the ids they were given on submission, so a
+        retried run can tell from the checkpoint how far the previous attempt
+        got: not started, interrupted between two steps (resumed from the last
+        checkpoint), or finished.
+
+        Args:
+            input_messages (list[dict]): The new user messages, with their ids.
+            session_id (str): The session ID for the conversation.
+            user_id (Optional[str]): The user ID for Langfuse tracking.
+            model_tier (Optional[str]): The model tier requested by the client, if any.
+
+        Returns:
+            tuple[list[Message], Optional[str]]: The messages produced by this turn and
+                the id of the resulting checkpoint.
+
+        Raises:
+            RunLockTimeoutError: If another run on the session did not finish in time.
+            DeadlineExceededError: If the attempt could not answer within RUN_DEADLINE_SECONDS.
+        """
+        if self._graph is None:
+            self._graph = await self.create_graph()
+
+        messages = [Message.model_construct(role=m["role"], content=m["content"]) for m in input_messages]
+        config = self._get_run_config(
+            messages, session_id, user_id, model_tier, create_deadline(settings.RUN_DEADLINE_SECONDS)
+        )
+        async with self._hold_session(session_id):
+            state: StateSnapshot = await self._graph.aget_state(config)
+            state_messages = state.values.get("messages", []) if state.values else []
+            started = any(message.id == input_messages[-1]["id"] for message in reversed(state_messages))
+            try:
+                if not started:
+                    response = await self._graph.ainvoke(
+                        {"messages": input_messages, "session_id": session_id}, config
+                    )
+                elif state.next:
+                    logger.info("run_resumed", session_id=session_id, next_nodes=list(state.next))
+                    # No input: continue from the last checkpoint
+                    response = await self._graph.ainvoke(None, config)
+                else:
+                    response = state.values
+            finally:
+                # An attempt stopped between the chat and tool_call nodes runs its tools again when resumed
+                self._drop_early_tool_calls(session_id)
+            checkpoint_id = await self.get_checkpoint_id(session_id)
+
+        return self._get_produced_messages(response["messages"], input_messages), checkpoint_id
+
+    async def _invoke_turn(self, graph_input: dict, config: dict) -> dict:
+        """Run the graph on the turn of a blocking request, which its client may abandon.
+
+        The checkpoints written before a cancellation are kept as they are. If
+        the turn was cancelled with tool calls pending, their results are
+        recorded as cancelled on top, so the next turn of the conversation is
+        well-formed.
+
+        Args:
+            graph_input (dict): The input of the graph.
+            config (dict): The run config.
+
+        Returns:
+            dict: The state after the turn.
+        """
+        try:
+            return await self._graph.ainvoke(graph_input, config)
+        except asyncio.CancelledError:
+            await asyncio.shield(self._cancel_pending_tool_calls(config["configurable"]["thread_id"]))
+            raise
+        finally:
+            self._drop_early_tool_calls(config["configurable"]["thread_id"])
+
+    def _drop_early_tool_calls(self, session_id: str) -> None:
+        """Cancel the tool calls a run of a session started early and the tool_call node will not join.
+
+        Args:
+            session_id (str): The session of the run.
+        """
+        started = self._early_tool_calls.pop(session_id, {})
+        for task in started.values():
+            task.cancel()
+        if started:
+            logger.info("early_tool_calls_dropped", session_id=session_id, count=len(started))
+
+    async def _cancel_pending_tool_calls(self, session_id: str) -> None:
+        """Answer the tool calls left pending by a cancelled turn with an error."""
+        # Without the deadline of the run, which may be the reason it was cancelled
+        config = {"configurable": {"thread_id": session_id}}
+        try:
+            state: StateSnapshot = await self._graph.aget_state(config)
+            messages = state.values.get("messages", []) if state.values else []
+            tool_calls = getattr(messages[-1], "tool_calls", None) if messages else None
+            if not tool_calls:
+                return
+            self._drop_early_tool_calls(session_id)
+            await self._graph.aupdate_state(
+                config,
+                {
+                    "messages": [
+                        ToolMessage(
+                            content="The tool call was cancelled.",
+                            name=tool_call["name"],
+                            tool_call_id=tool_call["id"],
+                            status="error",
+                        )
+                        for tool_call in tool_calls
+                    ]
+                },
+                as_node="tool_call",
+            )
+            logger.info("pending_tool_calls_cancelled", session_id=session_id, count=len(tool_calls))
+        except Exception as e:
+            logger.error("pending_tool_calls_cancel_failed", session_id=session_id, error=str(e))
+
+    @staticmethod
+    def _with_ids(messages: list[Message]) -> list[dict]:
+        """Dump the input messages of a run with ids, to find them in the resulting state."""
+        return [{**message, "id": str(uuid.uuid4())} for message in dump_messages(messages)]
+
+    def _get_produced_messages(self, state_messages: list[BaseMessage], input_messages: list[dict]) -> list[Message]:
+        """Get the messages a run added after its input messages.
+
+        Only this tail is converted, instead of the whole conversation.
+
+        Args:
+            state_messages (list[BaseMessage]): The messages of the state after the run.
+            input_messages (list[dict]): The input messages of the run, with ids.
+
+        Returns:
+            list[Message]: The user and assistant messages produced by the run.
+        """
+        last_id = input_messages[-1]["id"]
+        for index in range(len(state_messages) - 1, -1, -1):
+            if state_messages[index].id == last_id:
+                return self.__process_messages(state_messages[index + 1 :])
+        return self.__process_messages(state_messages)
+
+    async def get_checkpoint_id(self, session_id: str) -> Optional[str]:
+        """Get the id of the latest checkpoint of a session.
+
+        Args:
+            session_id (str): The session ID for the conversation.
+
+        Returns:
+            Optional[str]: The checkpoint id, or None if the session has no state.
+        """
+        if self._graph is None:
+            self._graph = await self.create_graph()
+        if self._checkpointer is None:
+            return None
+        checkpoint_tuple = await self._checkpointer.aget_tuple(
+            {"configurable": {"thread_id": session_id, "checkpoint_ns": ""}}
+        )
+        return checkpoint_tuple.checkpoint["id"] if checkpoint_tuple else None
+
+    def _get_run_config(
+        self,
+        messages: list[Message],
+        session_id: str,
+        user_id: Optional[str],
+        model_tier: Optional[str],
+        deadline: Deadline,
+    ) -> dict:
+        """Build the graph config of a run on a session, routing the turn to a model tier.
+
+        The deadline is not a primitive value, so it is kept out of the checkpoint metadata.
+        """
+        decision = self.router.route(messages, user_id=user_id, hint=model_tier)
+        return {
+            "configurable": {"thread_id": session_id, "model_tier": decision.tier, "deadline": deadline},
             "callbacks": [
                 CallbackHandler(
                     environment=settings.ENVIRONMENT.value,
@@ -296,56 +854,81 @@ class LangGraphAgent:
                 )
             ],
         }
-        try:
-            response = await self._graph.ainvoke(
-                {"messages": dump_messages(
-                    messages), "session_id": session_id}, config
-            )
-            return self.__process_messages(response["messages"])
-        except Exception as e:
-            logger.error(f"Error getting response: {str(e)}")
-            raise e
 
     async def get_stream_response(
-        self, messages: list[Message], session_id: str, user_id: Optional[str] = None
-    ) -> AsyncGenerator[str, None]:
+        self,
+        messages: list[Message],
+        session_id: str,
+        user_id: Optional[str] = None,
+        model_tier: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> AsyncGenerator[StreamEvent, None]:
         """Get a stream response from the LLM.
 
         Args:
             messages (list[Message]): The messages to send to the LLM.
             session_id (str): The session ID for the conversation.
             user_id (Optional[str]): The user ID for the conversation.
+            model_tier (Optional[str]): The model tier requested by the client, if any.
+            deadline (Optional[Deadline]): The deadline of the turn, CHAT_DEADLINE_SECONDS from now by default.
 
         Yields:
-            str: Tokens of the LLM response.
+            StreamEvent: Frames of the answer and tool call events, then "done".
         """
-        config = {
-            "configurable": {"thread_id": session_id},
-            "callbacks": [
-                CallbackHandler(
-                    environment=settings.ENVIRONMENT.value, debug=False, user_id=user_id, session_id=session_id
-                )
-            ],
-        }
+        config = self._get_run_config(
+            messages, session_id, user_id, model_tier, deadline or create_deadline(settings.CHAT_DEADLINE_SECONDS)
+        )
         if self._graph is None:
             self._graph = await self.create_graph()
 
+        shaper = StreamShaper(settings.STREAM_FRAME_MAX_CHARS, settings.STREAM_FRAME_WINDOW_MS / 1000)
         try:
-            async for token, _ in self._graph.astream(
-                {"messages": dump_messages(messages), "session_id": session_id}, config, stream_mode="messages"
-            ):
+            async with concurrency_slot(chat_concurrency_limiter), self._hold_session(session_id):
+                chunks = self._graph.astream(
+                    {"messages": dump_messages(messages), "session_id": session_id}, config, stream_mode="messages"
+                )
                 try:
-                    yield token.content
-                except Exception as token_error:
-                    logger.error("Error processing token", error=str(
-                        token_error), session_id=session_id)
-                    # Continue with next token even if current one fails
-                    continue
+                    async with aclosing(shaper.shape(chunks)) as events:
+                        async for event in events:
+                            yield event
+                except (asyncio.CancelledError, GeneratorExit):
+                    # The client went away mid-stream
+                    await asyncio.shield(self._cancel_pending_tool_calls(session_id))
+                    raise
+                finally:
+                    self._drop_early_tool_calls(session_id)
+            yield StreamEvent(type="done")
         except Exception as stream_error:
             logger.error("Error in stream processing", error=str(
                 stream_error), session_id=session_id)
             raise stream_error
 
+    async def _read_messages(self, session_id: str) -> list[BaseMessage]:
+        """Read the state messages of a session, from a replica if one is fresh enough.
+
+        Args:
+            session_id (str): The session ID for the conversation.
+
+        Returns:
+            list[BaseMessage]: The state messages, empty for a new session.
+        """
+        if self._graph is None:
+            self._graph = await self.create_graph()
+
+        config = {"configurable": {"thread_id": session_id}}
+        replica = replica_router.route(session_id) if self._connection_pool is not None else None
+        if replica is not None:
+            try:
+                state: StateSnapshot = await (await self._get_replica_graph(replica)).aget_state(config)
+                if state.values:
+                    return state.values["messages"]
+                replica_router.fall_back(replica)
+            except Exception as e:
+                replica_router.fall_back(replica, e)
+
+        state = await self._graph.aget_state(config)
+        return state.values["messages"] if state.values else []
+
     async def get_chat_history(self, session_id: str) -> list[Message]:
         """Get the chat history for a given thread ID.
 
@@ -355,22 +938,65 @@ class LangGraphAgent:
         Returns:
             list[Message]: The chat history.
         """
-        if self._graph is None:
-            self._graph = await self.create_graph()
+        return self.__process_messages(await self._read_messages(session_id))
 
-        state: StateSnapshot = await sync_to_async(self._graph.get_state)(
-            config={"configurable": {"thread_id": session_id}}
-        )
-        return self.__process_messages(state.values["messages"]) if state.values else []
+    async def get_tool_output(self, session_id: str, tool_call_id: str) -> Optional[ToolMessage]:
+        """Get the answer to a tool call of a session, with the full output kept out of the prompt.
+
+        Args:
+            session_id (str): The session ID for the conversation.
+            tool_call_id (str): The ID of the tool call.
+
+        Returns:
+            Optional[ToolMessage]: The answer, None if the session has no such tool call.
+        """
+        for message in reversed(await self._read_messages(session_id)):
+            if isinstance(message, ToolMessage) and message.tool_call_id == tool_call_id:
+                return message
+        return None
+
+    async def _get_replica_graph(self, replica: Replica) -> CompiledStateGraph:
+        """Get the graph reading its checkpoints from a replica.
+
+        Args:
+            replica: The replica to read from.
+
+        Returns:
+            CompiledStateGraph: The graph, for reads only.
+        """
+        graph = self._replica_graphs.get(replica.name)
+        if graph is None:
+            checkpointer = create_replica_checkpointer(await replica.pool_manager.get_pool())
+            graph = self._replica_graphs[replica.name] = self._graph.copy(update={"checkpointer": checkpointer})
+        return graph
+
+    @asynccontextmanager
+    async def _hold_session(self, session_id: str) -> AsyncIterator[None]:
+        """Hold the run lock of a session, whose reads stay on the primary after the run."""
+        async with self._run_lock.hold(session_id):
+            try:
+                yield
+            finally:
+                # The replicas may not have the checkpoints written by the run yet
+                replica_router.mark_written(session_id)
 
     def __process_messages(self, messages: list[BaseMessage]) -> list[Message]:
-        openai_style_messages = convert_to_openai_messages(messages)
-        # keep just assistant and user messages
-        return [
-            Message(**message)
-            for message in openai_style_messages
-            if message["role"] in ["assistant", "user"] and message["content"]
-        ]
+        """Convert state messages to API messages, keeping just assistant and user messages.
+
+        The contents come from the checkpoint or the LLM, not from a client, so
+        the messages are built without running the request validators.
+        """
+        processed = []
+        for message in messages:
+            role = _API_ROLES.get(message.type)
+            if role is None:
+                continue
+            content = message.content
+            if not isinstance(content, str):
+                content = convert_to_openai_messages(message)["content"]
+            if content and isinstance(content, str):
+                processed.append(Message.model_construct(role=role, content=content))
+        return processed
 
     async def clear_chat_history(self, session_id: str) -> None:
         """Clear all chat history for a given thread ID.
@@ -382,20 +1008,54 @@ class LangGraphAgent:
             Exception: If there's an error clearing the chat history.
         """
         try:
-            # Make sure the pool is initialized in the current event loop
-            conn_pool = await self._get_connection_pool()
-
-            # Use a new connection for this specific operation
-            async with conn_pool.connection() as conn:
-                for table in settings.CHECKPOINT_TABLES:
-                    try:
-                        await conn.execute(f"DELETE FROM {table} WHERE thread_id = %s", (session_id,))
-                        logger.info(
-                            f"Cleared {table} for session {session_id}")
-                    except Exception as e:
-                        logger.error(f"Error clearing {table}", error=str(e))
-                        raise
+            if self._graph is None:
+                self._graph = await self.create_graph()
+            if self._checkpointer is None:
+                return
 
+            await self._checkpointer.adelete_thread(session_id)
+            replica_router.mark_written(session_id)
+            logger.info("chat_history_cleared", session_id=session_id)
         except Exception as e:
             logger.error("Failed to clear chat history", error=str(e))
             raise
+
+    async def delete_sessions(
+        self, db_service: DatabaseService, user_id: int, session_ids: Sequence[str]
+    ) -> List[str]:
+        """Delete sessions of a user with their chat history.
+
+        When the checkpoints live in the database of the models, they are purged
+        in the transaction deleting the sessions. Otherwise they are deleted from
+        the checkpointer once the sessions are gone.
+
+        Args:
+            db_service: The database service storing the sessions.
+            user_id: The owner of the sessions.
+            session_ids: The IDs of the sessions.
+
+        Returns:
+            List[str]: The IDs of the deleted sessions.
+        """
+        if self._graph is None:
+            self._graph = await self.create_graph()
+
+        tables = checkpoint_tables(self._checkpointer) if pool_manager.enabled and self._checkpointer else ()
+        deleted = await db_service.delete_sessions(user_id, session_ids, checkpoint_tables=tables)
+        if tables:
+            forget_threads(self._checkpointer, deleted)
+        elif self._checkpointer is not None:
+            for session_id in deleted:
+                await self._checkpointer.adelete_thread(session_id)
+        return deleted
+
+    async def close(self) -> None:
+        """Close the checkpointer, the shared connection pool is closed by its manager."""
+        if self._checkpointer is not None:
+            await close_checkpointer(self._checkpointer)
+            self._checkpointer = None
+        await self._run_lock.close()
+        self._connection_pool = None
+        self._replica_graphs = {}
+        self._graph = None
+        logger.info("agent_closed", environment=settings.ENVIRONMENT.value)
@@ -0,0 +1,134 @@
+"""This file contains the model router of the agent.
+
+Each chat turn is routed to one of the configured model tiers from cheap
+features of the request, in this order:
+
+1. An explicit tier requested by the client.
+2. The premium tier, for the users listed in LLM_PREMIUM_USER_IDS.
+3. The fast tier, for short user turns without search intent (greetings,
+   thanks, small talk), estimated without calling a tokenizer.
+4. The default tier otherwise.
+
+The tier is chosen once per turn, so the tool loop of a turn stays on the
+same model.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import (
+    Dict,
+    List,
+    Optional,
+)
+
+from core.config import settings
+from core.logging import logger
+from core.metrics import llm_route_decisions_total
+from schemas.chat import Message
+
+# Words that suggest the answer needs the search tool or a careful answer
+_TOOL_INTENT_PATTERN = re.compile(
+    r"\b(search|look\s*up|find|latest|news|today|current|recent|price|weather|score|"
+    r"who|when|where|how\s+(much|many)|compare|explain|why|code|error)\b|https?://|\d",
+    re.IGNORECASE,
+)
+
+# Rough characters per token of English text, enough to tell short turns apart
+_CHARS_PER_TOKEN = 4
+
+
+@dataclass(frozen=True)
+class RoutingDecision:
+    """The model tier chosen for a turn.
+
+    Attributes:
+        tier: The name of the tier.
+        model: The model of the tier.
+        reason: What decided the tier: hint, user_tier, simple or default.
+    """
+
+    tier: str
+    model: str
+    reason: str
+
+
+class ModelRouter:
+    """Picks the model tier of each chat turn."""
+
+    def __init__(
+        self,
+        tiers: Dict[str, str],
+        default_tier: str,
+        fast_tier: Optional[str] = None,
+        fast_max_tokens: int = 0,
+        premium_tier: Optional[str] = None,
+        premium_user_ids: Optional[List[str]] = None,
+    ):
+        """Initialize the router.
+
+        Args:
+            tiers: The model of each tier.
+            default_tier: The tier of turns no rule applies to.
+            fast_tier: The tier of simple turns, None to not route on complexity.
+            fast_max_tokens: The longest user turn, in estimated tokens, considered simple.
+            premium_tier: The tier of premium users, None to not route on the user.
+            premium_user_ids: The ids of the premium users.
+        """
+        for tier in (default_tier, fast_tier, premium_tier):
+            if tier is not None and tier not in tiers:
+                raise ValueError(f"Unknown model tier {tier!r}, configured tiers are {list(tiers)}")
+        self.tiers = tiers
+        self.default_tier = default_tier
+        self.fast_tier = fast_tier
+        self.fast_max_tokens = fast_max_tokens
+        self.premium_tier = premium_tier
+        self.premium_user_ids = set(premium_user_ids or [])
+
+    def route(self, messages: List[Message], user_id: Optional[str] = None, hint: Optional[str] = None) -> RoutingDecision:
+        """Choose the tier of a turn and record the decision.
+
+        Args:
+            messages: The messages of the request, the last user message being the new turn.
+            user_id: The id of the user.
+            hint: The tier requested by the client, if any.
+
+        Returns:
+            RoutingDecision: The chosen tier.
+        """
+        if hint is not None and hint in self.tiers:
+            tier, reason = hint, "hint"
+        elif self.premium_tier is not None and user_id is not None and str(user_id) in self.premium_user_ids:
+            tier, reason = self.premium_tier, "user_tier"
+        elif self.fast_tier is not None and self._is_simple(messages):
+            tier, reason = self.fast_tier, "simple"
+        else:
+            tier, reason = self.default_tier, "default"
+
+        llm_route_decisions_total.labels(tier=tier, reason=reason).inc()
+        logger.debug("model_routed", tier=tier, model=self.tiers[tier], reason=reason)
+        return RoutingDecision(tier=tier, model=self.tiers[tier], reason=reason)
+
+    def _is_simple(self, messages: List[Message]) -> bool:
+        """Check whether the new user turn is short and shows no search intent."""
+        content = next((message.content for message in reversed(messages) if message.role == "user"), None)
+        if content is None:
+            return False
+        if len(content) > self.fast_max_tokens * _CHARS_PER_TOKEN:
+            return False
+        return _TOOL_INTENT_PATTERN.search(content) is None
+
+
+def create_model_router() -> ModelRouter:
+    """Create the router of the configured model tiers.
+
+    Returns:
+        ModelRouter: The model router.
+    """
+    return ModelRouter(
+        tiers=settings.LLM_MODEL_TIERS,
+        default_tier=settings.LLM_DEFAULT_TIER,
+        fast_tier=settings.LLM_FAST_TIER or None,
+        fast_max_tokens=settings.LLM_FAST_MAX_TOKENS,
+        premium_tier=settings.LLM_PREMIUM_TIER or None,
+        premium_user_ids=settings.LLM_PREMIUM_USER_IDS,
+    )
@@ -0,0 +1,469 @@
+"""This file contains the per-thread run locks of the LangGraph agent.
+
+Two runs of the graph on the same thread would both start from the same
+checkpoint and both write a successor, forking the conversation. A run lock
+serializes the runs of a thread: later runs queue in arrival order and give
+up with `RunLockTimeoutError` after a timeout.
+
+`LocalRunLock` serializes the runs of one process. `PostgresRunLock` also
+takes an advisory lock in Postgres, so runs are serialized across workers and
+pods sharing the database. Postgres releases the advisory lock by itself if
+the worker dies.
+
+None of the run locks borrows from the shared pool of the checkpointer and the
+model layer: a run holds its lock during its LLM and tool calls, and lock
+holders owning the shared connections would leave the checkpoint writes of
+their own runs waiting for the pool timeout. `PostgresRunLock` holds the
+session-level locks of all the runs of a worker on a few dedicated
+connections. Through PgBouncer in transaction pooling mode, `PgBouncerRunLock`
+holds each lock in a transaction lasting the run, on a connection of a
+dedicated pool sized for the most concurrent runs of a worker.
+"""
+
+import asyncio
+import hashlib
+import time
+from contextlib import asynccontextmanager
+from typing import (
+    AsyncIterator,
+    Coroutine,
+    Dict,
+    Optional,
+)
+
+from psycopg import (
+    AsyncConnection,
+    OperationalError,
+)
+from psycopg.errors import LockNotAvailable
+from psycopg_pool import PoolTimeout
+
+from core.config import (
+    CheckpointerBackend,
+    settings,
+)
+from core.logging import logger
+from core.metrics import (
+    run_lock_timeouts_total,
+    run_lock_wait_seconds,
+)
+from core.postgres import (
+    PostgresPoolManager,
+    SharedConnectionPool,
+    is_postgres_url,
+    run_lock_pool_manager,
+)
+from core.timing import timed
+
+
+class RunLockTimeoutError(Exception):
+    """Raised when a run could not lock its thread within the timeout."""
+
+    def __init__(self, thread_id: str, timeout: float):
+        """Initialize the error.
+
+        Args:
+            thread_id: The thread that stayed locked.
+            timeout: The seconds waited for the lock.
+        """
+        super().__init__(f"Another run on thread {thread_id} did not finish within {timeout:g}s")
+        self.thread_id = thread_id
+        self.timeout = timeout
+
+
+class LocalRunLock:
+    """Serializes the runs of each thread within this process."""
+
+    backend = "local"
+
+    def __init__(self, timeout: float):
+        """Initialize the lock.
+
+        Args:
+            timeout: Seconds a run waits for its thread before giving up.
+        """
+        self.timeout = timeout
+        # Locks of the threads with a run holding or waiting, with their number of users
+        self._locks: Dict[str, tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str) -> AsyncIterator[None]:
+        """Hold the lock of a thread for the duration of a run.
+
+        Args:
+            thread_id: The thread of the run.
+
+        Raises:
+            RunLockTimeoutError: If the thread stayed locked for longer than the timeout.
+        """
+        deadline = time.monotonic() + self.timeout
+        with timed("run_lock"):
+            await self._acquire_local(thread_id, deadline)
+        try:
+            yield
+        finally:
+            self._release_local(thread_id)
+
+    async def _acquire_local(self, thread_id: str, deadline: float) -> None:
+        """Wait in line for the local lock of a thread until the deadline."""
+        lock, users = self._locks.get(thread_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[thread_id] = (lock, users + 1)
+        start = time.monotonic()
+        try:
+            # Bounded even when the lock looks free: a waiter woken by the last
+            # release may own it already, and asyncio.Lock queues behind it
+            await asyncio.wait_for(lock.acquire(), timeout=max(deadline - start, 0))
+        except asyncio.TimeoutError:
+            self._forget(thread_id)
+            self._timed_out(thread_id)
+        except BaseException:
+            self._forget(thread_id)
+            raise
+        run_lock_wait_seconds.labels(backend=self.backend).observe(time.monotonic() - start)
+
+    def _release_local(self, thread_id: str) -> None:
+        """Release the local lock of a thread."""
+        self._locks[thread_id][0].release()
+        self._forget(thread_id)
+
+    def _forget(self, thread_id: str) -> None:
+        """Drop a user of the local lock of a thread, and the lock with its last user."""
+        lock, users = self._locks[thread_id]
+        if users <= 1:
+            del self._locks[thread_id]
+        else:
+            self._locks[thread_id] = (lock, users - 1)
+
+    async def close(self) -> None:
+        """Release the resources of the lock, the local lock has none."""
+
+    def _timed_out(self, thread_id: str) -> None:
+        """Record a timeout and raise it."""
+        run_lock_timeouts_total.labels(backend=self.backend).inc()
+        logger.warning("run_lock_timeout", thread_id=thread_id, backend=self.backend, timeout=self.timeout)
+        raise RunLockTimeoutError(thread_id, self.timeout)
+
+
+class _AdvisoryKeyMixin:
+    """Maps threads to Postgres advisory lock keys, and releases the locks of cancelled runs."""
+
+    @staticmethod
+    def advisory_key(thread_id: str) -> int:
+        """Map a thread id to a signed 64-bit advisory lock key."""
+        digest = hashlib.blake2b(thread_id.encode("utf-8"), digest_size=8, person=b"run-lock").digest()
+        return int.from_bytes(digest, "big", signed=True)
+
+    async def _release_shielded(self, thread_id: str, release: Coroutine) -> None:
+        """Release the advisory lock of a thread, then its local lock, even if the run is cancelled.
+
+        A run cancelled by a client disconnect is cancelled again while it
+        cleans up. An interrupted release would leave the thread locked for the
+        other workers, so it runs in a task of its own, which the cancellation
+        of the run does not reach.
+
+        Args:
+            thread_id: The thread of the run.
+            release: Releases the advisory lock, without raising.
+        """
+        task = asyncio.ensure_future(release)
+        task.add_done_callback(lambda _: self._release_local(thread_id))
+        await asyncio.shield(task)
+
+
+class _LockConnection:
+    """A dedicated connection holding the session-level advisory locks of many threads."""
+
+    def __init__(self, conninfo: str):
+        """Initialize the connection, opened on first use.
+
+        Args:
+            conninfo: The libpq connection URI of the database.
+        """
+        self.conninfo = conninfo
+        # Bumped on every reconnection: the locks of the former session are gone
+        self.generation = 0
+        self._conn: Optional[AsyncConnection] = None
+        self._lock = asyncio.Lock()
+
+    async def fetch_flag(self, query: str, key: int) -> tuple[bool, int]:
+        """Run a query returning a boolean, reconnecting if the connection was lost.
+
+        Args:
+            query: The query, taking the advisory key as only parameter.
+            key: The advisory key.
+
+        Returns:
+            tuple[bool, int]: The result, and the generation of the session that ran the query.
+        """
+        async with self._lock:
+            if self._conn is None or self._conn.closed:
+                self._conn = await AsyncConnection.connect(self.conninfo, autocommit=True, connect_timeout=5)
+                self.generation += 1
+            try:
+                cursor = await self._conn.execute(query, (key,))
+                row = await cursor.fetchone()
+            except OperationalError:
+                # The session and its locks are gone, the next query opens a new one
+                await self._conn.close()
+                raise
+            return bool(row[0]), self.generation
+
+    async def reset(self) -> None:
+        """Close the connection after a failed release, so no lock it holds outlives its run.
+
+        The locks of the other runs on the connection go with it, their
+        release finds the generation changed and logs them as lost.
+        """
+        self.generation += 1
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the connection, releasing the locks it holds."""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await conn.close()
+
+
+class PostgresRunLock(_AdvisoryKeyMixin, LocalRunLock):
+    """Serializes the runs of each thread across all workers sharing a database.
+
+    The local lock is taken first, so only the run next in line in this
+    process competes for the advisory lock, which it polls until the deadline.
+    The advisory locks of all the runs of this process are held on a few
+    dedicated connections rather than one connection each, so running threads
+    neither hold connections of the shared pool nor need one per run. Unlike
+    the local queue, runs of different workers polling the same thread are not
+    served in arrival order.
+    """
+
+    backend = "postgres"
+
+    # Seconds between two attempts on a thread locked by another process, doubled up to the maximum
+    poll_interval = 0.01
+    max_poll_interval = 0.25
+
+    def __init__(self, conninfo: str, timeout: float, connections: int = 1):
+        """Initialize the lock.
+
+        Args:
+            conninfo: The libpq connection URI of the database.
+            timeout: Seconds a run waits for its thread before giving up.
+            connections: The dedicated connections holding the advisory locks.
+        """
+        super().__init__(timeout)
+        self._connections = [_LockConnection(conninfo) for _ in range(max(connections, 1))]
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str) -> AsyncIterator[None]:
+        """Hold the lock of a thread, in this process and in Postgres, for the duration of a run.
+
+        Args:
+            thread_id: The thread of the run.
+
+        Raises:
+            RunLockTimeoutError: If the thread stayed locked for longer than the timeout.
+        """
+        deadline = time.monotonic() + self.timeout
+        key = self.advisory_key(thread_id)
+        # The same thread always maps to the same connection
+        connection = self._connections[key % len(self._connections)]
+        with timed("run_lock"):
+            await self._acquire_local(thread_id, deadline)
+            try:
+                generation = await self._acquire_advisory(connection, thread_id, key, deadline)
+            except RunLockTimeoutError:
+                self._release_local(thread_id)
+                raise
+            except BaseException:
+                # Interrupted, the lock may have been granted without the run knowing
+                release = self._release_advisory(connection, thread_id, key, connection.generation)
+                await self._release_shielded(thread_id, release)
+                raise
+        try:
+            yield
+        finally:
+            await self._release_shielded(thread_id, self._release_advisory(connection, thread_id, key, generation))
+
+    async def _release_advisory(self, connection: _LockConnection, thread_id: str, key: int, generation: int) -> None:
+        """Release the advisory lock of a thread, dropping the connection if that fails."""
+        if connection.generation != generation:
+            logger.error("run_lock_lost", thread_id=thread_id, reason="the lock connection was lost")
+            return
+        try:
+            await connection.fetch_flag("SELECT pg_advisory_unlock(%s)", key)
+        except BaseException as e:
+            logger.error("run_lock_release_failed", thread_id=thread_id, error=repr(e))
+            await connection.reset()
+            if not isinstance(e, Exception):
+                raise
+
+    async def _acquire_advisory(
+        self, connection: _LockConnection, thread_id: str, key: int, deadline: float
+    ) -> int:
+        """Poll the advisory lock of a thread until the deadline, returning the generation holding it."""
+        start = time.monotonic()
+        interval = self.poll_interval
+        while True:
+            locked, generation = await connection.fetch_flag("SELECT pg_try_advisory_lock(%s)", key)
+            if locked:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._timed_out(thread_id)
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * 2, self.max_poll_interval)
+        run_lock_wait_seconds.labels(backend=self.backend).observe(time.monotonic() - start)
+        return generation
+
+    async def close(self) -> None:
+        """Close the dedicated connections."""
+        for connection in self._connections:
+            await connection.close()
+
+
+class PgBouncerRunLock(_AdvisoryKeyMixin, LocalRunLock):
+    """Serializes the runs of each thread across workers through PgBouncer in transaction pooling mode.
+
+    Between transactions PgBouncer may hand the server session to another
+    client, so each running thread holds a transaction-level advisory lock in a
+    transaction lasting the run, on a connection of the dedicated run lock pool.
+    """
+
+    backend = "postgres"
+
+    def __init__(self, pool: SharedConnectionPool, timeout: float):
+        """Initialize the lock.
+
+        Args:
+            pool: The dedicated run lock pool, holding one connection per running thread.
+            timeout: Seconds a run waits for its thread before giving up.
+        """
+        super().__init__(timeout)
+        self.pool = pool
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str) -> AsyncIterator[None]:
+        """Hold the lock of a thread, in this process and in Postgres, for the duration of a run.
+
+        Args:
+            thread_id: The thread of the run.
+
+        Raises:
+            RunLockTimeoutError: If the thread stayed locked for longer than the timeout.
+        """
+        deadline = time.monotonic() + self.timeout
+        key = self.advisory_key(thread_id)
+        with timed("run_lock"):
+            await self._acquire_local(thread_id, deadline)
+            try:
+                conn = await self.pool.getconn(timeout=max(deadline - time.monotonic(), 0.001), consumer="run_lock")
+            except PoolTimeout:
+                self._release_local(thread_id)
+                self._timed_out(thread_id)
+            except BaseException:
+                self._release_local(thread_id)
+                raise
+            try:
+                await self._acquire_advisory(conn, thread_id, key, deadline)
+            except BaseException:
+                await self._release_shielded(thread_id, self._release_transaction(conn, thread_id))
+                raise
+        try:
+            yield
+        finally:
+            await self._release_shielded(thread_id, self._release_transaction(conn, thread_id))
+
+    async def _release_transaction(self, conn: AsyncConnection, thread_id: str) -> None:
+        """End the transaction holding the advisory lock of a thread, and give its connection back."""
+        try:
+            # Ends the transaction and its lock
+            await conn.rollback()
+            await conn.set_autocommit(True)
+        except BaseException as e:
+            # The lock goes away with the session, make sure the connection is not reused
+            logger.error("run_lock_release_failed", thread_id=thread_id, error=repr(e))
+            await conn.close()
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            # The pool discards closed connections
+            await self.pool.putconn(conn)
+
+    async def _acquire_advisory(self, conn: AsyncConnection, thread_id: str, key: int, deadline: float) -> None:
+        """Wait for the advisory lock of a thread until the deadline, in a transaction left open."""
+        start = time.monotonic()
+        lock_timeout = f"{max(int((deadline - start) * 1000), 1)}ms"
+        await conn.set_autocommit(False)
+        try:
+            # Both end with the transaction, rolled back by the caller on failure
+            await conn.execute("SELECT set_config('lock_timeout', %s, true)", (lock_timeout,))
+            await conn.execute("SELECT pg_advisory_xact_lock(%s)", (key,))
+        except LockNotAvailable:
+            self._timed_out(thread_id)
+        run_lock_wait_seconds.labels(backend=self.backend).observe(time.monotonic() - start)
+
+
+def max_concurrent_runs() -> Optional[int]:
+    """Return the most runs a worker may hold run locks for at once, None if unbounded."""
+    if not settings.CONCURRENCY_LIMIT_ENABLED:
+        return None
+    return settings.CONCURRENCY_LIMIT_MAX + settings.RUN_QUEUE_WORKERS
+
+
+def check_run_lock_settings() -> None:
+    """Check at startup that the run locks serialize the runs of every thread.
+
+    Several workers only share their run locks through Postgres: with the
+    SQLite or memory checkpointer, two workers would run turns on the same
+    thread at once and interleave their checkpoint writes. Only PgBouncer mode
+    needs a connection per running thread. A smaller pool would make runs time
+    out waiting for a lock connection while their threads are free.
+
+    Raises:
+        ValueError: If several workers would only have local run locks, or if
+            RUN_LOCK_POOL_SIZE is below the most concurrent runs of a worker.
+    """
+    if settings.SERVER_WORKERS > 1 and settings.CHECKPOINTER_BACKEND != CheckpointerBackend.POSTGRES:
+        raise ValueError(
+            f"SERVER_WORKERS ({settings.SERVER_WORKERS}) must be 1 with the "
+            f"{settings.CHECKPOINTER_BACKEND.value} checkpointer, whose run locks are local to a worker"
+        )
+    if not (is_postgres_url(settings.POSTGRES_URL) and settings.POSTGRES_PGBOUNCER):
+        return
+    if settings.CHECKPOINTER_BACKEND != CheckpointerBackend.POSTGRES:
+        return
+    runs = max_concurrent_runs()
+    if runs is None:
+        logger.warning(
+            "run_lock_pool_unbounded",
+            reason="concurrency limiting is disabled, runs beyond the pool wait for a lock connection",
+            pool_size=settings.RUN_LOCK_POOL_SIZE,
+        )
+    elif settings.RUN_LOCK_POOL_SIZE < runs:
+        raise ValueError(
+            f"RUN_LOCK_POOL_SIZE ({settings.RUN_LOCK_POOL_SIZE}) must be at least CONCURRENCY_LIMIT_MAX + "
+            f"RUN_QUEUE_WORKERS ({runs}) with POSTGRES_PGBOUNCER"
+        )
+
+
+async def create_run_lock(manager: Optional[PostgresPoolManager], timeout: float) -> LocalRunLock:
+    """Create the run lock matching where the checkpoints live.
+
+    Args:
+        manager: The manager of the Postgres pool of the checkpointer, None if
+            the checkpoints are local to this process or machine.
+        timeout: Seconds a run waits for its thread before giving up.
+
+    Returns:
+        LocalRunLock: The run lock.
+    """
+    if manager is None:
+        run_lock = LocalRunLock(timeout)
+    elif manager.pgbouncer:
+        run_lock = PgBouncerRunLock(await run_lock_pool_manager.get_pool(), timeout)
+    else:
+        run_lock = PostgresRunLock(manager.conninfo, timeout, connections=settings.RUN_LOCK_CONNECTIONS)
+    logger.info("run_lock_created", backend=run_lock.backend, type=type(run_lock).__name__, timeout=timeout)
+    return run_lock
@@ -0,0 +1,141 @@
+"""This file contains the shaping of the streamed events of chat turns.
+
+The "messages" stream of the graph carries every message chunk of the run: one
+per answer token, empty chunks building up the arguments of tool calls, and
+the full output of every tool call. The shaper turns it into what the client
+renders: the answer text of the chat node, coalesced into frames of a bounded
+size or of whatever arrived within a short window, and typed events around
+tool calls instead of their raw output.
+"""
+
+import asyncio
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    ToolMessage,
+)
+
+from core.metrics import stream_chunks_total
+from schemas.chat import StreamEvent
+
+# Node of the graph whose messages are the answer
+_ANSWER_NODE = "chat"
+
+
+class StreamShaper:
+    """Turns the message chunks streamed by the graph into coalesced client events."""
+
+    def __init__(self, max_chars: int, window: float):
+        """Initialize the shaper.
+
+        Args:
+            max_chars: Characters of answer text after which a frame is sent.
+            window: Seconds after its first chunk at which a frame is sent, however small.
+        """
+        self.max_chars = max_chars
+        self.window = window
+        self._buffer: List[str] = []
+        self._buffered_chars = 0
+        self._started_tool_calls: Set[str] = set()
+
+    def _flush(self) -> List[StreamEvent]:
+        """Send the buffered answer text as one frame, if any."""
+        if not self._buffer:
+            return []
+        content = "".join(self._buffer)
+        self._buffer.clear()
+        self._buffered_chars = 0
+        return [StreamEvent(type="text", content=content)]
+
+    def _shape(self, message: BaseMessage, metadata: dict) -> List[StreamEvent]:
+        """Get the events of a streamed message, buffering its answer text."""
+        if isinstance(message, ToolMessage):
+            # The output of the tool stays server-side, only its outcome is sent
+            return self._flush() + [
+                StreamEvent(
+                    type="tool_end",
+                    tool=message.name,
+                    tool_call_id=message.tool_call_id,
+                    status=message.status,
+                )
+            ]
+        if not isinstance(message, AIMessage) or metadata.get("langgraph_node") != _ANSWER_NODE:
+            return []
+
+        events = []
+        # The first chunk of a tool call carries its name and ID, the rest only arguments
+        tool_calls = getattr(message, "tool_call_chunks", None) or message.tool_calls
+        for tool_call in tool_calls:
+            if tool_call.get("name") and tool_call.get("id") and tool_call["id"] not in self._started_tool_calls:
+                self._started_tool_calls.add(tool_call["id"])
+                events.append(StreamEvent(type="tool_start", tool=tool_call["name"], tool_call_id=tool_call["id"]))
+        if events:
+            events = self._flush() + events
+
+        content = message.content if isinstance(message.content, str) else message.text()
+        if content:
+            stream_chunks_total.inc()
+            self._buffer.append(content)
+            self._buffered_chars += len(content)
+            if self._buffered_chars >= self.max_chars:
+                events += self._flush()
+        return events
+
+    async def shape(self, chunks: AsyncIterator[Tuple[BaseMessage, dict]]) -> AsyncIterator[StreamEvent]:
+        """Shape the chunks of a "messages" stream of the graph.
+
+        A frame is sent as soon as its window is over, even if the model is
+        slow to send the next chunk, so coalescing adds at most the window to
+        the latency of a token.
+
+        Args:
+            chunks: The (message, metadata) pairs streamed by the graph.
+
+        Yields:
+            StreamEvent: The events for the client, without the final "done".
+        """
+        iterator = chunks.__aiter__()
+        pending: Optional[asyncio.Future] = None
+        frame_deadline: Optional[float] = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                timeout = None if frame_deadline is None else max(0.0, frame_deadline - time.monotonic())
+                # The pending chunk is kept across timeouts, cancelling it would cancel the run
+                done, _ = await asyncio.wait((pending,), timeout=timeout)
+                if not done:
+                    events = self._flush()
+                else:
+                    try:
+                        message, metadata = pending.result()
+                    except StopAsyncIteration:
+                        pending = None
+                        break
+                    pending = None
+                    events = self._shape(message, metadata)
+                if not self._buffer:
+                    frame_deadline = None
+                elif frame_deadline is None:
+                    frame_deadline = time.monotonic() + self.window
+                for event in events:
+                    yield event
+            for event in self._flush():
+                yield event
+        finally:
+            if pending is not None:
+                pending.cancel()
+                await asyncio.gather(pending, return_exceptions=True)
+            aclose: Any = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
@@ -0,0 +1,165 @@
+"""This file contains the compaction of tool outputs before they enter the prompt.
+
+The output of a tool call is sent to the model again on every later step of
+the turn and every later turn of the session, so it is the largest part of
+most prompts. Each tool has a post-processor fitting its output to a token
+budget: search results are deduplicated, ranked against the query and cut
+down to their most relevant snippets. The full output stays in the artifact of
+the tool message, which is checkpointed but never sent to the model, so it can
+still be retrieved by the ID of its tool call.
+"""
+
+import re
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+)
+from urllib.parse import urlsplit
+
+from langchain_core.messages import ToolMessage
+
+from core.config import settings
+from core.langgraph.tools.duckduckgo_search import duckduckgo_search_tool
+from core.logging import logger
+from core.metrics import tool_output_tokens_saved_total
+
+# Fits a tool output to a budget of characters, given the args of its call
+ToolOutputProcessor = Callable[[ToolMessage, Dict[str, Any], int], str]
+
+_WORD = re.compile(r"\w{2,}")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the tokens of a text, at 4 characters per token.
+
+    Args:
+        text: The text.
+
+    Returns:
+        int: The approximate token count.
+    """
+    return (len(text) + 3) // 4
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    """Cut a text to a number of characters, at a word boundary if possible."""
+    text = _WHITESPACE.sub(" ", text).strip()
+    if len(text) <= max_chars:
+        return text
+    cut = text[: max(0, max_chars - 1)]
+    space = cut.rfind(" ")
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut.rstrip() + "…"
+
+
+def _link_key(link: str) -> str:
+    """Normalize a link, so the same page found twice is kept once."""
+    parts = urlsplit(link.strip().lower())
+    host = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+    return f"{host}{parts.path.rstrip('/')}?{parts.query}"
+
+
+def truncate_output(message: ToolMessage, args: Dict[str, Any], max_chars: int) -> str:
+    """Fit the output of a tool without a dedicated processor by truncating it.
+
+    Args:
+        message: The answer of the tool.
+        args: The args of the tool call.
+        max_chars: The budget of characters.
+
+    Returns:
+        str: The content to send to the model.
+    """
+    return _truncate(message.text(), max_chars)
+
+
+def compact_search_results(message: ToolMessage, args: Dict[str, Any], max_chars: int) -> str:
+    """Fit search results to a budget, keeping the most relevant distinct ones.
+
+    Results are deduplicated by link and snippet, ranked by the query terms
+    they contain, the search engine's order breaking ties, and added with a
+    truncated snippet while they fit.
+
+    Args:
+        message: The answer of the search tool, with the results as artifact.
+        args: The args of the tool call, holding the query.
+        max_chars: The budget of characters.
+
+    Returns:
+        str: The content to send to the model, one result per line.
+    """
+    results = message.artifact
+    if not isinstance(results, list) or not all(isinstance(result, dict) for result in results):
+        return truncate_output(message, args, max_chars)
+
+    query_terms = set(_WORD.findall(str(args.get("query", "")).lower()))
+    seen_links, seen_snippets = set(), set()
+    candidates = []
+    for rank, result in enumerate(results):
+        snippet = _WHITESPACE.sub(" ", str(result.get("snippet") or result.get("body") or "")).strip()
+        link = str(result.get("link") or result.get("href") or "")
+        snippet_key = snippet.lower()
+        if (link and _link_key(link) in seen_links) or (snippet and snippet_key in seen_snippets):
+            continue
+        seen_links.add(_link_key(link))
+        seen_snippets.add(snippet_key)
+        title = str(result.get("title") or "")
+        score = len(query_terms & set(_WORD.findall(f"{title} {snippet}".lower())))
+        candidates.append((-score, rank, title, snippet, link))
+
+    lines: List[str] = []
+    used = 0
+    for _, _, title, snippet, link in sorted(candidates):
+        line = f"{_truncate(title, 120)}: {_truncate(snippet, settings.TOOL_OUTPUT_SNIPPET_CHARS)} ({link})"
+        if not lines:
+            # The most relevant result is kept even if it alone exceeds the budget
+            line = _truncate(line, max_chars)
+        elif used + len(line) + 1 > max_chars:
+            break
+        lines.append(line)
+        used += len(line) + 1
+    return "\n".join(lines) or "No results found."
+
+
+# Post-processors by tool name, the others are truncated
+tool_output_processors: Dict[str, ToolOutputProcessor] = {
+    duckduckgo_search_tool.name: compact_search_results,
+}
+
+
+def compact_tool_output(message: ToolMessage, args: Dict[str, Any], max_tokens: Optional[int] = None) -> ToolMessage:
+    """Fit the answer of a tool call to the prompt budget of tool outputs.
+
+    Args:
+        message: The answer of the tool, with its full output.
+        args: The args of the tool call.
+        max_tokens: The budget of tokens, TOOL_OUTPUT_MAX_TOKENS by default.
+
+    Returns:
+        ToolMessage: The answer with the compacted content, and the full output
+            as artifact if TOOL_OUTPUT_KEEP_FULL is set: the structured results of
+            the tool, which its raw content is rendered from, or the raw content
+            of a tool without results.
+    """
+    if message.status == "error":
+        return message
+    max_tokens = settings.TOOL_OUTPUT_MAX_TOKENS if max_tokens is None else max_tokens
+    raw_content = message.text()
+    processor = tool_output_processors.get(message.name, truncate_output)
+    content = processor(message, args, max_tokens * 4)
+
+    raw_tokens, tokens = estimate_tokens(raw_content), estimate_tokens(content)
+    if tokens < raw_tokens:
+        tool_output_tokens_saved_total.labels(tool=message.name).inc(raw_tokens - tokens)
+    logger.debug("tool_output_compacted", tool=message.name, raw_tokens=raw_tokens, tokens=tokens)
+
+    artifact = None
+    if settings.TOOL_OUTPUT_KEEP_FULL:
+        # The raw content of a tool with results is a rendering of them, only one copy is checkpointed
+        artifact = raw_content if message.artifact is None else message.artifact
+    return message.model_copy(update={"content": content, "artifact": artifact})
@@ -82,6 +82,8 @@ def get_structlog_processors(include_file_info: bool = True) -> List[Any]:
     # Set up processors that are common to both outputs
     processors = [
         structlog.stdlib.filter_by_level,
+        # Fields bound for the current request, such as its request_id
+        structlog.contextvars.merge_contextvars,
         structlog.stdlib.add_logger_name,
         structlog.stdlib.add_log_level,
         structlog.stdlib.PositionalArgumentsFormatter(),
@@ -141,7 +143,7 @@ def setup_logging() -> None:
     logging.basicConfig(
         format="%(message)s",
         level=settings.LOG_LEVEL,
-        handlers=[console_handler],
+        handlers=[console_handler, file_handler],
     )
 
     # Configure structlog based on environment
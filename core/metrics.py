@@ -22,6 +22,41 @@ http_request_duration_seconds = Histogram(
 # Database metrics
 db_connections = Gauge("db_connections", "Number of active database connections")
 
+db_pool_size = Gauge("db_pool_size", "Open connections of each Postgres pool (primary or replica)", ["pool"])
+
+db_pool_max_connections = Gauge("db_pool_max_connections", "Maximum connections of each Postgres pool", ["pool"])
+
+db_pool_connections_in_use = Gauge(
+    "db_pool_connections_in_use",
+    "Connections of each Postgres pool lent out, by consumer (models, checkpointer, run_lock)",
+    ["pool", "consumer"],
+)
+
+db_pool_waiting = Gauge("db_pool_waiting", "Requests waiting for a connection of each Postgres pool", ["pool"])
+
+db_pool_wait_seconds = Histogram(
+    "db_pool_wait_seconds",
+    "Time waited for a connection of each Postgres pool, by consumer",
+    ["pool", "consumer"],
+    buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0],
+)
+
+db_pool_timeouts_total = Counter(
+    "db_pool_timeouts_total",
+    "Requests for a connection of each Postgres pool that timed out, by consumer",
+    ["pool", "consumer"],
+)
+
+db_replica_lag_seconds = Gauge(
+    "db_replica_lag_seconds", "Replication lag of each read replica, NaN while unreachable", ["replica"]
+)
+
+db_reads_total = Counter(
+    "db_reads_total",
+    "Read-only queries by target (replica, primary) and reason (replica, sticky, unavailable, fallback)",
+    ["target", "reason"],
+)
+
 # Custom business metrics
 orders_processed = Counter("orders_processed_total", "Total number of orders processed")
 
@@ -40,6 +75,142 @@ llm_stream_duration_seconds = Histogram(
     buckets=[0.1, 0.5, 1.0, 2.0, 5.0, 10.0],
 )
 
+llm_tokens_total = Counter(
+    "llm_tokens_total",
+    "Tokens reported by the LLM provider by type (input, cached_input, output)",
+    ["model", "type"],
+)
+
+llm_route_decisions_total = Counter(
+    "llm_route_decisions_total",
+    "Chat turns routed to each model tier, by the rule that decided (hint, user_tier, simple, default)",
+    ["tier", "reason"],
+)
+
+early_tool_calls_total = Counter(
+    "early_tool_calls_total",
+    "Tool calls started while the model was still streaming the rest of its message",
+    ["tool"],
+)
+
+tool_output_tokens_saved_total = Counter(
+    "tool_output_tokens_saved_total",
+    "Approximate prompt tokens removed from tool outputs by their post-processor, by tool",
+    ["tool"],
+)
+
+
+# Checkpoint cache metrics
+checkpoint_cache_requests_total = Counter(
+    "checkpoint_cache_requests_total",
+    "Checkpoint cache lookups by result (hit, miss, stale)",
+    ["result"],
+)
+
+checkpoint_cache_evictions_total = Counter(
+    "checkpoint_cache_evictions_total",
+    "Checkpoint cache entries evicted to stay within the size bounds",
+)
+
+checkpoint_cache_entries = Gauge(
+    "checkpoint_cache_entries", "Number of threads held in the checkpoint cache"
+)
+
+checkpoint_cache_bytes = Gauge(
+    "checkpoint_cache_bytes", "Serialized size of the checkpoint cache in bytes"
+)
+
+
+# Event loop diagnostics metrics
+event_loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds",
+    "Delay of the event loop in waking up a periodic timer",
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5],
+)
+
+event_loop_blocked_total = Counter(
+    "event_loop_blocked_total",
+    "Number of times a callback blocked the event loop longer than the threshold",
+)
+
+
+# Stream metrics
+stream_chunks_total = Counter(
+    "stream_chunks_total", "Answer chunks received from the model by streamed chat turns, before coalescing"
+)
+
+stream_events_total = Counter(
+    "stream_events_total",
+    "Events sent to the clients of streamed chat turns, by type (text, tool_start, tool_end, error, done)",
+    ["type"],
+)
+
+
+# Run lock metrics
+run_lock_wait_seconds = Histogram(
+    "run_lock_wait_seconds",
+    "Time a run waited for the lock of its thread",
+    ["backend"],
+    buckets=[0.001, 0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0],
+)
+
+run_lock_timeouts_total = Counter(
+    "run_lock_timeouts_total",
+    "Runs rejected because their thread stayed locked for longer than the timeout",
+    ["backend"],
+)
+
+
+# Run queue metrics
+run_queue_depth = Gauge("run_queue_depth", "Background runs waiting for a worker of this process")
+
+runs_total = Counter(
+    "runs_total",
+    "Background runs finished, by final status (succeeded, failed)",
+    ["status"],
+)
+
+
+# Concurrency limiter metrics
+concurrency_limit = Gauge("concurrency_limit", "Current adaptive concurrency limit", ["limiter"])
+
+concurrency_in_flight = Gauge("concurrency_in_flight", "Requests holding a concurrency slot", ["limiter"])
+
+concurrency_queued = Gauge("concurrency_queued", "Requests waiting for a concurrency slot", ["limiter"])
+
+concurrency_shed_total = Counter(
+    "concurrency_shed_total",
+    "Requests rejected with 503 because the worker was over capacity, by reason (queue_full, queue_timeout)",
+    ["limiter", "reason"],
+)
+
+
+# Request cancellation metrics
+runs_cancelled_total = Counter(
+    "runs_cancelled_total",
+    "Agent runs cancelled because the client of their request disconnected, by endpoint",
+    ["endpoint"],
+)
+
+
+# Outbound HTTP client metrics
+http_client_connections = Gauge(
+    "http_client_connections",
+    "Connections of each shared HTTP client pool, by state (active, idle)",
+    ["client", "state"],
+)
+
+http_client_requests_in_flight = Gauge(
+    "http_client_requests_in_flight", "Requests sent by each shared HTTP client and not yet answered", ["client"]
+)
+
+http_client_connect_seconds = Histogram(
+    "http_client_connect_seconds",
+    "Time spent opening connections of each shared HTTP client, by phase (tcp, tls)",
+    ["client", "phase"],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5],
+)
+
 
 def setup_metrics(app):
     """Set up Prometheus metrics middleware and endpoints.
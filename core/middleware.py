@@ -1,38 +1,86 @@
 import time
-from typing import Callable
+import uuid
+from typing import (
+    AsyncIterator,
+    Callable,
+)
 
+import structlog
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
 
+from core.config import settings
+from core.logging import logger
 from core.metrics import (
     db_connections,
     http_request_duration_seconds,
     http_requests_total,
 )
+from core.timing import (
+    RequestTiming,
+    start_request_timing,
+)
 
 
 class MetricsMiddleware(BaseHTTPMiddleware):
 
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
         start_time = time.time()
+        timing = start_request_timing()
+        request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+        structlog.contextvars.bind_contextvars(request_id=request_id)
 
         try:
             response = await call_next(request)
-            status_code = response.status_code
         except Exception:
-            status_code = 500
+            self._record(request, 500, start_time, timing)
             raise
+
+        # The header is sent before the body, so a streamed body's spans only reach the log
+        response.headers["Server-Timing"] = timing.server_timing()
+        response.headers["X-Request-ID"] = request_id
+        response.body_iterator = self._record_after(
+            response.body_iterator, request, response.status_code, start_time, timing
+        )
+        return response
+
+    async def _record_after(
+        self,
+        body: AsyncIterator[bytes],
+        request: Request,
+        status_code: int,
+        start_time: float,
+        timing: RequestTiming,
+    ) -> AsyncIterator[bytes]:
+        """Send the body, then record the request with the spans of the whole body."""
+        try:
+            async for chunk in body:
+                yield chunk
         finally:
-            duration = time.time() - start_time
+            self._record(request, status_code, start_time, timing)
 
-            # Record metrics
-            http_requests_total.labels(
-                method=request.method, endpoint=request.url.path, status=status_code
-            ).inc()
+    def _record(self, request: Request, status_code: int, start_time: float, timing: RequestTiming) -> None:
+        """Record the metrics and the timing breakdown of a finished request."""
+        duration = time.time() - start_time
 
-            http_request_duration_seconds.labels(
-                method=request.method, endpoint=request.url.path
-            ).observe(duration)
+        # Record metrics
+        http_requests_total.labels(
+            method=request.method, endpoint=request.url.path, status=status_code
+        ).inc()
 
-        return response
+        http_request_duration_seconds.labels(
+            method=request.method, endpoint=request.url.path
+        ).observe(duration)
+
+        # Every request at info would double the log volume, only the slow ones are
+        log = logger.info if duration >= settings.REQUEST_TIMING_LOG_THRESHOLD else logger.debug
+        log(
+            "request_timing",
+            method=request.method,
+            path=request.url.path,
+            status=status_code,
+            duration_ms=round(duration * 1000, 1),
+            **timing.as_log_fields(),
+        )
+        structlog.contextvars.unbind_contextvars("request_id")
@@ -0,0 +1,477 @@
+"""This file contains the shared Postgres connection pool of the application.
+
+The model layer (`DatabaseService`) and the checkpointer of the agent borrow
+their connections from one psycopg pool per worker, so a worker opens at most
+POSTGRES_POOL_SIZE + POSTGRES_MAX_OVERFLOW connections for them instead of one
+pool per consumer. The run locks keep their own connections, see
+`core.langgraph.run_lock`. The connections lent to each consumer
+are exported as metrics.
+
+With POSTGRES_PGBOUNCER, connections are compatible with PgBouncer in
+transaction pooling mode: prepared statements are disabled, and the run locks
+keep their advisory lock in a transaction rather than in the session.
+
+With POSTGRES_REPLICA_URLS, `replica_router` sends read-only queries to the
+replicas whose replication lag is within POSTGRES_REPLICA_MAX_LAG. Reads of a
+session that wrote recently stay on the primary, and reads fall back to the
+primary when no replica is available.
+"""
+
+import asyncio
+import itertools
+import time
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+)
+
+from psycopg import AsyncConnection
+from psycopg.pq import TransactionStatus
+from psycopg_pool import (
+    AsyncConnectionPool,
+    PoolTimeout,
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    create_async_engine,
+)
+from sqlalchemy.pool import NullPool
+
+from core.config import settings
+from core.logging import logger
+from core.metrics import (
+    db_pool_connections_in_use,
+    db_pool_max_connections,
+    db_pool_size,
+    db_pool_timeouts_total,
+    db_pool_wait_seconds,
+    db_pool_waiting,
+    db_reads_total,
+    db_replica_lag_seconds,
+)
+
+# Replication lag in seconds, 0 when the replica replayed all the WAL it received
+_REPLICA_LAG_QUERY = """
+SELECT COALESCE(
+    CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END,
+    0
+)
+"""
+
+# The checkpointer takes its connections through `AsyncConnectionPool.connection()`,
+# which cannot name a consumer
+DEFAULT_CONSUMER = "checkpointer"
+
+
+def is_postgres_url(url: str) -> bool:
+    """Return whether a database URL points to Postgres."""
+    return url.startswith(("postgres://", "postgresql"))
+
+
+class SharedConnection(AsyncConnection):
+    """Connection of the shared pool, given back to it when an engine borrowing it closes it.
+
+    SQLAlchemy closes the connections of a `NullPool` engine on checkin, so a
+    lent connection is reset to the state the other consumers expect and given
+    back to the pool instead.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        """Initialize the connection, see `AsyncConnection`."""
+        super().__init__(*args, **kwargs)
+        # The pool the connection is lent from while an engine uses it
+        self._lender: Optional["SharedConnectionPool"] = None
+        self._lent_notice_handlers: List[Any] = []
+
+    def lend(self, pool: "SharedConnectionPool") -> None:
+        """Mark the connection as lent to an engine until it closes it."""
+        self._lender = pool
+
+    def add_notice_handler(self, callback: Any) -> None:
+        """Register a notice handler, see `AsyncConnection.add_notice_handler`."""
+        super().add_notice_handler(callback)
+        if self._lender is not None:
+            # SQLAlchemy registers one on every checkout, they are removed when given back
+            self._lent_notice_handlers.append(callback)
+
+    async def close(self) -> None:
+        """Give a lent connection back to its pool, close the others."""
+        pool, self._lender = self._lender, None
+        if pool is None:
+            await super().close()
+            return
+        try:
+            for callback in self._lent_notice_handlers:
+                self.remove_notice_handler(callback)
+            status = self.info.transaction_status
+            if status in (TransactionStatus.INTRANS, TransactionStatus.INERROR):
+                await self.rollback()
+            elif status != TransactionStatus.IDLE:
+                # Broken, or invalidated in the middle of a query
+                await super().close()
+            if not self.closed:
+                await self.set_autocommit(True)
+        except Exception as e:
+            logger.warning("postgres_connection_reset_failed", error=str(e))
+            await super().close()
+        finally:
+            self._lent_notice_handlers.clear()
+            # The pool discards closed connections
+            await pool.putconn(self)
+
+
+class SharedConnectionPool(AsyncConnectionPool):
+    """Connection pool attributing each lent connection to its consumer."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        """Initialize the pool, see `AsyncConnectionPool`."""
+        # Consumer of each lent connection, by connection id
+        self._consumers: Dict[int, str] = {}
+        super().__init__(*args, connection_class=SharedConnection, **kwargs)
+
+    async def getconn(self, timeout: Optional[float] = None, consumer: str = DEFAULT_CONSUMER) -> AsyncConnection:
+        """Borrow a connection, see `AsyncConnectionPool.getconn`.
+
+        Args:
+            timeout: The maximum seconds to wait, the pool timeout by default.
+            consumer: Who borrows the connection, used as metric label.
+
+        Returns:
+            AsyncConnection: The connection, to give back with `putconn`.
+        """
+        start = time.monotonic()
+        try:
+            conn = await super().getconn(timeout)
+        except PoolTimeout:
+            db_pool_timeouts_total.labels(pool=self.name, consumer=consumer).inc()
+            logger.warning("postgres_pool_timeout", consumer=consumer, **self.get_stats())
+            raise
+        db_pool_wait_seconds.labels(pool=self.name, consumer=consumer).observe(time.monotonic() - start)
+        self._consumers[id(conn)] = consumer
+        db_pool_connections_in_use.labels(pool=self.name, consumer=consumer).inc()
+        self._update_gauges()
+        return conn
+
+    async def lend(self, consumer: str) -> SharedConnection:
+        """Borrow a connection for a SQLAlchemy engine, given back when the engine closes it.
+
+        Args:
+            consumer: Who borrows the connection, used as metric label.
+
+        Returns:
+            SharedConnection: The connection, out of autocommit as SQLAlchemy manages transactions itself.
+        """
+        conn = await self.getconn(consumer=consumer)
+        try:
+            await conn.set_autocommit(False)
+        except BaseException:
+            await self.putconn(conn)
+            raise
+        conn.lend(self)
+        return conn
+
+    async def putconn(self, conn: AsyncConnection) -> None:
+        """Give a borrowed connection back, see `AsyncConnectionPool.putconn`."""
+        consumer = self._consumers.pop(id(conn), None)
+        if consumer is not None:
+            db_pool_connections_in_use.labels(pool=self.name, consumer=consumer).dec()
+        await super().putconn(conn)
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        """Export the open connections and the waiting requests."""
+        stats = self.get_stats()
+        db_pool_size.labels(pool=self.name).set(stats["pool_size"])
+        db_pool_waiting.labels(pool=self.name).set(stats["requests_waiting"])
+
+
+class PostgresPoolManager:
+    """Opens the shared Postgres pool of this worker and lends it to its consumers."""
+
+    def __init__(
+        self, url: str, min_size: int, max_size: int, timeout: float, pgbouncer: bool, name: str = "primary"
+    ):
+        """Initialize the manager, the pool is opened on first use.
+
+        Args:
+            url: The database URL, with or without a SQLAlchemy driver name.
+            min_size: The connections kept open.
+            max_size: The maximum connections open at once.
+            timeout: The maximum seconds a consumer waits for a connection.
+            pgbouncer: Whether the URL points to PgBouncer in transaction pooling mode.
+            name: The name of the pool, used as metric label.
+        """
+        self.url = url
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pgbouncer = pgbouncer
+        self._pool: Optional[SharedConnectionPool] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the application database is Postgres."""
+        return is_postgres_url(self.url)
+
+    @property
+    def conninfo(self) -> str:
+        """The libpq connection URI of the database."""
+        return make_url(self.url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+    async def get_pool(self) -> SharedConnectionPool:
+        """Return the shared pool, opening it on first use.
+
+        Returns:
+            SharedConnectionPool: The open pool.
+        """
+        if self._pool is None:
+            async with self._lock:
+                if self._pool is None:
+                    pool = SharedConnectionPool(
+                        self.conninfo,
+                        name=self.name,
+                        open=False,
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        timeout=self.timeout,
+                        # Same as the recycling of the former SQLAlchemy pool
+                        max_lifetime=1800,
+                        kwargs={
+                            # Expected by the checkpointer, the model layer turns it off while borrowing
+                            "autocommit": True,
+                            "connect_timeout": 5,
+                            # PgBouncer in transaction mode may run each statement on another server
+                            # session, where a statement prepared earlier does not exist
+                            "prepare_threshold": None if self.pgbouncer else 5,
+                        },
+                    )
+                    await pool.open()
+                    db_pool_max_connections.labels(pool=self.name).set(self.max_size)
+                    self._pool = pool
+                    logger.info(
+                        "postgres_pool_opened",
+                        pool=self.name,
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        pgbouncer=self.pgbouncer,
+                        environment=settings.ENVIRONMENT.value,
+                    )
+        return self._pool
+
+    async def create_engine(self, consumer: str) -> AsyncEngine:
+        """Create a SQLAlchemy engine borrowing its connections from the shared pool.
+
+        Args:
+            consumer: Who borrows the connections, used as metric label.
+
+        Returns:
+            AsyncEngine: The engine.
+        """
+        pool = await self.get_pool()
+
+        async def connect() -> AsyncConnection:
+            return await pool.lend(consumer)
+
+        # SQLAlchemy sees a new connection on every checkout, and closes it on checkin
+        return create_async_engine(
+            make_url(self.url).set(drivername="postgresql+psycopg"),
+            poolclass=NullPool,
+            async_creator=connect,
+        )
+
+    async def close(self) -> None:
+        """Close the shared pool, once its consumers are closed."""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+            logger.info("postgres_pool_closed", pool=self.name, environment=settings.ENVIRONMENT.value)
+
+
+class Replica:
+    """A read replica, with its pool and its last measured replication lag."""
+
+    def __init__(self, pool_manager: PostgresPoolManager):
+        """Initialize the replica.
+
+        Args:
+            pool_manager: The manager of the pool of the replica, named after it.
+        """
+        self.name = pool_manager.name
+        self.pool_manager = pool_manager
+        # None until measured, and after the replica failed
+        self.lag: Optional[float] = None
+        self._engine: Optional[AsyncEngine] = None
+        self._engine_lock = asyncio.Lock()
+
+    async def get_engine(self) -> AsyncEngine:
+        """Return the SQLAlchemy engine of the replica, creating it on first use."""
+        if self._engine is None:
+            async with self._engine_lock:
+                if self._engine is None:
+                    self._engine = await self.pool_manager.create_engine("models")
+        return self._engine
+
+    async def measure_lag(self) -> None:
+        """Measure the replication lag of the replica."""
+        pool = await self.pool_manager.get_pool()
+        async with pool.connection() as conn:
+            cursor = await conn.execute(_REPLICA_LAG_QUERY)
+            row = await cursor.fetchone()
+        self.lag = float(row[0])
+        db_replica_lag_seconds.labels(replica=self.name).set(self.lag)
+
+    def mark_failed(self) -> None:
+        """Stop routing to the replica until its lag is measured again."""
+        self.lag = None
+        db_replica_lag_seconds.labels(replica=self.name).set(float("nan"))
+
+    async def close(self) -> None:
+        """Dispose of the engine and close the pool of the replica."""
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+        await self.pool_manager.close()
+
+
+class ReplicaRouter:
+    """Routes read-only queries to the replicas that are caught up enough."""
+
+    def __init__(self, replicas: List[Replica], max_lag: float, check_interval: float):
+        """Initialize the router.
+
+        Args:
+            replicas: The replicas, none to always read from the primary.
+            max_lag: The maximum replication lag of a replica receiving reads, in seconds.
+            check_interval: Seconds between two measures of the replication lags.
+        """
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        # A write is visible on the replicas at most this long after it was made
+        self.sticky_seconds = max_lag + check_interval
+        # Last write of each recently written key
+        self._writes: Dict[str, float] = {}
+        self._next = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start measuring the replication lags."""
+        if self.replicas:
+            self._task = asyncio.create_task(self._check_replicas(), name="replica-check")
+            logger.info(
+                "replica_router_started",
+                replicas=[replica.name for replica in self.replicas],
+                max_lag=self.max_lag,
+                environment=settings.ENVIRONMENT.value,
+            )
+
+    async def close(self) -> None:
+        """Stop measuring the replication lags and close the replica pools."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for replica in self.replicas:
+            await replica.close()
+
+    def mark_written(self, key: str) -> None:
+        """Keep the reads of a key on the primary until the replicas have caught up with a write.
+
+        Args:
+            key: The written key, such as a session ID.
+        """
+        if self.replicas:
+            self._writes[key] = time.monotonic()
+
+    def route(self, key: Optional[str] = None) -> Optional[Replica]:
+        """Pick the replica of a read-only query.
+
+        Args:
+            key: The key read, to read your own writes.
+
+        Returns:
+            Optional[Replica]: The replica, or None to read from the primary.
+        """
+        if not self.replicas:
+            return None
+        written_at = self._writes.get(key) if key is not None else None
+        if written_at is not None and time.monotonic() - written_at < self.sticky_seconds:
+            reason = "sticky"
+        else:
+            caught_up = [r for r in self.replicas if r.lag is not None and r.lag <= self.max_lag]
+            if caught_up:
+                db_reads_total.labels(target="replica", reason="replica").inc()
+                return caught_up[next(self._next) % len(caught_up)]
+            reason = "unavailable"
+        db_reads_total.labels(target="primary", reason=reason).inc()
+        return None
+
+    def fall_back(self, replica: Replica, error: Optional[Exception] = None) -> None:
+        """Record that a read is retried on the primary.
+
+        Args:
+            replica: The replica that was read.
+            error: The error of the replica, None if it did not have the data yet.
+        """
+        db_reads_total.labels(target="primary", reason="fallback").inc()
+        if error is not None:
+            logger.warning("replica_read_failed", replica=replica.name, error=str(error))
+            replica.mark_failed()
+
+    async def _check_replicas(self) -> None:
+        """Measure the replication lags and forget the writes the replicas caught up with."""
+        while True:
+            for replica in self.replicas:
+                try:
+                    await replica.measure_lag()
+                except Exception as e:
+                    if replica.lag is not None:
+                        logger.warning("replica_check_failed", replica=replica.name, error=str(e))
+                    replica.mark_failed()
+            horizon = time.monotonic() - self.sticky_seconds
+            self._writes = {key: at for key, at in self._writes.items() if at >= horizon}
+            await asyncio.sleep(self.check_interval)
+
+
+pool_manager = PostgresPoolManager(
+    settings.POSTGRES_URL,
+    min_size=settings.POSTGRES_POOL_SIZE,
+    max_size=settings.POSTGRES_POOL_SIZE + settings.POSTGRES_MAX_OVERFLOW,
+    timeout=settings.POSTGRES_POOL_TIMEOUT,
+    pgbouncer=settings.POSTGRES_PGBOUNCER,
+)
+
+# Connections of the run locks through PgBouncer, one per running thread, apart from
+# the shared pool so that lock holders cannot starve the checkpoint writes of their runs
+run_lock_pool_manager = PostgresPoolManager(
+    settings.POSTGRES_URL,
+    min_size=1,
+    max_size=settings.RUN_LOCK_POOL_SIZE,
+    timeout=settings.POSTGRES_POOL_TIMEOUT,
+    pgbouncer=settings.POSTGRES_PGBOUNCER,
+    name="run_lock",
+)
+
+replica_router = ReplicaRouter(
+    [
+        Replica(
+            PostgresPoolManager(
+                url,
+                min_size=settings.POSTGRES_REPLICA_POOL_SIZE,
+                max_size=settings.POSTGRES_REPLICA_POOL_SIZE,
+                timeout=settings.POSTGRES_POOL_TIMEOUT,
+                pgbouncer=settings.POSTGRES_PGBOUNCER,
+                name=f"replica-{index}",
+            )
+        )
+        for index, url in enumerate(settings.POSTGRES_REPLICA_URLS)
+    ],
+    max_lag=settings.POSTGRES_REPLICA_MAX_LAG,
+    check_interval=settings.POSTGRES_REPLICA_CHECK_INTERVAL,
+)
@@ -0,0 +1,148 @@
+"""This file contains the on-demand profilers used by the profiling endpoints.
+
+The CPU profiler samples the stack of every thread from a background thread
+and aggregates them in the collapsed stack format read by flamegraph.pl and
+speedscope. The allocation profiler diffs two tracemalloc snapshots taken
+around a time window. Both run while the process keeps serving traffic, so
+they show where real requests spend their time and memory.
+"""
+
+import asyncio
+import os
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from types import FrameType
+from typing import (
+    Dict,
+    List,
+)
+
+_PATH_PREFIXES = sorted(
+    {
+        path + os.sep
+        for path in (
+            sysconfig.get_paths()["purelib"],
+            sysconfig.get_paths()["stdlib"],
+            os.getcwd(),
+        )
+    },
+    key=len,
+    reverse=True,
+)
+
+
+def _short_path(filename: str) -> str:
+    """Strip the site-packages, stdlib or working directory prefix of a path."""
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            return filename[len(prefix) :]
+    return filename
+
+
+def _collapse(frame: FrameType) -> List[str]:
+    """Return the frames of a stack, outermost first, as flamegraph labels."""
+    labels = []
+    while frame is not None:
+        code = frame.f_code
+        labels.append(f"{code.co_qualname} ({_short_path(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class CpuProfiler:
+    """Sampling CPU profiler producing collapsed stacks."""
+
+    def __init__(self, interval: float):
+        """Initialize the profiler.
+
+        Args:
+            interval: Seconds between two samples.
+        """
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="cpu-profiler", daemon=True)
+
+    def _sample(self) -> None:
+        """Record the stack of every other thread until stopped."""
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = [names.get(thread_id, str(thread_id)), *_collapse(frame)]
+                self.samples[";".join(stack)] += 1
+            self.sample_count += 1
+
+    async def run(self, duration: float) -> str:
+        """Sample for `duration` seconds without blocking the event loop.
+
+        Args:
+            duration: Seconds to sample for.
+
+        Returns:
+            str: One `stack count` line per distinct stack.
+        """
+        self._thread.start()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            self._stopped.set()
+            await asyncio.to_thread(self._thread.join)
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+
+async def allocation_diff(duration: float, limit: int, frames: int) -> Dict[str, object]:
+    """Diff the allocations made during a time window.
+
+    Tracing slows every allocation down, so it is only enabled for the window
+    unless it was already running.
+
+    Args:
+        duration: Seconds between the two snapshots.
+        limit: Number of allocation sites to return, largest growth first.
+        frames: Number of frames stored per allocation.
+
+    Returns:
+        Dict[str, object]: The totals and the allocation sites with their growth.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(frames)
+    try:
+        before = tracemalloc.take_snapshot()
+        start = time.monotonic()
+        await asyncio.sleep(duration)
+        after = tracemalloc.take_snapshot()
+        elapsed = time.monotonic() - start
+        traced_current, traced_peak = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    # Ignore the bookkeeping of tracemalloc itself
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "traceback")
+    return {
+        "duration": elapsed,
+        "traced_current_bytes": traced_current,
+        "traced_peak_bytes": traced_peak,
+        "size_diff_bytes": sum(stat.size_diff for stat in stats),
+        "stats": [
+            {
+                "size_diff_bytes": stat.size_diff,
+                "size_bytes": stat.size,
+                "count_diff": stat.count_diff,
+                "count": stat.count,
+                "traceback": [f"{_short_path(frame.filename)}:{frame.lineno}" for frame in stat.traceback],
+            }
+            for stat in stats[:limit]
+        ],
+    }
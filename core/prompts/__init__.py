@@ -1,18 +1,40 @@
-"""This file contains the prompts for the agent."""
+"""This file contains the prompts for the agent.
+
+Providers cache the longest previously seen prefix of a prompt, byte for
+byte. The system prompt (sent after the tool schemas) therefore holds no
+per-request data, and volatile data goes in the context prompt, which is
+sent after the conversation and only changes once a day.
+"""
 
 import os
-from datetime import datetime
+from datetime import date
+from typing import Optional
 
 from core.config import settings
 
 
+def _read_prompt(name: str) -> str:
+    """Read a prompt template from this directory."""
+    with open(os.path.join(os.path.dirname(__file__), name), "r") as f:
+        return f.read()
+
+
 def load_system_prompt():
     """Load the system prompt from the file."""
-    with open(os.path.join(os.path.dirname(__file__), "system.md"), "r") as f:
-        return f.read().format(
-            agent_name=settings.PROJECT_NAME + " Agent",
-            current_date_and_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        )
+    return _read_prompt("system.md").format(agent_name=settings.PROJECT_NAME + " Agent")
+
+
+def get_context_prompt(today: Optional[date] = None) -> str:
+    """Get the context prompt for the current day.
+
+    Args:
+        today: The date to use, today by default.
+
+    Returns:
+        str: The context prompt.
+    """
+    return CONTEXT_PROMPT_TEMPLATE.format(current_date=(today or date.today()).isoformat())
 
 
 SYSTEM_PROMPT = load_system_prompt()
+CONTEXT_PROMPT_TEMPLATE = _read_prompt("context.md")
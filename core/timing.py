@@ -0,0 +1,103 @@
+"""This file contains the per-request timing context.
+
+`MetricsMiddleware` opens a `RequestTiming` for every request and stores it
+in a context variable. Code on the request path records spans into it with
+`timed(name)`; spans of the same name are summed and counted. The breakdown
+is returned in the `Server-Timing` header and logged as `request_timing` once
+the body is sent, so the spans of a streamed body are only in the log.
+
+The context variable holds a mutable object rather than being set per span,
+so spans recorded in tasks and threads spawned by the request (graph nodes,
+`sync_to_async`, background checkpoint writes) still land in the request's
+breakdown.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+
+class RequestTiming:
+    """Accumulated span durations of one request."""
+
+    def __init__(self):
+        """Initialize an empty timing context starting now."""
+        self.start = time.perf_counter()
+        self.spans: Dict[str, List[float]] = {}
+
+    def add(self, name: str, duration: float) -> None:
+        """Record a span.
+
+        Args:
+            name: Name of the span, a `Server-Timing` token such as "llm".
+            duration: Duration of the span in seconds.
+        """
+        self.spans.setdefault(name, []).append(duration)
+
+    def elapsed(self) -> float:
+        """Return the seconds since the request started."""
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        """Render the spans and the total as a `Server-Timing` header value."""
+        entries = []
+        for name, durations in list(self.spans.items()):
+            entry = f"{name};dur={sum(durations) * 1000:.1f}"
+            if len(durations) > 1:
+                entry += f';desc="{len(durations)}x"'
+            entries.append(entry)
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def as_log_fields(self) -> Dict[str, float]:
+        """Return the spans as `<name>_ms` and `<name>_count` log fields."""
+        fields: Dict[str, float] = {}
+        for name, durations in list(self.spans.items()):
+            fields[f"{name}_ms"] = round(sum(durations) * 1000, 1)
+            fields[f"{name}_count"] = len(durations)
+        return fields
+
+
+_request_timing: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+def start_request_timing() -> RequestTiming:
+    """Open a timing context for the current request.
+
+    Returns:
+        RequestTiming: The new timing context.
+    """
+    timing = RequestTiming()
+    _request_timing.set(timing)
+    return timing
+
+
+def get_request_timing() -> Optional[RequestTiming]:
+    """Return the timing context of the current request, if any."""
+    return _request_timing.get()
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Record the duration of the block as a span of the current request.
+
+    Outside of a request, the block runs untimed.
+
+    Args:
+        name: Name of the span.
+    """
+    timing = _request_timing.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
@@ -9,10 +9,26 @@ from fastapi.responses import JSONResponse
 from langfuse import Langfuse
 
 from api.v1.api import api_router
+from api.v1.auth import (
+    db_service,
+    token_revocations,
+)
+from api.v1.chatbot import (
+    agent,
+    run_queue,
+)
 from core.config import settings
+from core.diagnostics import create_event_loop_monitor
+from core.http_client import close_http_client
+from core.langgraph.run_lock import check_run_lock_settings
 from core.limiter import limiter
 from core.logging import logger
 from core.middleware import MetricsMiddleware
+from core.postgres import (
+    pool_manager,
+    replica_router,
+    run_lock_pool_manager,
+)
 
 load_dotenv()
 
@@ -32,7 +48,25 @@ async def lifespan(app: FastAPI):
         version=settings.VERSION,
         api_prefix=settings.API_V1_STR,
     )
+    # Refuse to start with more concurrent runs than run lock connections
+    check_run_lock_settings()
+    event_loop_monitor = create_event_loop_monitor()
+    if event_loop_monitor is not None:
+        event_loop_monitor.start()
+    replica_router.start()
+    await token_revocations.start()
+    await run_queue.start()
     yield
+    await run_queue.stop()
+    await token_revocations.stop()
+    if event_loop_monitor is not None:
+        await event_loop_monitor.stop()
+    await agent.close()
+    await close_http_client()
+    await db_service.close()
+    await replica_router.close()
+    await pool_manager.close()
+    await run_lock_pool_manager.close()
     logger.info("application_shutdown")
 
 
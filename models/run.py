@@ -0,0 +1,62 @@
+"""This file contains the run model for the application."""
+
+from datetime import UTC, datetime
+from enum import Enum
+from typing import (
+    List,
+    Optional,
+)
+
+from sqlalchemy import JSON, Column
+from sqlmodel import Field
+
+from models.base import BaseModel
+
+
+class RunStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class Run(BaseModel, table=True):
+    """Run model for storing background agent runs.
+
+    A run is owned by the worker holding its lease. A run whose lease expired
+    while queued or running is claimed again by a worker and resumed from the
+    last checkpoint of its session.
+
+    Attributes:
+        id: The primary key
+        session_id: Foreign key to the session the run appends to
+        user_id: Foreign key to the user
+        status: Where the run is in its lifecycle
+        input_messages: The new user messages, with the ids they get in the checkpoint
+        model_tier: The model tier requested by the client, if any
+        result_messages: The messages produced by the run, once succeeded
+        checkpoint_id: The checkpoint of the session after the run
+        error: Why the run failed
+        attempts: How many times a worker started the run
+        lease_expires_at: Until when the owning worker holds the run
+        updated_at: When the run last changed
+        created_at: When the run was submitted
+    """
+
+    id: str = Field(primary_key=True)
+    session_id: str = Field(foreign_key="session.id", index=True)
+    user_id: int = Field(foreign_key="user.id")
+    status: RunStatus = Field(default=RunStatus.QUEUED, index=True)
+    input_messages: List[dict] = Field(sa_column=Column(JSON, nullable=False))
+    model_tier: Optional[str] = Field(default=None)
+    result_messages: Optional[List[dict]] = Field(default=None, sa_column=Column(JSON))
+    checkpoint_id: Optional[str] = Field(default=None)
+    error: Optional[str] = Field(default=None)
+    attempts: int = Field(default=0)
+    lease_expires_at: datetime = Field(default_factory=lambda: datetime.now(UTC), index=True)
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+    @property
+    def finished(self) -> bool:
+        """Whether the run reached a final status."""
+        return self.status in (RunStatus.SUCCEEDED, RunStatus.FAILED)
@@ -2,6 +2,7 @@
 
 from typing import TYPE_CHECKING, List
 
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship
 
 from models.base import BaseModel
@@ -22,6 +23,9 @@ class Session(BaseModel, table=True):
         user: Relationship to the session owner
     """
 
+    # Serves the foreign key lookups and the keyset pagination of a user's sessions
+    __table_args__ = (Index("ix_session_user_id_created_at_id", "user_id", "created_at", "id"),)
+
     id: str = Field(primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     name: str = Field(default="")
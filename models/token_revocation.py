@@ -0,0 +1,46 @@
+"""This file contains the token revocation model for the application."""
+
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Index, text
+from sqlmodel import Field
+
+from models.base import BaseModel
+
+
+class TokenRevocation(BaseModel, table=True):
+    """Token revocation model, loaded by every worker into its revocation set.
+
+    A revocation without session holds the revocation generation of a user:
+    the tokens of the user issued with a lower generation are revoked. It is
+    kept forever, so the generation of a user only ever grows. A revocation
+    with a session revokes the tokens of that session until all of them have
+    expired.
+
+    Attributes:
+        id: The primary key
+        user_id: Foreign key to the user whose tokens are revoked
+        session_id: The session whose tokens are revoked, None for all the tokens of the user
+        generation: The revocation generation of the user
+        expires_at: When every token revoked by a session revocation has expired
+        created_at: When the tokens were revoked
+    """
+
+    # One generation row per user, so revocations can increment it in a single upsert
+    __table_args__ = (
+        Index(
+            "ix_tokenrevocation_user_generation",
+            "user_id",
+            unique=True,
+            postgresql_where=text("session_id IS NULL"),
+            sqlite_where=text("session_id IS NULL"),
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    # Not a foreign key, the revocation outlives the deleted session
+    session_id: Optional[str] = Field(default=None, index=True)
+    generation: int = Field(default=0)
+    expires_at: Optional[datetime] = Field(default=None, index=True)
@@ -1,9 +1,37 @@
 import re
 from datetime import datetime
+from enum import Enum
+from typing import List, Optional
 
 from pydantic import BaseModel, EmailStr, Field, SecretStr, field_validator
 
 
+class TokenKind(str, Enum):
+    USER = "user"
+    SESSION = "session"
+
+
+class TokenClaims(BaseModel):
+    """Claims of an access token, named after their JWT fields.
+
+    Tokens issued before the claims were typed only have a subject, and are
+    checked against the database.
+
+    Attributes:
+        subject: The session ID of a session token, the user ID of a user token
+        kind: Whether the token authenticates a user or a session
+        user_id: The user the token was issued to
+        session_id: The session of a session token
+        generation: The revocation generation of the user when the token was issued
+    """
+
+    subject: str = Field(alias="sub")
+    kind: Optional[TokenKind] = None
+    user_id: Optional[int] = Field(default=None, alias="uid")
+    session_id: Optional[str] = Field(default=None, alias="sid")
+    generation: int = Field(default=0, alias="gen")
+
+
 class Token(BaseModel):
     access_token: str = Field(..., description="The JWT access token")
     token_type: str = Field(default="bearer", description="The type of token")
@@ -96,6 +124,54 @@ class SessionResponse(BaseModel):
         return sanitized
 
 
+class SessionSummary(BaseModel):
+    """A session of a user, as listed.
+
+    Attributes:
+        session_id: The unique identifier of the session
+        name: Name of the session
+        created_at: When the session was created
+    """
+
+    session_id: str = Field(..., description="The unique identifier for the chat session")
+    name: str = Field(default="", description="Name of the session")
+    created_at: datetime = Field(..., description="When the session was created")
+
+
+class SessionListResponse(BaseModel):
+    """Response model for a page of the sessions of a user, newest first.
+
+    Attributes:
+        sessions: The sessions of the page
+        next_cursor: The cursor of the next page, None on the last page
+    """
+
+    sessions: List[SessionSummary] = Field(..., description="The sessions of the page")
+    next_cursor: Optional[str] = Field(default=None, description="Pass as cursor to get the next page")
+
+
+class SessionDeleteRequest(BaseModel):
+    """Request model for deleting sessions with their chat history.
+
+    Attributes:
+        session_ids: The IDs of the sessions to delete
+    """
+
+    session_ids: List[str] = Field(
+        ..., description="The IDs of the sessions to delete", min_length=1, max_length=1000
+    )
+
+
+class SessionDeleteResponse(BaseModel):
+    """Response model for deleted sessions.
+
+    Attributes:
+        deleted: The IDs of the deleted sessions
+    """
+
+    deleted: List[str] = Field(..., description="The IDs of the deleted sessions")
+
+
 class TokenResponse(BaseModel):
     """Response model for login endpoint.
 
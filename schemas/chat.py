@@ -1,7 +1,53 @@
 import re
-from typing import List, Literal
+from datetime import datetime
+from typing import Any, List, Literal, Optional
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+from core.config import settings
+
+# Case-insensitive like re.IGNORECASE, which also matches e.g. "ſ" for "s"
+_SCRIPT_OPEN = re.compile("<script", re.IGNORECASE)
+_SCRIPT_CLOSE = re.compile("</script>", re.IGNORECASE)
+
+
+def contains_script_block(value: str) -> bool:
+    """Check for a `<script ...>...</script>` block, ignoring case.
+
+    Equivalent to `re.search(r"<script.*?>.*?</script>", value, re.I | re.S)`
+    but linear: if the first opening tag has no ">" and closing tag after it,
+    no later opening tag can have them either.
+
+    Args:
+        value: The string to check
+
+    Returns:
+        bool: Whether the string contains a script block
+    """
+    if "<" not in value:
+        return False
+    opening = _SCRIPT_OPEN.search(value)
+    if opening is None:
+        return False
+    tag_end = value.find(">", opening.end())
+    return tag_end >= 0 and _SCRIPT_CLOSE.search(value, tag_end + 1) is not None
+
+
+def check_model_tier(value: Optional[str]) -> Optional[str]:
+    """Check that a model tier requested by a client is configured.
+
+    Args:
+        value: The model tier, if any
+
+    Returns:
+        Optional[str]: The model tier
+
+    Raises:
+        ValueError: If the model tier is not configured
+    """
+    if value is not None and value not in settings.LLM_MODEL_TIERS:
+        raise ValueError(f"Unknown model tier, must be one of {', '.join(settings.LLM_MODEL_TIERS)}")
+    return value
 
 
 class Message(BaseModel):
@@ -28,7 +74,7 @@ class Message(BaseModel):
             ValueError: If the content contains disallowed patterns
         """
         # Check for potentially harmful content
-        if re.search(r"<script.*?>.*?</script>", v, re.IGNORECASE | re.DOTALL):
+        if contains_script_block(v):
             raise ValueError("Content contains potentially harmful script tags")
 
         # Check for null bytes
@@ -42,11 +88,16 @@ class ChatResponse(BaseModel):
     """Response model for chat endpoint.
 
     Attributes:
-        messages: List of messages in the conversation.
+        messages: The messages produced by this turn.
+        checkpoint_id: The latest checkpoint of the conversation.
     """
 
     messages: List[Message] = Field(
-        ..., description="List of messages in the conversation"
+        ..., description="The messages produced by this turn"
+    )
+    checkpoint_id: Optional[str] = Field(
+        default=None,
+        description="The latest checkpoint of the conversation, to send as expected_checkpoint_id",
     )
 
 
@@ -54,7 +105,10 @@ class ChatRequest(BaseModel):
     """Request model for chat endpoint.
 
     Attributes:
-        messages: List of messages in the conversation.
+        messages: List of messages in the conversation, or the new user messages in delta mode.
+        mode: "full" to send the whole conversation, "delta" to send only the new turn.
+        expected_checkpoint_id: In delta mode, the checkpoint the client last saw.
+        model_tier: The model tier to use instead of the routed one.
     """
 
     messages: List[Message] = Field(
@@ -62,3 +116,143 @@ class ChatRequest(BaseModel):
         description="List of messages in the conversation",
         min_length=1,
     )
+    mode: Literal["full", "delta"] = Field(
+        default="full",
+        description="'full' to send the whole conversation, 'delta' to send only the new user messages",
+    )
+    expected_checkpoint_id: Optional[str] = Field(
+        default=None,
+        description="Delta mode only: the checkpoint_id of the last response, rejected with 409 if outdated",
+    )
+    model_tier: Optional[str] = Field(
+        default=None,
+        description="The model tier to use, one of the configured tiers; routed from the request if omitted",
+    )
+
+    @field_validator("model_tier")
+    @classmethod
+    def validate_model_tier(cls, v: Optional[str]) -> Optional[str]:
+        """Validate that the requested model tier is configured."""
+        return check_model_tier(v)
+
+    @model_validator(mode="after")
+    def validate_delta(self) -> "ChatRequest":
+        """Validate that a delta request only carries new user messages.
+
+        Returns:
+            ChatRequest: The validated request
+
+        Raises:
+            ValueError: If a delta request contains other roles, or a full request
+                an expected checkpoint
+        """
+        if self.mode == "delta":
+            if any(message.role != "user" for message in self.messages):
+                raise ValueError("Delta requests may only contain new user messages")
+        elif self.expected_checkpoint_id is not None:
+            raise ValueError("expected_checkpoint_id is only supported in delta mode")
+        return self
+
+
+class RunRequest(BaseModel):
+    """Request model for submitting a background run.
+
+    Attributes:
+        messages: The new user messages, appended to the conversation of the session.
+        model_tier: The model tier to use instead of the routed one.
+    """
+
+    messages: List[Message] = Field(
+        ...,
+        description="The new user messages",
+        min_length=1,
+    )
+    model_tier: Optional[str] = Field(
+        default=None,
+        description="The model tier to use, one of the configured tiers; routed from the request if omitted",
+    )
+
+    @field_validator("messages")
+    @classmethod
+    def validate_messages(cls, v: List[Message]) -> List[Message]:
+        """Validate that a run only carries new user messages.
+
+        Args:
+            v: The messages to validate
+
+        Returns:
+            List[Message]: The validated messages
+
+        Raises:
+            ValueError: If a message is not a user message
+        """
+        if any(message.role != "user" for message in v):
+            raise ValueError("Runs may only contain new user messages")
+        return v
+
+    @field_validator("model_tier")
+    @classmethod
+    def validate_model_tier(cls, v: Optional[str]) -> Optional[str]:
+        """Validate that the requested model tier is configured."""
+        return check_model_tier(v)
+
+
+class RunResponse(BaseModel):
+    """Response model for background run endpoints.
+
+    Attributes:
+        run_id: The ID of the run.
+        session_id: The session the run appends to.
+        status: queued, running, succeeded or failed.
+        messages: The messages produced by the run, once succeeded.
+        checkpoint_id: The latest checkpoint of the conversation after the run.
+        error: Why the run failed.
+        created_at: When the run was submitted.
+        updated_at: When the run last changed.
+    """
+
+    run_id: str = Field(..., description="The ID of the run")
+    session_id: str = Field(..., description="The session the run appends to")
+    status: Literal["queued", "running", "succeeded", "failed"] = Field(..., description="The status of the run")
+    messages: Optional[List[Message]] = Field(default=None, description="The messages produced by the run")
+    checkpoint_id: Optional[str] = Field(default=None, description="The checkpoint of the conversation after the run")
+    error: Optional[str] = Field(default=None, description="Why the run failed")
+    created_at: datetime = Field(..., description="When the run was submitted")
+    updated_at: datetime = Field(..., description="When the run last changed")
+
+
+class StreamEvent(BaseModel):
+    """Event of a streamed chat turn.
+
+    Attributes:
+        type: "text" for a frame of the answer, "tool_start" and "tool_end" around
+            a tool call, "error" if the turn failed, "done" once it is over.
+        content: The text of a text frame, or the reason of an error.
+        tool: The name of the tool of a tool event.
+        tool_call_id: The ID of the tool call of a tool event.
+        status: The outcome of a tool_end event, "success" or "error".
+    """
+
+    type: Literal["text", "tool_start", "tool_end", "error", "done"] = Field(..., description="The event type")
+    content: Optional[str] = Field(default=None, description="The text of the frame, or the reason of an error")
+    tool: Optional[str] = Field(default=None, description="The tool called")
+    tool_call_id: Optional[str] = Field(default=None, description="The ID of the tool call")
+    status: Optional[Literal["success", "error"]] = Field(default=None, description="The outcome of the tool call")
+
+
+class ToolOutputResponse(BaseModel):
+    """Response model for the output of a tool call.
+
+    Attributes:
+        tool_call_id: The ID of the tool call.
+        tool: The tool called.
+        status: The outcome of the tool call.
+        content: The compacted output, as sent to the model.
+        output: The full output of the tool if kept, its structured results or its raw content.
+    """
+
+    tool_call_id: str = Field(..., description="The ID of the tool call")
+    tool: Optional[str] = Field(default=None, description="The tool called")
+    status: Literal["success", "error"] = Field(..., description="The outcome of the tool call")
+    content: str = Field(..., description="The compacted output, as sent to the model")
+    output: Optional[Any] = Field(default=None, description="The full output of the tool, if kept")
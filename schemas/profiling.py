@@ -0,0 +1,39 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+class AllocationSite(BaseModel):
+    """Growth of the memory allocated from one traceback.
+
+    Attributes:
+        size_diff_bytes: Bytes allocated during the window and still alive
+        size_bytes: Bytes alive at the end of the window
+        count_diff: Change in the number of live blocks
+        count: Live blocks at the end of the window
+        traceback: Allocation frames as file:line, innermost last
+    """
+
+    size_diff_bytes: int = Field(..., description="Growth in bytes over the window")
+    size_bytes: int = Field(..., description="Live bytes at the end of the window")
+    count_diff: int = Field(..., description="Growth in live blocks over the window")
+    count: int = Field(..., description="Live blocks at the end of the window")
+    traceback: List[str] = Field(..., description="Allocation frames as file:line")
+
+
+class AllocationDiffResponse(BaseModel):
+    """Response model for the allocation profile.
+
+    Attributes:
+        duration: Seconds between the two snapshots
+        traced_current_bytes: Traced memory at the end of the window
+        traced_peak_bytes: Peak traced memory during the window
+        size_diff_bytes: Total growth in bytes over the window
+        stats: Allocation sites, largest growth first
+    """
+
+    duration: float = Field(..., description="Seconds between the two snapshots")
+    traced_current_bytes: int = Field(..., description="Traced memory at the end of the window")
+    traced_peak_bytes: int = Field(..., description="Peak traced memory during the window")
+    size_diff_bytes: int = Field(..., description="Total growth in bytes over the window")
+    stats: List[AllocationSite] = Field(..., description="Allocation sites, largest growth first")
@@ -0,0 +1,53 @@
+"""This file contains the production entry point of the API.
+
+Unlike `python main.py`, which runs a single reloading worker for development,
+this starts SERVER_WORKERS worker processes on uvloop and httptools.
+
+Workers only serialize the runs of a session across processes when the
+checkpoints live in Postgres (advisory run locks); with the SQLite or memory
+checkpointer, the server refuses to start more than one worker.
+
+Usage:
+    python server.py
+    SERVER_WORKERS=8 python server.py
+"""
+
+import uvicorn
+
+from core.config import settings
+from core.langgraph.run_lock import check_run_lock_settings
+from core.logging import logger
+
+
+def main() -> None:
+    """Run the API with the configured workers, event loop and HTTP parser."""
+    # Before forking, so a misconfiguration stops the server rather than every worker
+    check_run_lock_settings()
+    logger.info(
+        "server_starting",
+        host=settings.SERVER_HOST,
+        port=settings.SERVER_PORT,
+        workers=settings.SERVER_WORKERS,
+        loop=settings.SERVER_LOOP,
+        http=settings.SERVER_HTTP,
+        environment=settings.ENVIRONMENT.value,
+    )
+    uvicorn.run(
+        # An import string, so every worker process imports its own app
+        "main:app",
+        host=settings.SERVER_HOST,
+        port=settings.SERVER_PORT,
+        workers=settings.SERVER_WORKERS,
+        loop=settings.SERVER_LOOP,
+        http=settings.SERVER_HTTP,
+        timeout_keep_alive=settings.SERVER_KEEPALIVE_TIMEOUT,
+        proxy_headers=True,
+        forwarded_allow_ips=settings.SERVER_FORWARDED_ALLOW_IPS,
+        # Logging is configured by the application
+        log_config=None,
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
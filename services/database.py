@@ -1,86 +1,391 @@
-from typing import Optional
+import asyncio
+from datetime import UTC, datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple, TypeVar
 
-from sqlalchemy import QueuePool, create_engine
+from psycopg_pool import PoolTimeout
+from sqlalchemy import column, delete, func, table, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, make_url
 from sqlalchemy.exc import SQLAlchemyError
-from sqlmodel import Session, SQLModel, select
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import SQLModel, col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from core.config import Environment, settings
 from core.logging import logger
+from core.postgres import pool_manager, replica_router
+from models.run import Run, RunStatus
 from models.session import Session as ChatSession
+from models.token_revocation import TokenRevocation
 from models.user import User
 
+T = TypeVar("T")
+
+
+def _create_missing_indexes(conn: Connection) -> None:
+    """Create the indexes added to tables that already existed, which create_all skips."""
+    for model_table in SQLModel.metadata.sorted_tables:
+        for index in model_table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _sessions_key(user_id: int) -> str:
+    """Return the replica routing key of the session list of a user."""
+    return f"user:{user_id}:sessions"
+
 
 class DatabaseService:
 
     def __init__(self):
-        """Initialize database service with connection pool."""
-        try:
-            # Configure environment-specific database connection pool settings
-            pool_size = settings.POSTGRES_POOL_SIZE
-            max_overflow = settings.POSTGRES_MAX_OVERFLOW
-
-            # Create engine with appropriate pool configuration
-            self.engine = create_engine(
-                settings.POSTGRES_URL,
-                pool_pre_ping=True,
-                poolclass=QueuePool,
-                pool_size=pool_size,
-                max_overflow=max_overflow,
-                pool_timeout=30,  # Connection timeout (seconds)
-                pool_recycle=1800,  # Recycle connections after 30 minutes
-            )
+        """Initialize database service, the engine is created on first use."""
+        self.engine: Optional[AsyncEngine] = None
+        # Concurrent first queries would otherwise each create an engine
+        self._engine_lock = asyncio.Lock()
 
-            # Create tables (only if they don't exist)
-            SQLModel.metadata.create_all(self.engine)
+    async def _get_engine(self) -> AsyncEngine:
+        """Get the engine, creating it and the tables on first use.
 
-            logger.info(
-                "database_initialized",
-                environment=settings.ENVIRONMENT.value,
-                pool_size=pool_size,
-                max_overflow=max_overflow,
-            )
-        except SQLAlchemyError as e:
-            logger.error(
-                "database_initialization_error",
-                error=str(e),
-                environment=settings.ENVIRONMENT.value,
-            )
-            # In production, don't raise - allow app to start even with DB issues
-            if settings.ENVIRONMENT != Environment.PRODUCTION:
-                raise
+        On Postgres the engine borrows its connections from the pool shared
+        with the checkpointer, see `core.postgres`.
+
+        Returns:
+            AsyncEngine: The engine.
+        """
+        if self.engine is not None:
+            return self.engine
+        async with self._engine_lock:
+            if self.engine is not None:
+                return self.engine
+            if pool_manager.enabled:
+                engine = await pool_manager.create_engine("models")
+            else:
+                url = make_url(settings.POSTGRES_URL)
+                if url.drivername == "sqlite":
+                    url = url.set(drivername="sqlite+aiosqlite")
+                engine = create_async_engine(url)
+            try:
+                # Create tables (only if they don't exist)
+                async with engine.begin() as conn:
+                    await conn.run_sync(SQLModel.metadata.create_all)
+                    await conn.run_sync(_create_missing_indexes)
+
+                logger.info(
+                    "database_initialized",
+                    environment=settings.ENVIRONMENT.value,
+                    shared_pool=pool_manager.enabled,
+                )
+            except (SQLAlchemyError, PoolTimeout) as e:
+                logger.error(
+                    "database_initialization_error",
+                    error=str(e),
+                    environment=settings.ENVIRONMENT.value,
+                )
+                # In production, don't raise - allow app to start even with DB issues
+                if settings.ENVIRONMENT != Environment.PRODUCTION:
+                    await engine.dispose()
+                    raise
+            self.engine = engine
+        return self.engine
+
+    async def _read(self, key: Optional[str], query: Callable[[AsyncSession], Awaitable[Optional[T]]]) -> Optional[T]:
+        """Run a read-only query on a replica if one is caught up, else on the primary.
+
+        A query failing on the replica, or not finding its row there yet, is
+        retried on the primary.
+
+        Args:
+            key: The key read, so a session reads its own writes.
+            query: The query, taking the session to run on.
+
+        Returns:
+            Optional[T]: The result of the query.
+        """
+        replica = replica_router.route(key)
+        if replica is not None:
+            try:
+                async with AsyncSession(await replica.get_engine()) as session:
+                    result = await query(session)
+                if result is not None:
+                    return result
+                replica_router.fall_back(replica)
+            except (SQLAlchemyError, PoolTimeout) as e:
+                replica_router.fall_back(replica, e)
+        async with AsyncSession(await self._get_engine()) as session:
+            return await query(session)
+
+    async def close(self) -> None:
+        """Dispose of the engine, the shared pool is closed by its manager."""
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
 
     async def create_user(self, email: str, password: str) -> User:
-        with Session(self.engine) as session:
+        async with AsyncSession(await self._get_engine()) as session:
             user = User(email=email, hashed_password=password)
             session.add(user)
-            session.commit()
-            session.refresh(user)
+            await session.commit()
+            await session.refresh(user)
             logger.info("user_created", email=email)
             return user
 
     async def get_user(self, user_id: str):
-        with Session(self.engine) as session:
-            user = session.get(User, user_id)
-            return user
+        return await self._read(None, lambda session: session.get(User, user_id))
 
     async def create_session(self, session_id: str, user_id: int, name: str = ""):
-        with Session(self.engine) as session:
+        async with AsyncSession(await self._get_engine()) as session:
             chat_session = ChatSession(id=session_id, user_id=user_id, name=name)
             session.add(chat_session)
-            session.commit()
-            session.refresh(chat_session)
+            await session.commit()
+            await session.refresh(chat_session)
+            replica_router.mark_written(session_id)
+            replica_router.mark_written(_sessions_key(user_id))
             logger.info(
                 "session_created", session_id=session_id, user_id=user_id, name=name
             )
             return chat_session
 
     async def get_user_by_email(self, email: str) -> Optional[User]:
-        with Session(self.engine) as session:
+        async def query(session: AsyncSession) -> Optional[User]:
             statement = select(User).where(User.email == email)
-            user = session.exec(statement).first()
-            return user
+            return (await session.exec(statement)).first()
+
+        return await self._read(None, query)
 
     async def get_session(self, session_id: str) -> Optional[ChatSession]:
-        with Session(self.engine) as session:
-            chat_session = session.get(ChatSession, session_id)
-            return chat_session
+        return await self._read(session_id, lambda session: session.get(ChatSession, session_id))
+
+    async def list_sessions(
+        self, user_id: int, limit: int, after: Optional[Tuple[datetime, str]] = None
+    ) -> List[ChatSession]:
+        """List the sessions of a user, newest first, one page at a time.
+
+        A page starts after the last session of the previous page rather than
+        at an offset, so every page is a range scan of the (user_id,
+        created_at, id) index, however deep the page is.
+
+        Args:
+            user_id: The owner of the sessions.
+            limit: The maximum number of sessions to return.
+            after: The creation time and ID of the last session of the previous page.
+
+        Returns:
+            List[ChatSession]: The sessions of the page.
+        """
+
+        async def query(session: AsyncSession) -> List[ChatSession]:
+            statement = select(ChatSession).where(ChatSession.user_id == user_id)
+            if after is not None:
+                statement = statement.where(tuple_(col(ChatSession.created_at), col(ChatSession.id)) < tuple_(*after))
+            statement = statement.order_by(col(ChatSession.created_at).desc(), col(ChatSession.id).desc()).limit(limit)
+            return list((await session.exec(statement)).all())
+
+        return await self._read(_sessions_key(user_id), query)
+
+    async def delete_sessions(
+        self, user_id: int, session_ids: Sequence[str], checkpoint_tables: Sequence[str] = ()
+    ) -> List[str]:
+        """Delete sessions of a user with their runs, in one transaction.
+
+        Args:
+            user_id: The owner of the sessions, the sessions of other users are skipped.
+            session_ids: The IDs of the sessions.
+            checkpoint_tables: The tables of the checkpoints of the sessions, keyed by
+                thread ID, when they live in this database.
+
+        Returns:
+            List[str]: The IDs of the deleted sessions.
+        """
+        async with AsyncSession(await self._get_engine()) as session:
+            statement = select(ChatSession.id).where(
+                ChatSession.user_id == user_id, col(ChatSession.id).in_(session_ids)
+            )
+            deleted = list((await session.exec(statement)).all())
+            if not deleted:
+                return []
+            await session.exec(delete(Run).where(col(Run.session_id).in_(deleted)))
+            for name in checkpoint_tables:
+                checkpoints = table(name, column("thread_id"))
+                await session.exec(delete(checkpoints).where(checkpoints.c.thread_id.in_(deleted)))
+            await session.exec(delete(ChatSession).where(col(ChatSession.id).in_(deleted)))
+            await session.commit()
+
+        for session_id in deleted:
+            replica_router.mark_written(session_id)
+        replica_router.mark_written(_sessions_key(user_id))
+        logger.info("sessions_deleted", user_id=user_id, count=len(deleted))
+        return deleted
+
+    async def create_run(self, run: Run) -> Run:
+        async with AsyncSession(await self._get_engine()) as session:
+            session.add(run)
+            await session.commit()
+            await session.refresh(run)
+            logger.info("run_created", run_id=run.id, session_id=run.session_id)
+            return run
+
+    async def delete_run(self, run_id: str) -> None:
+        """Delete a run that was never started."""
+        async with AsyncSession(await self._get_engine()) as session:
+            run = await session.get(Run, run_id)
+            if run is not None:
+                await session.delete(run)
+                await session.commit()
+
+    async def get_run(self, run_id: str) -> Optional[Run]:
+        async with AsyncSession(await self._get_engine()) as session:
+            return await session.get(Run, run_id)
+
+    async def update_run(self, run_id: str, **fields) -> Optional[Run]:
+        """Update the given fields of a run.
+
+        Args:
+            run_id: The ID of the run.
+            **fields: The new values.
+
+        Returns:
+            Optional[Run]: The updated run, or None if it does not exist.
+        """
+        async with AsyncSession(await self._get_engine()) as session:
+            run = await session.get(Run, run_id)
+            if run is None:
+                return None
+            for name, value in fields.items():
+                setattr(run, name, value)
+            run.updated_at = datetime.now(UTC)
+            session.add(run)
+            await session.commit()
+            await session.refresh(run)
+            return run
+
+    async def renew_run_leases(self, run_ids: List[str], lease_expires_at: datetime) -> None:
+        """Extend the leases of the unfinished runs owned by this worker."""
+        if not run_ids:
+            return
+        async with AsyncSession(await self._get_engine()) as session:
+            await session.exec(
+                update(Run)
+                .where(col(Run.id).in_(run_ids), col(Run.status).in_([RunStatus.QUEUED, RunStatus.RUNNING]))
+                .values(lease_expires_at=lease_expires_at)
+            )
+            await session.commit()
+
+    async def claim_expired_runs(self, lease_expires_at: datetime, limit: int) -> List[str]:
+        """Take over unfinished runs whose owner stopped renewing their lease.
+
+        Each run is claimed with a conditional update, so when several workers
+        sweep at the same time, every run is claimed by exactly one of them.
+
+        Args:
+            lease_expires_at: The lease of the claimed runs.
+            limit: The maximum number of runs to claim.
+
+        Returns:
+            List[str]: The IDs of the claimed runs, oldest first.
+        """
+        now = datetime.now(UTC)
+        claimed = []
+        async with AsyncSession(await self._get_engine()) as session:
+            statement = (
+                select(Run.id)
+                .where(col(Run.status).in_([RunStatus.QUEUED, RunStatus.RUNNING]), col(Run.lease_expires_at) < now)
+                .order_by(col(Run.created_at))
+                .limit(limit)
+            )
+            for run_id in (await session.exec(statement)).all():
+                result = await session.exec(
+                    update(Run)
+                    .where(col(Run.id) == run_id, col(Run.lease_expires_at) < now)
+                    .values(lease_expires_at=lease_expires_at)
+                )
+                await session.commit()
+                if result.rowcount == 1:
+                    claimed.append(run_id)
+        return claimed
+
+    async def revoke_user_tokens(self, user_id: int) -> int:
+        """Revoke every token issued to a user so far.
+
+        Args:
+            user_id: The ID of the user.
+
+        Returns:
+            int: The new revocation generation of the user, to issue the next tokens with.
+        """
+        engine = await self._get_engine()
+        insert = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+        # A single upsert, so concurrent revocations of a user each get their own generation
+        statement = (
+            insert(TokenRevocation)
+            .values(user_id=user_id, generation=1, created_at=datetime.now(UTC))
+            .on_conflict_do_update(
+                index_elements=[TokenRevocation.user_id],
+                index_where=col(TokenRevocation.session_id).is_(None),
+                set_={"generation": TokenRevocation.generation + 1},
+            )
+            .returning(TokenRevocation.generation)
+        )
+        async with AsyncSession(engine) as session:
+            generation = (await session.exec(statement)).scalar_one()
+            await session.commit()
+            logger.info("user_tokens_revoked", user_id=user_id, generation=generation)
+            return generation
+
+    async def get_token_generation(self, user_id: int) -> int:
+        """Get the current revocation generation of a user, from the primary.
+
+        Args:
+            user_id: The ID of the user.
+
+        Returns:
+            int: The generation to issue the tokens of the user with.
+        """
+        async with AsyncSession(await self._get_engine()) as session:
+            generation = await session.exec(
+                select(TokenRevocation.generation).where(
+                    TokenRevocation.user_id == user_id, col(TokenRevocation.session_id).is_(None)
+                )
+            )
+            return generation.first() or 0
+
+    async def revoke_session_tokens(self, user_id: int, session_ids: List[str], expires_at: datetime) -> None:
+        """Revoke the tokens of sessions.
+
+        Args:
+            user_id: The owner of the sessions.
+            session_ids: The IDs of the sessions.
+            expires_at: When every token of the sessions has expired.
+        """
+        async with AsyncSession(await self._get_engine()) as session:
+            # Purged on writes rather than on the reloads every worker runs
+            await session.exec(
+                delete(TokenRevocation).where(
+                    col(TokenRevocation.session_id).is_not(None), col(TokenRevocation.expires_at) < datetime.now(UTC)
+                )
+            )
+            session.add_all(
+                TokenRevocation(user_id=user_id, session_id=session_id, expires_at=expires_at)
+                for session_id in session_ids
+            )
+            await session.commit()
+
+    async def get_token_revocations(self) -> Tuple[Dict[int, int], Set[str]]:
+        """Load the revocations whose tokens may still be valid.
+
+        Returns:
+            Tuple[Dict[int, int], Set[str]]: The revocation generation of each user
+                who revoked their tokens, and the sessions whose tokens are revoked.
+        """
+        async with AsyncSession(await self._get_engine()) as session:
+            generations = await session.exec(
+                select(TokenRevocation.user_id, func.max(TokenRevocation.generation))
+                .where(col(TokenRevocation.session_id).is_(None))
+                .group_by(TokenRevocation.user_id)
+            )
+            user_generations = dict(generations.all())
+            # Expired revocations are purged by the next revocation, skip them until then
+            sessions = await session.exec(
+                select(TokenRevocation.session_id).where(
+                    col(TokenRevocation.session_id).is_not(None), col(TokenRevocation.expires_at) >= datetime.now(UTC)
+                )
+            )
+            return user_generations, set(sessions.all())
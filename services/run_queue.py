@@ -0,0 +1,321 @@
+"""This file contains the background run queue of the agent.
+
+Runs submitted through the run API are stored in the database and executed
+by a bounded pool of worker tasks in this process, so the number of
+concurrent agent runs no longer follows the number of open requests.
+
+Every unfinished run is leased by the worker that queued it, and the lease is
+renewed while the worker is alive. When a worker stops or dies, its runs are
+left queued or running; once their lease has expired, any worker claims them
+again, and `LangGraphAgent.get_run_response` resumes each one from the last
+checkpoint of its session.
+"""
+
+import asyncio
+import time
+import uuid
+from datetime import UTC, datetime, timedelta
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Set,
+)
+
+from core.concurrency import OverloadedError
+from core.config import settings
+from core.langgraph.graph import (
+    CheckpointerUnavailableError,
+    LangGraphAgent,
+)
+from core.langgraph.run_lock import RunLockTimeoutError
+from core.logging import logger
+from core.metrics import (
+    run_queue_depth,
+    runs_total,
+)
+from models.run import Run, RunStatus
+from schemas.chat import Message
+from services.database import DatabaseService
+from utils import dump_messages
+
+
+class RunQueueFullError(Exception):
+    """Raised when a run is submitted while the queue of this worker is full."""
+
+
+class RunQueue:
+    """Executes the background runs of this worker."""
+
+    def __init__(
+        self,
+        agent: LangGraphAgent,
+        db_service: DatabaseService,
+        workers: int,
+        max_size: int,
+        lease_seconds: float,
+        max_attempts: int,
+        poll_interval: float = 0.5,
+    ):
+        """Initialize the queue.
+
+        Args:
+            agent: The agent executing the runs.
+            db_service: The database service storing the runs.
+            workers: The maximum number of runs executed concurrently.
+            max_size: The maximum number of runs waiting for a worker.
+            lease_seconds: How long a run stays owned without a lease renewal.
+            max_attempts: How many times a run is started before it is failed.
+            poll_interval: Seconds between two reads of a waited run of another worker.
+        """
+        self.agent = agent
+        self.db_service = db_service
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_size)
+        # Unfinished runs leased by this worker
+        self._owned: Set[str] = set()
+        # Set when the run finishes, for the requests waiting on it
+        self._done: Dict[str, asyncio.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """Start the workers and the lease task, which also picks up interrupted runs."""
+        self._tasks = [asyncio.create_task(self._work(), name=f"run-worker-{i}") for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain_leases(), name="run-leases"))
+        logger.info("run_queue_started", workers=self.workers, max_size=self._queue.maxsize)
+
+    async def stop(self) -> None:
+        """Stop the workers, releasing the leases of the unfinished runs for another worker."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Expire the leases now instead of after lease_seconds
+        await self.db_service.renew_run_leases(list(self._owned), datetime.now(UTC))
+        logger.info("run_queue_stopped", released_runs=len(self._owned))
+        self._owned.clear()
+
+    def _lease(self) -> datetime:
+        """Return the expiry of a lease taken or renewed now."""
+        return datetime.now(UTC) + timedelta(seconds=self.lease_seconds)
+
+    async def submit(
+        self,
+        messages: List[Message],
+        session_id: str,
+        user_id: int,
+        model_tier: Optional[str] = None,
+    ) -> Run:
+        """Store a run and queue it on this worker.
+
+        Args:
+            messages: The new user messages.
+            session_id: The session the run appends to.
+            user_id: The owner of the session.
+            model_tier: The model tier requested by the client, if any.
+
+        Returns:
+            Run: The queued run.
+
+        Raises:
+            RunQueueFullError: If the queue of this worker is full.
+        """
+        if self._queue.full():
+            raise RunQueueFullError("Too many runs are waiting, retry later")
+        # The queue may fill up while the run is stored, it is checked again below
+        run = await self.db_service.create_run(
+            Run(
+                id=str(uuid.uuid4()),
+                session_id=session_id,
+                user_id=user_id,
+                # The ids let a retried run find its messages in the checkpoint
+                input_messages=[{**message, "id": str(uuid.uuid4())} for message in dump_messages(messages)],
+                model_tier=model_tier,
+                lease_expires_at=self._lease(),
+            )
+        )
+        if not self._enqueue(run.id):
+            # Nobody saw the run yet, it is dropped rather than left for another worker
+            await self.db_service.delete_run(run.id)
+            raise RunQueueFullError("Too many runs are waiting, retry later")
+        return run
+
+    def _enqueue(self, run_id: str) -> bool:
+        """Queue a run leased by this worker.
+
+        Returns:
+            bool: Whether the run was queued, False if the queue is full. The
+                lease of a run that was not queued is not renewed.
+        """
+        try:
+            self._queue.put_nowait(run_id)
+        except asyncio.QueueFull:
+            return False
+        self._owned.add(run_id)
+        self._done.setdefault(run_id, asyncio.Event())
+        run_queue_depth.set(self._queue.qsize())
+        return True
+
+    async def wait(self, run_id: str, timeout: float) -> Optional[Run]:
+        """Wait until a run finishes, at most `timeout` seconds.
+
+        A run of this worker is awaited directly. A run executed by another
+        worker, or deferred and claimed again by one, is read from the database
+        every poll interval.
+
+        Args:
+            run_id: The ID of the run.
+            timeout: The maximum seconds to wait.
+
+        Returns:
+            Optional[Run]: The run as last read, None if it does not exist.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            run = await self.db_service.get_run(run_id)
+            remaining = deadline - time.monotonic()
+            if run is None or run.finished or remaining <= 0:
+                return run
+            done = self._done.get(run_id)
+            if done is None:
+                await asyncio.sleep(min(self.poll_interval, remaining))
+                continue
+            try:
+                await asyncio.wait_for(done.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self) -> None:
+        """Execute queued runs, one at a time."""
+        while True:
+            run_id = await self._queue.get()
+            run_queue_depth.set(self._queue.qsize())
+            try:
+                await self._execute(run_id)
+            except Exception as e:
+                logger.error("run_execution_failed", run_id=run_id, error=str(e), exc_info=True)
+                # Stop renewing the lease, so the run is claimed again once it expires
+                self._finish(run_id)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, run_id: str) -> None:
+        """Execute, resume or fail a run, and record its outcome."""
+        run = await self.db_service.get_run(run_id)
+        if run is None or run.finished:
+            self._finish(run_id)
+            return
+        if run.attempts >= self.max_attempts:
+            await self._fail(run, f"Interrupted {run.attempts} times")
+            return
+
+        run = await self.db_service.update_run(run_id, status=RunStatus.RUNNING, attempts=run.attempts + 1)
+        logger.info("run_started", run_id=run_id, session_id=run.session_id, attempt=run.attempts)
+        start = time.perf_counter()
+        try:
+            messages, checkpoint_id = await self.agent.get_run_response(
+                run.input_messages, run.session_id, user_id=run.user_id, model_tier=run.model_tier
+            )
+        except asyncio.CancelledError:
+            # Stopping: the run stays leased until stop() releases it
+            raise
+        except OverloadedError as e:
+            await self._defer(run, str(e), e.retry_after)
+            return
+        except (RunLockTimeoutError, CheckpointerUnavailableError) as e:
+            await self._defer(run, str(e), 0)
+            return
+        except Exception as e:
+            logger.error("run_failed", run_id=run_id, session_id=run.session_id, error=str(e), exc_info=True)
+            await self._fail(run, str(e))
+            return
+
+        await self.db_service.update_run(
+            run_id,
+            status=RunStatus.SUCCEEDED,
+            result_messages=[message.model_dump() for message in messages],
+            checkpoint_id=checkpoint_id,
+        )
+        runs_total.labels(status=RunStatus.SUCCEEDED.value).inc()
+        logger.info(
+            "run_succeeded",
+            run_id=run_id,
+            session_id=run.session_id,
+            duration_ms=round((time.perf_counter() - start) * 1000, 1),
+        )
+        self._finish(run_id)
+
+    async def _defer(self, run: Run, error: str, retry_after: float) -> None:
+        """Put back a run that could not start yet, without counting the attempt.
+
+        Its lease is released, so the next lease sweep of any worker claims it
+        again once `retry_after` seconds have passed.
+        """
+        await self.db_service.update_run(
+            run.id,
+            status=RunStatus.QUEUED,
+            attempts=run.attempts - 1,
+            lease_expires_at=datetime.now(UTC) + timedelta(seconds=retry_after),
+        )
+        logger.warning("run_deferred", run_id=run.id, session_id=run.session_id, error=error, retry_after=retry_after)
+        self._finish(run.id)
+
+    async def _fail(self, run: Run, error: str) -> None:
+        """Record that a run failed."""
+        await self.db_service.update_run(run.id, status=RunStatus.FAILED, error=error)
+        runs_total.labels(status=RunStatus.FAILED.value).inc()
+        self._finish(run.id)
+
+    def _finish(self, run_id: str) -> None:
+        """Forget a finished run and wake up the requests waiting on it."""
+        self._owned.discard(run_id)
+        done = self._done.pop(run_id, None)
+        if done is not None:
+            done.set()
+
+    async def _maintain_leases(self) -> None:
+        """Renew the leases of the owned runs and claim the runs whose lease expired."""
+        while True:
+            try:
+                await self.db_service.renew_run_leases(list(self._owned), self._lease())
+                free_slots = self._queue.maxsize - self._queue.qsize()
+                if free_slots > 0:
+                    claimed = await self.db_service.claim_expired_runs(self._lease(), free_slots)
+                    unqueued = []
+                    for run_id in claimed:
+                        # Submissions may have filled the queue during the claim
+                        if self._enqueue(run_id):
+                            logger.info("run_claimed", run_id=run_id)
+                        else:
+                            unqueued.append(run_id)
+                    if unqueued:
+                        # Release them for the next sweep, of this worker or another
+                        await self.db_service.renew_run_leases(unqueued, datetime.now(UTC))
+                        logger.info("run_claims_released", run_ids=unqueued)
+            except Exception as e:
+                logger.error("run_lease_maintenance_failed", error=str(e))
+            await asyncio.sleep(self.lease_seconds / 3)
+
+
+def create_run_queue(agent: LangGraphAgent, db_service: DatabaseService) -> RunQueue:
+    """Create the run queue of this worker from the settings.
+
+    Args:
+        agent: The agent executing the runs.
+        db_service: The database service storing the runs.
+
+    Returns:
+        RunQueue: The run queue, not started yet.
+    """
+    return RunQueue(
+        agent,
+        db_service,
+        workers=settings.RUN_QUEUE_WORKERS,
+        max_size=settings.RUN_QUEUE_MAX_SIZE,
+        lease_seconds=settings.RUN_LEASE_SECONDS,
+        max_attempts=settings.RUN_MAX_ATTEMPTS,
+        poll_interval=settings.RUN_WAIT_POLL_INTERVAL,
+    )
@@ -0,0 +1,133 @@
+"""This file contains the token revocation set of the application.
+
+Session tokens carry their user and session, so the requests they
+authenticate are served without reading the session table. Revoked tokens are
+rejected by checking their claims against a compact revocation set: the
+revocation generation of the users who revoked their tokens, and the sessions
+whose tokens are revoked.
+
+Each worker keeps the set in memory and reloads it from the database every
+JWT_REVOCATION_REFRESH_SECONDS. A revocation made by a worker applies to it
+immediately, and to the other workers after their next reload.
+"""
+
+import asyncio
+from datetime import UTC, datetime, timedelta
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Set,
+)
+
+from core.config import settings
+from core.logging import logger
+from schemas.auth import TokenClaims
+from services.database import DatabaseService
+
+
+class TokenRevocationSet:
+    """The revoked tokens, reloaded periodically from the database."""
+
+    def __init__(self, db_service: DatabaseService, refresh_interval: float):
+        """Initialize the set, empty until started.
+
+        Args:
+            db_service: The database service storing the revocations.
+            refresh_interval: Seconds between two reloads of the set.
+        """
+        self.db_service = db_service
+        self.refresh_interval = refresh_interval
+        self._generations: Dict[int, int] = {}
+        self._sessions: Set[str] = set()
+        # Sessions revoked by this worker while a reload is running
+        self._revoked_during_refresh: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Load the set, then keep reloading it in the background."""
+        await self.refresh()
+        self._task = asyncio.create_task(self._refresh_periodically(), name="token-revocations")
+
+    async def stop(self) -> None:
+        """Stop reloading the set."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def is_revoked(self, claims: TokenClaims, user_id: Optional[int] = None) -> bool:
+        """Return whether a token is revoked.
+
+        Args:
+            claims: The claims of the token.
+            user_id: The user of a token issued before the typed claims, which
+                has no user claim, as read from the database. Such a token has
+                generation 0, so any revocation of the user revokes it.
+
+        Returns:
+            bool: Whether the token is revoked.
+        """
+        if claims.session_id is not None and claims.session_id in self._sessions:
+            return True
+        user_id = claims.user_id if claims.user_id is not None else user_id
+        return user_id is not None and claims.generation < self._generations.get(user_id, 0)
+
+    async def generation(self, user_id: int) -> int:
+        """Return the revocation generation new tokens of a user are issued with.
+
+        It is read from the database, the set of this worker may miss a
+        revocation made by another one and issue tokens revoked on reload.
+
+        Args:
+            user_id: The ID of the user.
+
+        Returns:
+            int: The current revocation generation of the user.
+        """
+        generation = max(await self.db_service.get_token_generation(user_id), self._generations.get(user_id, 0))
+        if generation:
+            self._generations[user_id] = generation
+        return generation
+
+    async def revoke_user(self, user_id: int) -> None:
+        """Revoke every token issued to a user so far.
+
+        Args:
+            user_id: The ID of the user.
+        """
+        self._generations[user_id] = await self.db_service.revoke_user_tokens(user_id)
+
+    async def revoke_sessions(self, user_id: int, session_ids: List[str]) -> None:
+        """Revoke the tokens of sessions.
+
+        Args:
+            user_id: The owner of the sessions.
+            session_ids: The IDs of the sessions.
+        """
+        if not session_ids:
+            return
+        expires_at = datetime.now(UTC) + timedelta(days=settings.JWT_ACCESS_TOKEN_EXPIRE_DAYS)
+        await self.db_service.revoke_session_tokens(user_id, session_ids, expires_at)
+        self._sessions.update(session_ids)
+        self._revoked_during_refresh.update(session_ids)
+
+    async def refresh(self) -> None:
+        """Reload the set from the database, keeping the current one on failure."""
+        self._revoked_during_refresh = set()
+        try:
+            generations, sessions = await self.db_service.get_token_revocations()
+        except Exception as e:
+            logger.error("token_revocations_refresh_failed", error=str(e))
+            return
+        # Generations only grow, keep those raised by this worker during the reload
+        for user_id, generation in self._generations.items():
+            generations[user_id] = max(generation, generations.get(user_id, 0))
+        self._generations = generations
+        self._sessions = sessions | self._revoked_during_refresh
+
+    async def _refresh_periodically(self) -> None:
+        """Reload the set every refresh interval."""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
@@ -0,0 +1,16 @@
+"""This file contains the shared configuration of the tests."""
+
+import os
+import tempfile
+
+# Read by core.config when the modules under test are first imported
+os.environ.setdefault("APP_ENV", "test")
+os.environ.setdefault("LOG_DIR", tempfile.mkdtemp(prefix="fastapi-langgraph-logs-"))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    """Run the async tests on asyncio, which the application runs on."""
+    return "asyncio"
@@ -0,0 +1,155 @@
+"""This file contains the tests of the hot-thread checkpoint cache."""
+
+from typing import (
+    List,
+    Optional,
+)
+
+import pytest
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.base import (
+    Checkpoint,
+    empty_checkpoint,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+from core.langgraph.checkpoint_cache import CachedCheckpointSaver
+
+pytestmark = pytest.mark.anyio
+
+
+class _Probe:
+    """Version probe reading the latest checkpoint id of the wrapped saver, counting its calls."""
+
+    def __init__(self, saver: InMemorySaver):
+        self.saver = saver
+        self.calls = 0
+
+    async def __call__(self, thread_id: str, checkpoint_ns: str) -> Optional[str]:
+        self.calls += 1
+        checkpoint_tuple = await self.saver.aget_tuple(_config(thread_id))
+        return checkpoint_tuple.checkpoint["id"] if checkpoint_tuple else None
+
+
+def _config(thread_id: str, checkpoint_id: Optional[str] = None) -> dict:
+    configurable = {"thread_id": thread_id, "checkpoint_ns": ""}
+    if checkpoint_id is not None:
+        configurable["checkpoint_id"] = checkpoint_id
+    return {"configurable": configurable}
+
+
+def _checkpoint(messages: List[str], version: int) -> Checkpoint:
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": [HumanMessage(content=text) for text in messages]}
+    checkpoint["channel_versions"] = {"messages": version}
+    return checkpoint
+
+
+async def _put(saver, thread_id: str, messages: List[str], parent_id: Optional[str] = None) -> str:
+    """Write the next checkpoint of a thread, returning its id."""
+    checkpoint = _checkpoint(messages, len(messages))
+    metadata = {"source": "loop", "step": len(messages), "writes": None, "parents": {}}
+    await saver.aput(_config(thread_id, parent_id), checkpoint, metadata, {"messages": len(messages)})
+    return checkpoint["id"]
+
+
+def _cache(validate_after: float = 0.0, **kwargs) -> tuple[CachedCheckpointSaver, InMemorySaver, _Probe]:
+    inner = InMemorySaver()
+    probe = _Probe(inner)
+    kwargs.setdefault("max_entries", 10)
+    kwargs.setdefault("max_bytes", 1_000_000)
+    return CachedCheckpointSaver(inner, version_probe=probe, validate_after=validate_after, **kwargs), inner, probe
+
+
+def _contents(checkpoint: Checkpoint) -> List[str]:
+    return [message.content for message in checkpoint["channel_values"]["messages"]]
+
+
+async def test_own_writes_are_served_without_probing_within_the_ttl():
+    cache, _, probe = _cache(validate_after=60.0)
+    checkpoint_id = await _put(cache, "t", ["hi"])
+
+    checkpoint_tuple = await cache.aget_tuple(_config("t"))
+
+    assert checkpoint_tuple.checkpoint["id"] == checkpoint_id
+    assert _contents(checkpoint_tuple.checkpoint) == ["hi"]
+    assert probe.calls == 0
+
+
+async def test_write_of_another_worker_invalidates_the_entry_once_probed():
+    cache, inner, probe = _cache()
+    first_id = await _put(cache, "t", ["hi"])
+    # Another worker writes straight to the store
+    second_id = await _put(inner, "t", ["hi", "again"], parent_id=first_id)
+
+    checkpoint_tuple = await cache.aget_tuple(_config("t"))
+
+    assert probe.calls == 1
+    assert checkpoint_tuple.checkpoint["id"] == second_id
+    assert _contents(checkpoint_tuple.checkpoint) == ["hi", "again"]
+    assert cache._get(("t", "")).checkpoint_id == second_id
+
+
+async def test_entry_is_probed_again_once_the_ttl_is_over():
+    cache, _, probe = _cache(validate_after=60.0)
+    await _put(cache, "t", ["hi"])
+    cache._get(("t", "")).validated_at -= 61.0
+
+    await cache.aget_tuple(_config("t"))
+    await cache.aget_tuple(_config("t"))
+
+    # The successful probe renews the trust in the entry
+    assert probe.calls == 1
+
+
+async def test_writes_on_the_cached_checkpoint_invalidate_it():
+    cache, _, _ = _cache(validate_after=60.0)
+    checkpoint_id = await _put(cache, "t", ["hi"])
+
+    await cache.aput_writes(_config("t", checkpoint_id), [("messages", [])], task_id="task")
+
+    assert cache._get(("t", "")) is None
+
+
+async def test_deleting_a_thread_drops_its_entries():
+    cache, _, _ = _cache(validate_after=60.0)
+    await _put(cache, "t", ["hi"])
+    await _put(cache, "other", ["hello"])
+
+    await cache.adelete_thread("t")
+
+    assert cache._get(("t", "")) is None
+    assert cache._get(("other", "")) is not None
+    assert await cache.aget_tuple(_config("t")) is None
+
+
+async def test_cache_never_moves_back_to_an_older_checkpoint():
+    cache, _, _ = _cache(validate_after=60.0)
+    old_checkpoint = _checkpoint(["hi"], 1)
+    new_id = await _put(cache, "t", ["hi", "again"])
+
+    cache._store(("t", ""), cache._make_entry(old_checkpoint, {}, None))
+
+    assert cache._get(("t", "")).checkpoint_id == new_id
+
+
+async def test_served_checkpoints_do_not_share_state_with_the_cache():
+    cache, _, _ = _cache(validate_after=60.0)
+    await _put(cache, "t", ["hi"])
+
+    served = await cache.aget_tuple(_config("t"))
+    served.checkpoint["channel_values"]["messages"] = []
+
+    assert _contents((await cache.aget_tuple(_config("t"))).checkpoint) == ["hi"]
+
+
+async def test_least_recently_used_threads_are_evicted_over_the_bounds():
+    cache, _, _ = _cache(validate_after=60.0, max_entries=2)
+    await _put(cache, "a", ["hi"])
+    await _put(cache, "b", ["hi"])
+    await cache.aget_tuple(_config("a"))
+    await _put(cache, "c", ["hi"])
+
+    assert cache._get(("b", "")) is None
+    assert cache._get(("a", "")) is not None
+    assert cache._get(("c", "")) is not None
@@ -0,0 +1,137 @@
+"""This file contains the tests of the adaptive concurrency limiter."""
+
+import asyncio
+from typing import List
+
+import pytest
+
+from core.concurrency import (
+    AdaptiveConcurrencyLimiter,
+    OverloadedError,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def _limiter(
+    limit: int = 1, max_limit: int = 1, max_queue: int = 10, queue_timeout: float = 1.0
+) -> AdaptiveConcurrencyLimiter:
+    return AdaptiveConcurrencyLimiter(
+        "test",
+        initial_limit=limit,
+        min_limit=1,
+        max_limit=max_limit,
+        max_queue=max_queue,
+        queue_timeout=queue_timeout,
+    )
+
+
+async def _run_in_slot(limiter: AdaptiveConcurrencyLimiter) -> None:
+    async with limiter.slot():
+        pass
+
+
+async def test_waiters_are_handed_slots_in_arrival_order():
+    limiter = _limiter()
+    order: List[int] = []
+
+    async def run(index: int) -> None:
+        async with limiter.slot():
+            order.append(index)
+            assert limiter.in_flight == 1
+
+    async with limiter.slot():
+        tasks = []
+        for index in range(3):
+            tasks.append(asyncio.create_task(run(index)))
+            await asyncio.sleep(0)
+        assert len(limiter._waiters) == 3
+    await asyncio.gather(*tasks)
+
+    assert order == [0, 1, 2]
+    assert limiter.in_flight == 0
+    assert not limiter._waiters
+
+
+async def test_new_request_queues_behind_waiters_while_slot_is_handed_over():
+    limiter = _limiter()
+    order: List[str] = []
+
+    async def run(name: str) -> None:
+        async with limiter.slot():
+            order.append(name)
+
+    async with limiter.slot():
+        waiter = asyncio.create_task(run("waiter"))
+        await asyncio.sleep(0)
+    # The slot now belongs to the waiter even though its task has not run yet
+    assert limiter.in_flight == 1
+    await asyncio.gather(run("newcomer"), waiter)
+
+    assert order == ["waiter", "newcomer"]
+    assert limiter.in_flight == 0
+
+
+async def test_queue_timeout_sheds_the_request():
+    limiter = _limiter(queue_timeout=0.05)
+
+    async with limiter.slot():
+        with pytest.raises(OverloadedError) as exc_info:
+            async with limiter.slot():
+                pass
+        assert limiter.in_flight == 1
+
+    assert exc_info.value.reason == "queue_timeout"
+    assert not limiter._waiters
+    assert limiter.in_flight == 0
+
+
+async def test_full_queue_sheds_the_request_at_once():
+    limiter = _limiter(max_queue=1)
+
+    async with limiter.slot():
+        waiter = asyncio.create_task(_run_in_slot(limiter))
+        await asyncio.sleep(0)
+        with pytest.raises(OverloadedError) as exc_info:
+            await _run_in_slot(limiter)
+    await waiter
+
+    assert exc_info.value.reason == "queue_full"
+    assert limiter.in_flight == 0
+
+
+async def test_retry_after_is_about_one_run():
+    limiter = _limiter(max_queue=0)
+    assert limiter.retry_after() == 1
+
+    limiter.baseline = 2.3
+    async with limiter.slot():
+        with pytest.raises(OverloadedError) as exc_info:
+            await _run_in_slot(limiter)
+        assert limiter.retry_after() == 3
+
+    assert exc_info.value.retry_after == 3
+
+
+async def test_waiter_cancelled_after_the_handoff_gives_its_slot_back():
+    limiter = _limiter()
+    async with limiter.slot():
+        waiter = asyncio.create_task(_run_in_slot(limiter))
+        await asyncio.sleep(0)
+    # The slot was handed to the waiter, which is cancelled before it gets to run
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+
+    assert limiter.in_flight == 0
+    assert not limiter._waiters
+
+
+async def test_limit_is_cut_on_congestion_and_grows_when_saturated():
+    limiter = _limiter(limit=4, max_limit=10)
+    limiter.in_flight = 4
+    limiter._release(1.0)
+    assert limiter.limit == pytest.approx(4.25)
+
+    limiter.in_flight = 1
+    limiter._release(10.0)
+    assert limiter.limit == pytest.approx(4.25 * limiter.backoff)
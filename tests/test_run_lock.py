@@ -0,0 +1,238 @@
+"""This file contains the tests of the per-thread run locks."""
+
+import asyncio
+from typing import (
+    List,
+    Set,
+)
+
+import pytest
+from psycopg import OperationalError
+
+from core.langgraph import run_lock
+from core.langgraph.run_lock import (
+    LocalRunLock,
+    PgBouncerRunLock,
+    PostgresRunLock,
+    RunLockTimeoutError,
+)
+
+pytestmark = pytest.mark.anyio
+
+# Latency of every fake database call, so cancellations land in the middle of them
+_LATENCY = 0.02
+
+
+async def _hold_until_cancelled(lock: LocalRunLock, thread_id: str, held: asyncio.Event) -> None:
+    async with lock.hold(thread_id):
+        held.set()
+        await asyncio.sleep(60)
+
+
+async def _cancel_while_held(lock: LocalRunLock, thread_id: str, cancellations: int = 1) -> None:
+    """Cancel a run holding the lock of a thread, again and again while it releases the lock."""
+    held = asyncio.Event()
+    task = asyncio.create_task(_hold_until_cancelled(lock, thread_id, held))
+    await held.wait()
+    for _ in range(cancellations):
+        task.cancel()
+        await asyncio.sleep(_LATENCY / 2)
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    # The shielded release goes on after the run is gone
+    await asyncio.sleep(_LATENCY * 4)
+
+
+class _AdvisoryLocks:
+    """Session-level advisory locks of a fake database, replacing the queries of the lock connections."""
+
+    def __init__(self):
+        self.held: Set[int] = set()
+        self.fail_unlock = False
+
+    def install(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        locks = self
+
+        async def fetch_flag(connection: run_lock._LockConnection, query: str, key: int) -> tuple[bool, int]:
+            await asyncio.sleep(_LATENCY)
+            if "pg_try_advisory_lock" in query:
+                if key in locks.held:
+                    return False, connection.generation
+                locks.held.add(key)
+                return True, connection.generation
+            if locks.fail_unlock:
+                raise OperationalError("server closed the connection unexpectedly")
+            if key not in locks.held:
+                return False, connection.generation
+            locks.held.remove(key)
+            return True, connection.generation
+
+        async def close(connection: run_lock._LockConnection) -> None:
+            # Closing the session releases all of its locks
+            locks.held.clear()
+
+        monkeypatch.setattr(run_lock._LockConnection, "fetch_flag", fetch_flag)
+        monkeypatch.setattr(run_lock._LockConnection, "close", close)
+
+
+class _FakeConnection:
+    """Connection of the run lock pool, recording the calls of the lock."""
+
+    def __init__(self, calls: List[str], fail_rollback: bool = False):
+        self.calls = calls
+        self.fail_rollback = fail_rollback
+        self.closed = False
+
+    async def set_autocommit(self, autocommit: bool) -> None:
+        await asyncio.sleep(_LATENCY)
+
+    async def execute(self, query: str, params: tuple = ()) -> None:
+        await asyncio.sleep(_LATENCY)
+        self.calls.append("lock" if "pg_advisory_xact_lock" in query else "set_config")
+
+    async def rollback(self) -> None:
+        await asyncio.sleep(_LATENCY)
+        if self.fail_rollback:
+            raise OperationalError("server closed the connection unexpectedly")
+        self.calls.append("rollback")
+
+    async def close(self) -> None:
+        self.closed = True
+        self.calls.append("close")
+
+
+class _FakePool:
+    """Run lock pool handing out fake connections."""
+
+    def __init__(self, fail_rollback: bool = False):
+        self.calls: List[str] = []
+        self.fail_rollback = fail_rollback
+
+    async def getconn(self, timeout: float, consumer: str) -> _FakeConnection:
+        return _FakeConnection(self.calls, self.fail_rollback)
+
+    async def putconn(self, conn: _FakeConnection) -> None:
+        await asyncio.sleep(_LATENCY)
+        self.calls.append("putconn")
+
+
+async def test_local_lock_serializes_the_runs_of_a_thread():
+    lock = LocalRunLock(timeout=1.0)
+    order: List[str] = []
+
+    async def run(name: str) -> None:
+        async with lock.hold("t"):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name} end")
+
+    await asyncio.gather(run("first"), run("second"))
+
+    assert order == ["first start", "first end", "second start", "second end"]
+    assert not lock._locks
+
+
+async def test_local_lock_times_out_and_forgets_the_waiter():
+    lock = LocalRunLock(timeout=0.05)
+
+    async with lock.hold("t"):
+        with pytest.raises(RunLockTimeoutError):
+            async with lock.hold("t"):
+                pass
+        assert lock._locks["t"][1] == 1
+
+    assert not lock._locks
+
+
+async def test_local_lock_is_released_when_the_run_is_cancelled():
+    lock = LocalRunLock(timeout=1.0)
+
+    await _cancel_while_held(lock, "t")
+
+    assert not lock._locks
+    async with lock.hold("t"):
+        pass
+
+
+@pytest.mark.parametrize("cancellations", [1, 3])
+async def test_postgres_lock_is_released_when_the_run_is_cancelled(monkeypatch, cancellations):
+    locks = _AdvisoryLocks()
+    locks.install(monkeypatch)
+    lock = PostgresRunLock("postgresql://localhost/test", timeout=1.0)
+
+    await _cancel_while_held(lock, "t", cancellations)
+
+    assert not locks.held
+    assert not lock._locks
+
+
+async def test_postgres_lock_granted_during_a_cancelled_acquisition_is_released(monkeypatch):
+    locks = _AdvisoryLocks()
+    locks.install(monkeypatch)
+    lock = PostgresRunLock("postgresql://localhost/test", timeout=1.0)
+
+    async def run() -> None:
+        async with lock.hold("t"):
+            pass
+
+    task = asyncio.create_task(run())
+    # Cancelled while the database grants the lock
+    await asyncio.sleep(_LATENCY / 2)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(_LATENCY * 4)
+
+    assert not locks.held
+    assert not lock._locks
+
+
+async def test_postgres_lock_drops_the_connection_when_the_release_fails(monkeypatch):
+    locks = _AdvisoryLocks()
+    locks.install(monkeypatch)
+    lock = PostgresRunLock("postgresql://localhost/test", timeout=1.0)
+    connection = lock._connections[0]
+
+    async with lock.hold("t"):
+        generation = connection.generation
+        locks.fail_unlock = True
+
+    assert connection.generation == generation + 1
+    assert not locks.held
+    assert not lock._locks
+
+
+async def test_postgres_lock_waits_for_another_worker_until_the_timeout(monkeypatch):
+    locks = _AdvisoryLocks()
+    locks.install(monkeypatch)
+    lock = PostgresRunLock("postgresql://localhost/test", timeout=0.1)
+    # Held by the session of another worker
+    locks.held.add(lock.advisory_key("t"))
+
+    with pytest.raises(RunLockTimeoutError):
+        async with lock.hold("t"):
+            pass
+
+    assert not lock._locks
+
+
+@pytest.mark.parametrize("cancellations", [1, 3])
+async def test_pgbouncer_lock_ends_its_transaction_when_the_run_is_cancelled(cancellations):
+    pool = _FakePool()
+    lock = PgBouncerRunLock(pool, timeout=1.0)
+
+    await _cancel_while_held(lock, "t", cancellations)
+
+    assert pool.calls == ["set_config", "lock", "rollback", "putconn"]
+    assert not lock._locks
+
+
+async def test_pgbouncer_lock_closes_the_connection_when_the_rollback_fails():
+    pool = _FakePool(fail_rollback=True)
+    lock = PgBouncerRunLock(pool, timeout=1.0)
+
+    async with lock.hold("t"):
+        pass
+
+    assert pool.calls == ["set_config", "lock", "close", "putconn"]
+    assert not lock._locks
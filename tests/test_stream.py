@@ -0,0 +1,105 @@
+"""This file contains the tests of the shaping of streamed chat events."""
+
+import asyncio
+import time
+from typing import (
+    AsyncIterator,
+    List,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import pytest
+from langchain_core.messages import (
+    AIMessageChunk,
+    BaseMessage,
+    ToolMessage,
+)
+
+from core.langgraph.stream import StreamShaper
+from schemas.chat import StreamEvent
+
+pytestmark = pytest.mark.anyio
+
+_CHAT = {"langgraph_node": "chat"}
+
+
+async def _chunks(
+    items: Sequence[Union[BaseMessage, float]],
+) -> AsyncIterator[Tuple[BaseMessage, dict]]:
+    """Stream messages of the chat node, a number being a pause in seconds."""
+    for item in items:
+        if isinstance(item, float):
+            await asyncio.sleep(item)
+        else:
+            yield item, _CHAT
+
+
+async def _shape(shaper: StreamShaper, items: Sequence[Union[BaseMessage, float]]) -> List[StreamEvent]:
+    return [event async for event in shaper.shape(_chunks(items))]
+
+
+def _texts(events: List[StreamEvent]) -> List[str]:
+    return [event.content for event in events if event.type == "text"]
+
+
+async def test_chunks_within_the_window_are_sent_as_one_frame():
+    shaper = StreamShaper(max_chars=1000, window=0.5)
+    events = await _shape(shaper, [AIMessageChunk(content=token) for token in ("The ", "quick ", "fox")])
+
+    assert _texts(events) == ["The quick fox"]
+
+
+async def test_frame_is_sent_when_the_window_is_over_without_waiting_for_the_next_chunk():
+    shaper = StreamShaper(max_chars=1000, window=0.05)
+    received: List[Tuple[str, float]] = []
+    start = time.monotonic()
+    items = [AIMessageChunk(content="slow "), 0.5, AIMessageChunk(content="model")]
+    async for event in shaper.shape(_chunks(items)):
+        received.append((event.content, time.monotonic() - start))
+
+    assert [content for content, _ in received] == ["slow ", "model"]
+    # The first frame went out at the end of its window, well before the second chunk
+    assert received[0][1] < 0.4
+
+
+async def test_frame_is_sent_once_it_reaches_max_chars():
+    shaper = StreamShaper(max_chars=4, window=10.0)
+    events = await _shape(shaper, [AIMessageChunk(content=token) for token in ("ab", "cd", "e")])
+
+    assert _texts(events) == ["abcd", "e"]
+
+
+async def test_tool_events_flush_the_buffered_text_first():
+    shaper = StreamShaper(max_chars=1000, window=10.0)
+    items = [
+        AIMessageChunk(content="Let me search. "),
+        AIMessageChunk(
+            content="",
+            tool_call_chunks=[{"name": "search", "args": "", "id": "call_1", "index": 0}],
+        ),
+        AIMessageChunk(content="", tool_call_chunks=[{"name": None, "args": "{}", "id": None, "index": 0}]),
+        ToolMessage(content="full output", name="search", tool_call_id="call_1", status="success"),
+        AIMessageChunk(content="Found it."),
+    ]
+    events = await _shape(shaper, items)
+
+    assert [(event.type, event.content or event.tool_call_id) for event in events] == [
+        ("text", "Let me search. "),
+        ("tool_start", "call_1"),
+        ("tool_end", "call_1"),
+        ("text", "Found it."),
+    ]
+
+
+async def test_messages_of_other_nodes_are_not_streamed():
+    shaper = StreamShaper(max_chars=1000, window=10.0)
+
+    async def chunks() -> AsyncIterator[Tuple[BaseMessage, dict]]:
+        yield AIMessageChunk(content="summary"), {"langgraph_node": "summarize"}
+        yield AIMessageChunk(content="answer"), _CHAT
+
+    events = [event async for event in shaper.shape(chunks())]
+
+    assert _texts(events) == ["answer"]
@@ -3,56 +3,92 @@ from datetime import UTC, datetime, timedelta
 from typing import Optional
 
 from jose import JWTError, jwt
+from pydantic import ValidationError
 
 from core.config import settings
 from core.logging import logger
-from schemas.auth import Token
+from schemas.auth import Token, TokenClaims, TokenKind
 from utils.sanitization import sanitize_string
 
+_JWT_PATTERN = re.compile(r"^[A-Za-z0-9-_]+\.[A-Za-z0-9-_]+\.[A-Za-z0-9-_]+$")
+
 
 def create_access_token(
-    thread_id: str, expires_delta: Optional[timedelta] = None
+    kind: TokenKind,
+    user_id: int,
+    session_id: Optional[str] = None,
+    generation: int = 0,
+    expires_delta: Optional[timedelta] = None,
 ) -> Token:
+    """Create an access token carrying typed claims.
+
+    Args:
+        kind: Whether the token authenticates a user or a session.
+        user_id: The user the token is issued to.
+        session_id: The session of a session token.
+        generation: The current revocation generation of the user.
+        expires_delta: The lifetime of the token, JWT_ACCESS_TOKEN_EXPIRE_DAYS by default.
+
+    Returns:
+        Token: The token.
+    """
     if expires_delta:
         expire = datetime.now(UTC) + expires_delta
     else:
         expire = datetime.now(UTC) + timedelta(
             days=settings.JWT_ACCESS_TOKEN_EXPIRE_DAYS
         )
+    subject = session_id if kind == TokenKind.SESSION else str(user_id)
     to_encode = {
-        "sub": thread_id,
+        "sub": subject,
+        "kind": kind.value,
+        "uid": user_id,
+        "gen": generation,
         "exp": expire,
         "iat": datetime.now(UTC),
         # Add unique token identifier
-        "jti": sanitize_string(f"{thread_id}-{datetime.now(UTC).timestamp()}"),
+        "jti": sanitize_string(f"{subject}-{datetime.now(UTC).timestamp()}"),
     }
+    if session_id is not None:
+        to_encode["sid"] = session_id
     encoded_jwt = jwt.encode(
         to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM
     )
-    logger.info("token_created", thread_id=thread_id, expires_at=expire.isoformat())
+    logger.info("token_created", kind=kind.value, subject=subject, expires_at=expire.isoformat())
 
     return Token(access_token=encoded_jwt, expires_at=expire)
 
 
-def verify_token(token: str) -> Optional[str]:
+def verify_token(token: str) -> Optional[TokenClaims]:
+    """Verify the signature and expiry of a token and return its claims.
+
+    Args:
+        token: The encoded token.
+
+    Returns:
+        Optional[TokenClaims]: The claims, None if the token is invalid.
+
+    Raises:
+        ValueError: If the token is not shaped like a JWT.
+    """
     if not token or not isinstance(token, str):
         logger.warning("token_invalid_format")
         raise ValueError("Token must be a non-empty string")
-    if not re.match(r"^[A-Za-z0-9-_]+\.[A-Za-z0-9-_]+\.[A-Za-z0-9-_]+$", token):
+    if not _JWT_PATTERN.match(token):
         logger.warning("token_suspicious_format")
         raise ValueError("Token format is invalid - expected JWT format")
     try:
         payload = jwt.decode(
             token, settings.JWT_SECRET_KEY, algorithms=settings.JWT_ALGORITHM
         )
-        thread_id: str = payload.get("sub")
-        if thread_id is None:
-            logger.warning("token_missing_thread_id")
+        if payload.get("sub") is None:
+            logger.warning("token_missing_subject")
             return None
+        claims = TokenClaims.model_validate(payload)
 
-        logger.info("token_verified", thread_id=thread_id)
-        return thread_id
+        logger.debug("token_verified", subject=claims.subject, kind=claims.kind)
+        return claims
 
-    except JWTError as e:
+    except (JWTError, ValidationError) as e:
         logger.error("token_verification_failed", error=str(e))
         return None
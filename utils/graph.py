@@ -1,5 +1,11 @@
+from functools import lru_cache
+from typing import Optional
 
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    BaseMessage,
+    SystemMessage,
+)
 from langchain_core.messages import trim_messages as _trim_messages
 
 from core.config import settings
@@ -15,22 +21,49 @@ def dump_messages(messages: list[Message]) -> list[dict]:
     Returns:
         list[dict]: The dumped messages.
     """
-    return [message.model_dump() for message in messages]
+    # Same output as model_dump(), without going through the serializer
+    return [{"role": message.role, "content": message.content} for message in messages]
 
 
-def prepare_messages(messages: list[Message], llm: BaseChatModel, system_prompt: str) -> list[Message]:
+@lru_cache(maxsize=8)
+def get_system_message(system_prompt: str) -> SystemMessage:
+    """Get the system message of a prompt, built once and reused by every turn.
+
+    Args:
+        system_prompt (str): The system prompt.
+
+    Returns:
+        SystemMessage: The system message. It is shared, do not modify it.
+    """
+    return SystemMessage(content=system_prompt)
+
+
+def prepare_messages(
+    messages: list[BaseMessage],
+    llm: BaseChatModel,
+    system_prompt: str,
+    context_prompt: Optional[str] = None,
+) -> list[BaseMessage]:
     """Prepare the messages for the LLM.
 
+    The state messages are trimmed as they are, without a round-trip through
+    dictionaries, so the result can be passed to the LLM without conversion.
+
+    The system prompt comes first and the context prompt last, so the system
+    prompt and the conversation form a prefix that only grows from turn to
+    turn and can be served from the provider's prompt cache.
+
     Args:
-        messages (list[Message]): The messages to prepare.
+        messages (list[BaseMessage]): The messages of the graph state.
         llm (BaseChatModel): The LLM to use.
-        system_prompt (str): The system prompt to use.
+        system_prompt (str): The system prompt to use, identical for every request.
+        context_prompt (Optional[str]): Volatile context such as the date, if any.
 
     Returns:
-        list[Message]: The prepared messages.
+        list[BaseMessage]: The prepared messages.
     """
     trimmed_messages = _trim_messages(
-        dump_messages(messages),
+        messages,
         strategy="last",
         token_counter=llm,
         max_tokens=settings.MAX_TOKENS,
@@ -38,4 +71,7 @@ def prepare_messages(messages: list[Message], llm: BaseChatModel, system_prompt:
         include_system=False,
         allow_partial=False,
     )
-    return [Message(role="system", content=system_prompt)] + trimmed_messages
+    prepared_messages = [get_system_message(system_prompt), *trimmed_messages]
+    if context_prompt:
+        prepared_messages.append(get_system_message(context_prompt))
+    return prepared_messages
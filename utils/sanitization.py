@@ -1,9 +1,50 @@
-"""This file contains the sanitization utilities for the application."""
+"""This file contains the sanitization utilities for the application.
+
+Script blocks are located with `str.find` instead of lazy DOTALL regexes:
+`<script.*?>.*?</script>` retries from every opening tag and goes quadratic
+on payloads with many unclosed tags, while a scan for the opening tag, the
+first ">" after it and the first closing tag after that is linear and finds
+the same match.
+"""
 
 import html
 import re
 from typing import Any, Dict, List, Optional, Union
 
+# Characters changed by html.escape or removed by sanitize_string
+_UNSAFE_CHARS = ("<", ">", "&", '"', "'", "\0")
+_EMAIL_PATTERN = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+
+_ESCAPED_SCRIPT_OPEN = "&lt;script"
+_ESCAPED_TAG_END = "&gt;"
+_ESCAPED_SCRIPT_CLOSE = "&lt;/script&gt;"
+
+
+def _strip_escaped_scripts(value: str) -> str:
+    """Remove escaped script blocks, matching `&lt;script.*?&gt;.*?&lt;/script&gt;`.
+
+    If the first opening tag has no complete block after it, no later opening
+    tag can have one either, so the scan stops at the first incomplete block.
+    """
+    parts = []
+    position = 0
+    while True:
+        start = value.find(_ESCAPED_SCRIPT_OPEN, position)
+        if start < 0:
+            break
+        tag_end = value.find(_ESCAPED_TAG_END, start + len(_ESCAPED_SCRIPT_OPEN))
+        if tag_end < 0:
+            break
+        close = value.find(_ESCAPED_SCRIPT_CLOSE, tag_end + len(_ESCAPED_TAG_END))
+        if close < 0:
+            break
+        parts.append(value[position:start])
+        position = close + len(_ESCAPED_SCRIPT_CLOSE)
+    if not parts:
+        return value
+    parts.append(value[position:])
+    return "".join(parts)
+
 
 def sanitize_string(value: str) -> str:
     """Sanitize a string to prevent XSS and other injection attacks.
@@ -18,14 +59,27 @@ def sanitize_string(value: str) -> str:
     if not isinstance(value, str):
         value = str(value)
 
+    # Nothing to escape or remove, the common case for tokens and plain text
+    if (
+        "<" not in value
+        and "&" not in value
+        and "\0" not in value
+        and ">" not in value
+        and '"' not in value
+        and "'" not in value
+    ):
+        return value
+
     # HTML escape to prevent XSS
     value = html.escape(value)
 
     # Remove any script tags that might have been escaped
-    value = re.sub(r"&lt;script.*?&gt;.*?&lt;/script&gt;", "", value, flags=re.DOTALL)
+    if _ESCAPED_SCRIPT_OPEN in value:
+        value = _strip_escaped_scripts(value)
 
     # Remove null bytes
-    value = value.replace("\0", "")
+    if "\0" in value:
+        value = value.replace("\0", "")
 
     return value
 
@@ -43,12 +97,31 @@ def sanitize_email(email: str) -> str:
     email = sanitize_string(email)
 
     # Ensure email format (simple check)
-    if not re.match(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$", email):
+    if not _EMAIL_PATTERN.match(email):
         raise ValueError("Invalid email format")
 
     return email.lower()
 
 
+def _sanitize_value(value: Any) -> Any:
+    """Sanitize a value of a dictionary or list, recursing into containers."""
+    value_type = type(value)
+    if value_type is str:
+        return sanitize_string(value)
+    if value_type is dict:
+        return {key: _sanitize_value(item) for key, item in value.items()}
+    if value_type is list:
+        return [_sanitize_value(item) for item in value]
+    # Subclasses take the slower isinstance path
+    if isinstance(value, str):
+        return sanitize_string(value)
+    if isinstance(value, dict):
+        return sanitize_dict(value)
+    if isinstance(value, list):
+        return sanitize_list(value)
+    return value
+
+
 def sanitize_dict(data: Dict[str, Any]) -> Dict[str, Any]:
     """Recursively sanitize all string values in a dictionary.
 
@@ -58,17 +131,7 @@ def sanitize_dict(data: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: The sanitized dictionary
     """
-    sanitized = {}
-    for key, value in data.items():
-        if isinstance(value, str):
-            sanitized[key] = sanitize_string(value)
-        elif isinstance(value, dict):
-            sanitized[key] = sanitize_dict(value)
-        elif isinstance(value, list):
-            sanitized[key] = sanitize_list(value)
-        else:
-            sanitized[key] = value
-    return sanitized
+    return {key: _sanitize_value(value) for key, value in data.items()}
 
 
 def sanitize_list(data: List[Any]) -> List[Any]:
@@ -80,17 +143,7 @@ def sanitize_list(data: List[Any]) -> List[Any]:
     Returns:
         List[Any]: The sanitized list
     """
-    sanitized = []
-    for item in data:
-        if isinstance(item, str):
-            sanitized.append(sanitize_string(item))
-        elif isinstance(item, dict):
-            sanitized.append(sanitize_dict(item))
-        elif isinstance(item, list):
-            sanitized.append(sanitize_list(item))
-        else:
-            sanitized.append(item)
-    return sanitized
+    return [_sanitize_value(item) for item in data]
 
 
 def validate_password_strength(password: str) -> bool: